@@ -1,13 +1,23 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import arabic_reshaper
-from bidi.algorithm import get_display
 import re
 import os
 import threading
 import time
-from typing import Optional, Dict, List
-import codecs
+from functools import partial
+from parallel import run_jobs, default_workers
+from reshape_cache import DEFAULT_CACHE_SIZE, default_cache_path, library_versions
+from build_manifest import BuildManifest
+from run_report import RunReport, report_job, default_report_path
+from log_sink import LogSink, default_log_path
+from job_runner import JobRunner
+
+def __getattr__(name):
+    # The processing code is imported on first use so the window comes up without waiting for it
+    if name in ("ArabicNTReshaper", "process_file_job"):
+        import nt_reshaper
+        return getattr(nt_reshaper, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class ModernTheme:
     """Modern theme colors and styling"""
@@ -46,13 +56,18 @@ class Translations:
                 "processing": "Processing...",
                 "clear_log": "Clear Log",
                 "ready": "Ready",
+                "workers": "Workers",
+                "incremental": "Skip unchanged files",
+                "overlap": "Overlap disk and CPU",
+                "skipped": "Skipped {count} unchanged files",
                 "input_folder": "Input folder: {path}",
                 "output_folder": "Output folder: {path}",
                 "processing_file": "Processing {file}...",
                 "success": "✓ Processed {file}: {count} NT lines",
                 "error": "✗ Error processing {file}: {error}",
                 "no_files": "No files found to process",
-                "complete": "Processing complete:\n- Files processed: {files}\n- NT lines processed: {lines}\n- Time taken: {time:.1f}s"
+                "report": "Run report written to {path}",
+                "complete": "Processing complete:\n- Files processed: {files}\n- NT lines processed: {lines}\n- Time taken: {time:.1f}s\n- Reshape cache: {hits} hits, {misses} misses\n- BiDi: {fast} runs reordered directly, {slow} through the full algorithm"
             },
             "Arabic": {
                 "title": "معالج النصوص العربية",
@@ -62,13 +77,18 @@ class Translations:
                 "processing": "جاري المعالجة...",
                 "clear_log": "مسح السجل",
                 "ready": "جاهز",
+                "workers": "عدد العمليات",
+                "incremental": "تخطي الملفات غير المعدلة",
+                "overlap": "تداخل القراءة والمعالجة",
+                "skipped": "تم تخطي {count} ملف غير معدل",
                 "input_folder": "مجلد المدخلات: {path}",
                 "output_folder": "مجلد المخرجات: {path}",
                 "processing_file": "معالجة {file}...",
                 "success": "✓ تمت معالجة {file}: {count} سطر NT",
                 "error": "✗ خطأ في معالجة {file}: {error}",
                 "no_files": "لم يتم العثور على ملفات للمعالجة",
-                "complete": "اكتملت المعالجة:\n- الملفات المعالجة: {files}\n- أسطر NT المعالجة: {lines}\n- الوقت المستغرق: {time:.1f} ثانية"
+                "report": "تم حفظ تقرير التشغيل في {path}",
+                "complete": "اكتملت المعالجة:\n- الملفات المعالجة: {files}\n- أسطر NT المعالجة: {lines}\n- الوقت المستغرق: {time:.1f} ثانية\n- ذاكرة التشكيل: {hits} إصابة، {misses} إخفاق\n- الاتجاه: {fast} مقطع بالمسار السريع، {slow} بالخوارزمية الكاملة"
             }
         }
 
@@ -95,14 +115,13 @@ class ProcessingLog(tk.Text):
         self.tag_configure("warning", foreground=ModernTheme.WARNING)
         self.tag_configure("info", foreground=ModernTheme.INFO)
         
+        # Messages mostly come from the processing thread, so they are queued
+        # and drawn in batches, and only the latest lines are kept on screen
+        self.sink = LogSink(self, log_path=default_log_path("arabic_nt_reshaper"), read_only=True)
+        
     def append(self, message: str, level: str = "info"):
-        """Append a message to the log with timestamp"""
-        self.configure(state="normal")
-        timestamp = time.strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n"
-        self.insert("end", log_entry, level)
-        self.see("end")
-        self.configure(state="disabled")
+        """Append a message to the log with timestamp; safe to call from any thread"""
+        self.sink.post(message, level)
 
 class CustomButton(tk.Button):
     """Styled button widget"""
@@ -135,57 +154,18 @@ class CustomButton(tk.Button):
         if self["state"] != "disabled":
             self.config(bg=ModernTheme.ACCENT)
 
-class ArabicNTReshaper:
-    """Core text processing functionality"""
-    def __init__(self):
-        self.arabic_pattern = re.compile(
-            r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF\u200C\u200D]+'
-        )
-        
-    def process_line(self, line: str) -> str:
-        """Process a single line of text if it ends with #NT!"""
-        # Skip lines that don't end with #NT!
-        if not line.strip().endswith("#NT!"):
-            return line
-            
-        def reshape_match(match):
-            text = match.group(0)
-            return get_display(arabic_reshaper.reshape(text))
-            
-        return self.arabic_pattern.sub(reshape_match, line)
-        
-    def process_file(self, input_path: str, output_path: str) -> tuple[int, float]:
-        """Process a single file and return NT lines processed and time taken"""
-        start_time = time.time()
-        
-        # Read input file with UTF-8 encoding
-        with codecs.open(input_path, 'r', 'utf-8') as infile:
-            lines = infile.readlines()
-            
-        # Process lines and count NT lines
-        processed_lines = []
-        nt_count = 0
-        for line in lines:
-            if line.strip().endswith("#NT!"):
-                nt_count += 1
-            processed_lines.append(self.process_line(line))
-            
-        # Create output directory if needed
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Write output with UTF-8-BOM encoding
-        with codecs.open(output_path, 'w', 'utf-8-sig') as outfile:
-            outfile.writelines(processed_lines)
-            
-        return nt_count, time.time() - start_time
-
 class Application:
     """Main application class"""
     def __init__(self):
         self.root = tk.Tk()
         self.translations = Translations()
-        self.reshaper = ArabicNTReshaper()
+        self._reshaper = None
         self.current_language = tk.StringVar(value="English")
+        self.workers = tk.IntVar(value=default_workers())
+        self.cache_size = DEFAULT_CACHE_SIZE
+        self.cache_path = default_cache_path()
+        self.incremental = tk.BooleanVar(value=True)
+        self.overlap = tk.BooleanVar(value=False)
         
         # Initialize state
         self.processing = False
@@ -195,6 +175,26 @@ class Application:
         self.setup_window()
         self.create_widgets()
         self.setup_bindings()
+        self.runner = JobRunner(self.root, on_progress=self.on_progress, controls=[self.start_btn])
+        
+        # Load the processing libraries while the window is being drawn
+        self.root.after_idle(self.start_warm_up)
+        
+    @property
+    def reshaper(self):
+        """Reshaper for processing in this process, created on first use"""
+        if self._reshaper is None:
+            from nt_reshaper import ArabicNTReshaper
+            self._reshaper = ArabicNTReshaper()
+        return self._reshaper
+        
+    def start_warm_up(self):
+        """Import and prepare the processing code in a background thread"""
+        def warm_up():
+            import nt_reshaper
+            nt_reshaper.warm_up()
+            
+        threading.Thread(target=warm_up, daemon=True).start()
         
     def setup_window(self):
         """Configure the main window"""
@@ -279,6 +279,56 @@ class Application:
             )
             rb.pack(side=tk.LEFT)
         
+        # Worker count
+        self.workers_spin = tk.Spinbox(
+            buttons,
+            from_=1,
+            to=max(default_workers(), 64),
+            width=3,
+            textvariable=self.workers,
+            font=ModernTheme.BODY_FONT,
+            bg=ModernTheme.SECOND_BG,
+            fg=ModernTheme.FG,
+            buttonbackground=ModernTheme.SECOND_BG,
+            relief="flat"
+        )
+        self.workers_spin.pack(side=tk.RIGHT, padx=5)
+        
+        self.workers_label = tk.Label(
+            buttons,
+            text=self.translations.data[self.current_language.get()]["workers"],
+            font=ModernTheme.BODY_FONT,
+            bg=ModernTheme.BG,
+            fg=ModernTheme.FG
+        )
+        self.workers_label.pack(side=tk.RIGHT)
+        
+        # Incremental mode
+        self.incremental_check = tk.Checkbutton(
+            buttons,
+            text=self.translations.data[self.current_language.get()]["incremental"],
+            variable=self.incremental,
+            bg=ModernTheme.BG,
+            fg=ModernTheme.FG,
+            selectcolor=ModernTheme.SECOND_BG,
+            activebackground=ModernTheme.BG,
+            font=ModernTheme.BODY_FONT
+        )
+        self.incremental_check.pack(side=tk.RIGHT, padx=5)
+        
+        # Overlap reading, shaping and writing through the asyncio pipeline
+        self.overlap_check = tk.Checkbutton(
+            buttons,
+            text=self.translations.data[self.current_language.get()]["overlap"],
+            variable=self.overlap,
+            bg=ModernTheme.BG,
+            fg=ModernTheme.FG,
+            selectcolor=ModernTheme.SECOND_BG,
+            activebackground=ModernTheme.BG,
+            font=ModernTheme.BODY_FONT
+        )
+        self.overlap_check.pack(side=tk.RIGHT, padx=5)
+        
         # Log area with border
         log_frame = tk.Frame(
             main,
@@ -324,6 +374,9 @@ class Application:
         self.output_btn.configure(text=texts["select_output"])
         self.start_btn.configure(text=texts["start"])
         self.clear_btn.configure(text=texts["clear_log"])
+        self.workers_label.configure(text=texts["workers"])
+        self.incremental_check.configure(text=texts["incremental"])
+        self.overlap_check.configure(text=texts["overlap"])
         self.status.configure(text=texts["ready"])
         
     def select_input(self):
@@ -367,94 +420,148 @@ class Application:
             return
             
         self.processing = True
-        self.start_btn.configure(
-            text=self.translations.data[self.current_language.get()]["processing"],
-            state="disabled"
-        )
+        texts = self.translations.data[self.current_language.get()]
+        self.start_btn.configure(text=texts["processing"])
         
-        # Start processing in separate thread
-        thread = threading.Thread(target=self.process_files)
-        thread.daemon = True
-        thread.start()
-        
-    def process_files(self):
-        """Process all files in the input directory"""
         try:
-            # Get all files recursively
-            files_to_process = []
-            for root, dirs, files in os.walk(self.input_dir):
-                for file in files:
-                    if file.endswith(('.yml', '.yaml')):
-                        input_path = os.path.join(root, file)
-                        rel_path = os.path.relpath(input_path, self.input_dir)
-                        output_path = os.path.join(self.output_dir, rel_path)
-                        files_to_process.append((input_path, output_path, rel_path))
-                        
-            if not files_to_process:
-                self.log.append(
-                    self.translations.data[self.current_language.get()]["no_files"],
-                    "warning"
-                )
-                return
+            workers = max(1, self.workers.get())
+        except tk.TclError:
+            workers = 1
+        
+        # Start processing in a background thread
+        self.runner.start(self.process_files, texts, workers, self.incremental.get(), self.overlap.get(),
+                          on_done=self.on_processing_done, on_error=self.on_processing_error)
+        
+    def process_files(self, texts: dict, workers: int = 1, incremental: bool = False, overlap: bool = False):
+        """Process all files in the input directory using the given number of worker processes.
+        
+        In incremental mode files whose input and settings are unchanged since the
+        last run are skipped, and only changed entries of the remaining files are
+        reshaped again. With overlap the files go through the asyncio pipeline,
+        which reads and writes while the workers shape, instead of one worker
+        process per file.
+        
+        Runs on the job runner's thread, so it gets the texts of the current
+        language from the Tk thread and only reaches the widgets through the log
+        and the runner's progress.
+        """
+        from key_store import default_key_store_path
+        from nt_reshaper import process_file_job
+        # Get all files recursively
+        files_to_process = []
+        for root, dirs, files in os.walk(self.input_dir):
+            for file in files:
+                if file.endswith(('.yml', '.yaml')):
+                    input_path = os.path.join(root, file)
+                    rel_path = os.path.relpath(input_path, self.input_dir)
+                    output_path = os.path.join(self.output_dir, rel_path)
+                    files_to_process.append((input_path, output_path))
+                    
+        if not files_to_process:
+            self.log.append(texts["no_files"], "warning")
+            return
+        
+        # Process each file
+        total_files = len(files_to_process)
+        total_nt_lines = 0
+        counters = {}
+        start_time = time.time()
+        
+        manifest = None
+        if incremental:
+            manifest = BuildManifest(self.output_dir, "arabic_nt_reshaper", library_versions())
+            files_to_process = [
+                (input_path, output_path) for input_path, output_path in files_to_process
+                if not manifest.is_up_to_date(input_path, output_path)
+            ]
+            skipped = total_files - len(files_to_process)
+            if skipped:
+                self.log.append(texts["skipped"].format(count=skipped), "info")
+        
+        # Process files, logging each one as it finishes
+        key_store_path = default_key_store_path(self.output_dir, "arabic_nt_reshaper") if incremental else None
+        job = partial(process_file_job, cache_size=self.cache_size, cache_path=self.cache_path,
+                      key_store_path=key_store_path)
+        run_report = RunReport("arabic_nt_reshaper", {"workers": workers, "incremental": incremental, "overlap": overlap})
+        if overlap:
+            from async_pipeline import run_async
+            results = run_async("nt_reshape", files_to_process, workers,
+                                cache_size=self.cache_size, cache_path=self.cache_path)
+        else:
+            results = run_jobs(partial(report_job, job), files_to_process, workers)
+        for done, ((input_path, output_path), result, error) in enumerate(results, 1):
+            rel_path = os.path.relpath(input_path, self.input_dir)
             
-            # Process each file
-            total_files = len(files_to_process)
-            total_nt_lines = 0
-            start_time = time.time()
-            texts = self.translations.data[self.current_language.get()]
+            # Update status
+            self.runner.progress(done, len(files_to_process), texts["processing_file"].format(file=rel_path))
             
-            for input_path, output_path, rel_path in files_to_process:
-                try:
-                    # Update status
-                    self.status.configure(
-                        text=texts["processing_file"].format(file=rel_path)
-                    )
-                    
-                    # Process file
-                    nt_count, process_time = self.reshaper.process_file(input_path, output_path)
-                    total_nt_lines += nt_count
-                    
-                    # Log success
-                    self.log.append(
-                        texts["success"].format(
-                            file=rel_path,
-                            count=nt_count
-                        ),
-                        "success"
-                    )
-                    
-                except Exception as e:
-                    self.log.append(
-                        texts["error"].format(
-                            file=rel_path,
-                            error=str(e)
-                        ),
-                        "error"
-                    )
+            if error is not None:
+                self.log.append(
+                    texts["error"].format(
+                        file=rel_path,
+                        error=str(error)
+                    ),
+                    "error"
+                )
+                run_report.add_error(rel_path, error)
+                if manifest is not None:
+                    manifest.forget(input_path)
+                continue
+                
+            (line_count, process_time, file_counters), file_report = result
+            nt_count = file_counters.get("nt_lines", 0)
+            run_report.add(file_report, rel_path)
+            total_nt_lines += nt_count
+            for name, value in file_counters.items():
+                counters[name] = counters.get(name, 0) + value
+            if manifest is not None:
+                manifest.record(input_path, output_path)
             
-            # Log completion status
-            total_time = time.time() - start_time
+            # Log success
             self.log.append(
-                texts["complete"].format(
-                    files=total_files,
-                    lines=total_nt_lines,
-                    time=total_time
+                texts["success"].format(
+                    file=rel_path,
+                    count=nt_count
                 ),
-                "info"
-            )
-            
-        except Exception as e:
-            self.log.append(f"Error: {str(e)}", "error")
-            
-        finally:
-            self.processing = False
-            self.start_btn.configure(
-                text=self.translations.data[self.current_language.get()]["start"],
-                state="normal"
-            )
-            self.status.configure(
-                text=self.translations.data[self.current_language.get()]["ready"]
+                "success"
             )
+        
+        if manifest is not None:
+            manifest.save()
+        report_path = default_report_path(self.output_dir, "arabic_nt_reshaper")
+        run_report.write(report_path)
+        
+        # Log completion status
+        total_time = time.time() - start_time
+        self.log.append(
+            texts["complete"].format(
+                files=total_files,
+                lines=total_nt_lines,
+                time=total_time,
+                hits=counters.get("cache_hits", 0),
+                misses=counters.get("cache_misses", 0),
+                fast=counters.get("bidi_fast", 0),
+                slow=counters.get("bidi_slow", 0)
+            ),
+            "info"
+        )
+        self.log.append(texts["report"].format(path=report_path), "info")
+        
+    def on_progress(self, done: int, total: int, current: str):
+        """Show the file being processed; runs on the Tk thread"""
+        self.status.configure(text=current)
+        
+    def on_processing_done(self, result=None):
+        """Reset the controls once process_files has returned; runs on the Tk thread"""
+        self.processing = False
+        self.log.sink.close_file()
+        texts = self.translations.data[self.current_language.get()]
+        self.start_btn.configure(text=texts["start"])
+        self.status.configure(text=texts["ready"])
+        
+    def on_processing_error(self, error):
+        self.log.append(f"Error: {str(error)}", "error")
+        self.on_processing_done()
             
     def on_closing(self):
         """Handle application closing"""
@@ -463,8 +570,10 @@ class Application:
                 "Quit",
                 "Processing is still running. Do you want to quit?"
             ):
+                self.log.sink.close()
                 self.root.destroy()
         else:
+            self.log.sink.close()
             self.root.destroy()
             
     def run(self):
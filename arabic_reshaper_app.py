@@ -1,14 +1,24 @@
 import tkinter as tk
 from tkinter import ttk, filedialog
-import arabic_reshaper
-from bidi.algorithm import get_display
 import re
 import os
 import threading
-import time
-from typing import Optional, Dict, List
-import json
-import codecs
+from typing import Optional, Dict
+from functools import partial
+from parallel import run_jobs, default_workers
+from reshape_cache import DEFAULT_CACHE_SIZE, default_cache_path, library_versions
+from build_manifest import BuildManifest, Checkpoint
+from run_report import RunReport, report_job, default_report_path
+from log_sink import LogSink, default_log_path
+from run_control import Cancelled, RunControl
+from job_runner import JobRunner
+
+def __getattr__(name):
+    # The processing code is imported on first use so the window comes up without waiting for it
+    if name in ("ArabicReshaper", "process_file_job"):
+        import reshaper
+        return getattr(reshaper, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class ModernTheme:
     """Modern theme colors and styling"""
@@ -52,6 +62,11 @@ class AppTranslations:
                 "select_output": "Select Output Folder",
                 "start": "Start",
                 "processing": "Processing...",
+                "pause": "Pause",
+                "resume": "Resume",
+                "paused": "Paused",
+                "cancel": "Cancel",
+                "cancelling": "Cancelling...",
                 "completed": "Completed",
                 "error": "Error",
                 "success": "Success",
@@ -64,6 +79,10 @@ class AppTranslations:
                 "input_folder": "Input folder: {path}",
                 "output_folder": "Output folder: {path}",
                 "lines": "lines",
+                "workers": "Workers",
+                "incremental": "Skip unchanged files",
+                "overlap": "Overlap disk and CPU",
+                "watch": "Watch for changes",
                 "processing_stats": """Processing complete:
 - Total files: {files}
 - Total lines: {lines}
@@ -77,6 +96,11 @@ class AppTranslations:
                 "select_output": "اختيار مجلد المخرجات",
                 "start": "ابدأ",
                 "processing": "جاري المعالجة...",
+                "pause": "إيقاف مؤقت",
+                "resume": "استئناف",
+                "paused": "متوقف مؤقتاً",
+                "cancel": "إلغاء",
+                "cancelling": "جاري الإلغاء...",
                 "completed": "اكتمل",
                 "error": "خطأ",
                 "success": "تم بنجاح",
@@ -89,6 +113,10 @@ class AppTranslations:
                 "input_folder": "مجلد المدخلات: {path}",
                 "output_folder": "مجلد المخرجات: {path}",
                 "lines": "سطر",
+                "workers": "عدد العمليات",
+                "incremental": "تخطي الملفات غير المعدلة",
+                "overlap": "تداخل القراءة والمعالجة",
+                "watch": "مراقبة التغييرات",
                 "processing_stats": """اكتملت المعالجة:
 - عدد الملفات: {files}
 - عدد الأسطر: {lines}
@@ -150,76 +178,83 @@ class ProcessingLog(tk.Text):
         self.tag_configure("warning", foreground=ModernTheme.WARNING)
         self.tag_configure("info", foreground=ModernTheme.INFO)
         
+        # Messages mostly come from the processing thread, so they are queued
+        # and drawn in batches, and only the latest lines are kept on screen
+        self.sink = LogSink(self, self.format_entry, log_path=default_log_path("arabic_reshaper"), read_only=True)
+        
     def append(self, message: str, level: str = "info", rtl: bool = False):
-        """Append a message to the log with specified level and direction"""
-        self.configure(state="normal")
+        """Append a message to the log with specified level and direction; safe to call from any thread"""
+        self.sink.post(message, level, rtl=rtl)
         
-        # Get timestamp in local time
-        timestamp = time.strftime("%H:%M:%S")
+    def format_entry(self, entry):
+        """Format a queued message with its timestamp based on direction"""
+        timestamp = entry.timestamp
+        message = entry.text
+        rtl = entry.options.get("rtl", False)
         
-        # Format the message with timestamp based on direction
         if rtl:
             # Use Arabic numerals for timestamp in RTL mode
             timestamp = timestamp.replace('0', '٠').replace('1', '١').replace('2', '٢').replace('3', '٣') \
                                 .replace('4', '٤').replace('5', '٥').replace('6', '٦').replace('7', '٧') \
                                 .replace('8', '٨').replace('9', '٩')
             # Reshape Arabic text and format with timestamp
+            import arabic_reshaper
+            from bidi.algorithm import get_display
             message = get_display(arabic_reshaper.reshape(message))
             log_entry = f"[{timestamp}] {message}\n"
         else:
             log_entry = f"[{timestamp}] {message}\n"
             
-        # Insert message and apply tag
-        self.insert("end", log_entry, (level, "rtl" if rtl else "ltr"))
-        self.see("end")
-        self.configure(state="disabled")
-
-class ArabicReshaper:
-    """Core text processing functionality"""
-    def __init__(self):
-        self.arabic_pattern = re.compile(
-            r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF\u200C\u200D]+'
-        )
-        
-    def process_line(self, line: str) -> str:
-        """Process a single line of text"""
-        def reshape_match(match):
-            text = match.group(0)
-            return get_display(arabic_reshaper.reshape(text))
-            
-        return self.arabic_pattern.sub(reshape_match, line)
-        
-    def process_file(self, input_path: str, output_path: str) -> tuple[int, int]:
-        """Process a single file and return lines processed and time taken"""
-        start_time = time.time()
-        
-        with codecs.open(input_path, 'r', 'utf-8') as infile:
-            lines = infile.readlines()
-            
-        processed_lines = [self.process_line(line) for line in lines]
-        
-        with codecs.open(output_path, 'w', 'utf-8-sig') as outfile:
-            outfile.writelines(processed_lines)
-            
-        return len(lines), time.time() - start_time
+        return [(log_entry, (entry.level, "rtl" if rtl else "ltr"))]
 
 class Application:
     """Main application class"""
     def __init__(self):
         self.root = tk.Tk()
         self.translations = AppTranslations()
-        self.reshaper = ArabicReshaper()
+        self._reshaper = None
         self.current_language = tk.StringVar(value="English")
+        self.workers = tk.IntVar(value=default_workers())
+        self.cache_size = DEFAULT_CACHE_SIZE
+        self.cache_path = default_cache_path()
+        self.incremental = tk.BooleanVar(value=True)
+        self.overlap = tk.BooleanVar(value=False)
+        self.watch = tk.BooleanVar(value=False)
+        self.watcher = None
+        self.control = None
+        # Held by a run and by each batch of the watcher, so the two never process files at the same time
+        self.run_lock = threading.Lock()
         
         self.setup_window()
         self.create_widgets()
         self.setup_bindings()
+        # Runs process_files on a background thread; the widgets are only touched on the Tk thread
+        self.runner = JobRunner(self.root, controls=[self.process_btn])
+        
+        # Load the processing libraries while the window is being drawn
+        self.root.after_idle(self.start_warm_up)
         
         # Processing state
         self.processing = False
         self.input_dir = ""
         self.output_dir = ""
         
+    @property
+    def reshaper(self):
+        """Reshaper for processing in this process, created on first use"""
+        if self._reshaper is None:
+            from reshaper import ArabicReshaper
+            self._reshaper = ArabicReshaper()
+        return self._reshaper
+        
+    def start_warm_up(self):
+        """Import and prepare the processing code in a background thread"""
+        def warm_up():
+            import reshaper
+            reshaper.warm_up()
+            
+        threading.Thread(target=warm_up, daemon=True).start()
+        
     def setup_window(self):
         """Configure the main window"""
         self.root.title(self.translations.data[self.current_language.get()]["title"])
@@ -335,6 +370,23 @@ class Application:
         )
         self.process_btn.pack(side=tk.LEFT, padx=5)
         
+        # Pause/resume and cancel, active while processing
+        self.pause_btn = CustomButton(
+            toolbar,
+            text=self.translations.data[self.current_language.get()]["pause"],
+            command=self.toggle_pause,
+            state="disabled"
+        )
+        self.pause_btn.pack(side=tk.LEFT, padx=5)
+        
+        self.cancel_btn = CustomButton(
+            toolbar,
+            text=self.translations.data[self.current_language.get()]["cancel"],
+            command=self.cancel_processing,
+            state="disabled"
+        )
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+        
         # Clear log button
         self.clear_btn = CustomButton(
             toolbar,
@@ -343,6 +395,69 @@ class Application:
         )
         self.clear_btn.pack(side=tk.RIGHT)
         
+        # Worker count
+        self.workers_spin = tk.Spinbox(
+            toolbar,
+            from_=1,
+            to=max(default_workers(), 64),
+            width=3,
+            textvariable=self.workers,
+            font=ModernTheme.BODY_FONT,
+            bg=ModernTheme.SECOND_BG,
+            fg=ModernTheme.FG,
+            buttonbackground=ModernTheme.SECOND_BG,
+            relief="flat"
+        )
+        self.workers_spin.pack(side=tk.RIGHT, padx=5)
+        
+        self.workers_label = tk.Label(
+            toolbar,
+            text=self.translations.data[self.current_language.get()]["workers"],
+            font=ModernTheme.BODY_FONT,
+            bg=ModernTheme.BG,
+            fg=ModernTheme.FG
+        )
+        self.workers_label.pack(side=tk.RIGHT)
+        
+        # Incremental mode
+        self.incremental_check = tk.Checkbutton(
+            toolbar,
+            text=self.translations.data[self.current_language.get()]["incremental"],
+            variable=self.incremental,
+            bg=ModernTheme.BG,
+            fg=ModernTheme.FG,
+            selectcolor=ModernTheme.SECOND_BG,
+            activebackground=ModernTheme.BG,
+            font=ModernTheme.BODY_FONT
+        )
+        self.incremental_check.pack(side=tk.RIGHT, padx=5)
+        
+        # Overlap reading, shaping and writing through the asyncio pipeline
+        self.overlap_check = tk.Checkbutton(
+            toolbar,
+            text=self.translations.data[self.current_language.get()]["overlap"],
+            variable=self.overlap,
+            bg=ModernTheme.BG,
+            fg=ModernTheme.FG,
+            selectcolor=ModernTheme.SECOND_BG,
+            activebackground=ModernTheme.BG,
+            font=ModernTheme.BODY_FONT
+        )
+        self.overlap_check.pack(side=tk.RIGHT, padx=5)
+        
+        # Watch mode
+        self.watch_check = tk.Checkbutton(
+            toolbar,
+            text=self.translations.data[self.current_language.get()]["watch"],
+            variable=self.watch,
+            bg=ModernTheme.BG,
+            fg=ModernTheme.FG,
+            selectcolor=ModernTheme.SECOND_BG,
+            activebackground=ModernTheme.BG,
+            font=ModernTheme.BODY_FONT
+        )
+        self.watch_check.pack(side=tk.RIGHT, padx=5)
+        
     def create_log_area(self):
         """Create log display area"""
         # Frame for log with border
@@ -381,6 +496,7 @@ class Application:
         """Setup event bindings"""
         self.current_language.trace("w", self.on_language_change)
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.watch.trace("w", self.on_watch_toggle)
         
     def on_language_change(self, *args):
         """Handle language change"""
@@ -400,7 +516,17 @@ class Application:
         self.process_btn.configure(
             text=translations["processing"] if self.processing else translations["start"]
         )
+        paused = self.control is not None and self.control.paused
+        self.pause_btn.configure(text=translations["resume"] if paused else translations["pause"])
+        self.cancel_btn.configure(
+            text=translations["cancelling"] if self.control is not None and self.control.cancelled
+            else translations["cancel"]
+        )
         self.clear_btn.configure(text=translations["clear"])
+        self.workers_label.configure(text=translations["workers"])
+        self.incremental_check.configure(text=translations["incremental"])
+        self.overlap_check.configure(text=translations["overlap"])
+        self.watch_check.configure(text=translations["watch"])
         
         # Update text direction for log
         text_direction = "rtl" if lang == "Arabic" else "ltr"
@@ -445,19 +571,71 @@ class Application:
             self.log.append("Please select input and output folders first", "error")
             return
             
+        self.stop_watching()
         self.processing = True
-        self.process_btn.configure(
-            text=self.translations.data[self.current_language.get()]["processing"],
-            state="disabled"
-        )
+        self.control = RunControl()
+        translations = self.translations.data[self.current_language.get()]
+        self.process_btn.configure(text=translations["processing"])
+        self.pause_btn.configure(text=translations["pause"], state="normal")
+        self.cancel_btn.configure(text=translations["cancel"], state="normal")
         
-        # Start processing in separate thread
-        thread = threading.Thread(target=self.process_files)
-        thread.daemon = True
-        thread.start()
+        try:
+            workers = max(1, self.workers.get())
+        except tk.TclError:
+            workers = 1
+            
+        # Start processing in a background thread
+        self.runner.start(self.process_files, workers, self.incremental.get(), self.overlap.get(), self.control,
+                          on_done=self.on_processing_done, on_error=self.on_processing_error)
         
-    def process_files(self):
-        """Process all files in the input directory"""
+    def toggle_pause(self):
+        """Pause processing after the files (or, with overlap, the chunks) in progress, or resume it"""
+        if self.control is None:
+            return
+        translations = self.translations.data[self.current_language.get()]
+        if self.control.paused:
+            self.control.resume()
+            self.pause_btn.configure(text=translations["pause"])
+            self.status_label.configure(text=translations["processing"])
+            self.log.append("Resumed", "info")
+        else:
+            self.control.pause()
+            self.pause_btn.configure(text=translations["resume"])
+            self.status_label.configure(text=translations["paused"])
+            self.log.append("Paused after the files in progress", "warning")
+            
+    def cancel_processing(self):
+        """Stop processing after the files in progress; the next run continues from there"""
+        if self.control is None or self.control.cancelled:
+            return
+        self.control.cancel()
+        translations = self.translations.data[self.current_language.get()]
+        self.pause_btn.configure(text=translations["pause"], state="disabled")
+        self.cancel_btn.configure(text=translations["cancelling"], state="disabled")
+        self.log.append("Cancelling after the files in progress...", "warning")
+        
+    def process_files(self, workers: int = 1, incremental: bool = False, overlap: bool = False,
+                      control: Optional[RunControl] = None):
+        """Process all files in the input directory using the given number of worker processes.
+        
+        In incremental mode files whose input and settings are unchanged since the
+        last run are skipped, and only changed entries of the remaining files are
+        reshaped again. With overlap the files go through the asyncio pipeline,
+        which reads and writes while the workers shape, instead of one worker
+        process per file.
+        
+        control pauses or cancels the run between files, and between chunks with
+        overlap. Completed outputs are kept in a checkpoint until the run ends, so
+        a cancelled, crashed or closed run resumes where it stopped.
+        
+        Returns the reshaper settings and the incremental flag of a run that went
+        through every file, for the watcher, and None otherwise.
+        """
+        from key_store import default_key_store_path
+        from reshaper import process_file_job
+        control = control or RunControl()
+        # A batch of the watcher that was still running when the run started finishes first
+        self.run_lock.acquire()
         try:
             # Get all files recursively
             files_to_process = []
@@ -476,29 +654,87 @@ class Application:
                 
             self.log.append(f"Found {total_files} files to process", "info")
             
-            # Process each file
+            manifest = None
+            if incremental:
+                manifest = BuildManifest(self.output_dir, "arabic_reshaper", library_versions())
+                files_to_process = [
+                    (input_path, output_path) for input_path, output_path in files_to_process
+                    if not manifest.is_up_to_date(input_path, output_path)
+                ]
+                skipped = total_files - len(files_to_process)
+                if skipped:
+                    self.log.append(f"Skipped {skipped} unchanged files", "info")
+            
+            # Continue an earlier run that was stopped before it completed
+            checkpoint = Checkpoint(self.output_dir, "arabic_reshaper", library_versions())
+            resumed = [paths for paths in files_to_process if checkpoint.is_up_to_date(*paths)]
+            if resumed:
+                completed = set(resumed)
+                files_to_process = [paths for paths in files_to_process if paths not in completed]
+                if manifest is not None:
+                    for input_path, output_path in resumed:
+                        manifest.record(input_path, output_path)
+                self.log.append(f"Resuming: {len(resumed)} files were completed by the stopped run", "info")
+            
+            # Create output directories up front so workers only read and write files
+            for input_path, output_path in files_to_process:
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            
+            # Process files, logging each one as it finishes
             total_lines = 0
             total_time = 0
+            counters = {}
             
-            for input_path, output_path in files_to_process:
-                try:
-                    # Create output directory if needed
-                    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                    
-                    # Process file and get statistics
-                    lines, process_time = self.reshaper.process_file(input_path, output_path)
-                    total_lines += lines
-                    total_time += process_time
-                    
-                    # Log progress
-                    rel_path = os.path.relpath(input_path, self.input_dir)
-                    self.log.append(
-                        f"Processed {rel_path}: {lines} lines in {process_time:.2f}s",
-                        "success"
-                    )
+            key_store_path = default_key_store_path(self.output_dir, "arabic_reshaper") if incremental else None
+            settings = {"cache_size": self.cache_size, "cache_path": self.cache_path, "key_store_path": key_store_path}
+            job = partial(process_file_job, **settings)
+            run_report = RunReport("arabic_reshaper", {"workers": workers, "incremental": incremental, "overlap": overlap})
+            if overlap:
+                from async_pipeline import run_async
+                results = run_async("reshape", files_to_process, workers, control=control,
+                                    cache_size=self.cache_size, cache_path=self.cache_path)
+            else:
+                results = run_jobs(partial(report_job, job), files_to_process, workers, control)
+            for (input_path, output_path), result, error in results:
+                rel_path = os.path.relpath(input_path, self.input_dir)
+                if isinstance(error, Cancelled):
+                    continue
+                if error is not None:
+                    self.log.append(f"Error processing {rel_path}: {str(error)}", "error")
+                    run_report.add_error(rel_path, error)
+                    if manifest is not None:
+                        manifest.forget(input_path)
+                    continue
                     
-                except Exception as e:
-                    self.log.append(f"Error processing {rel_path}: {str(e)}", "error")
+                (lines, process_time, file_counters), file_report = result
+                run_report.add(file_report, rel_path)
+                total_lines += lines
+                total_time += process_time
+                for name, value in file_counters.items():
+                    counters[name] = counters.get(name, 0) + value
+                checkpoint.record(input_path, output_path)
+                if manifest is not None:
+                    manifest.record(input_path, output_path)
+                
+                # Log progress
+                self.log.append(
+                    f"Processed {rel_path}: {lines} lines in {process_time:.2f}s",
+                    "success"
+                )
+                
+            if manifest is not None:
+                manifest.save()
+            report_path = default_report_path(self.output_dir, "arabic_reshaper")
+            run_report.write(report_path)
+            
+            if control.cancelled:
+                checkpoint.save()
+                self.log.append(
+                    f"Cancelled after {len(run_report.files)} files; start again to continue where it stopped",
+                    "warning"
+                )
+                return
+            checkpoint.discard()
                     
             # Log final statistics
             self.log.append(f"""
@@ -507,26 +743,122 @@ Processing complete:
 - Total lines: {total_lines}
 - Total time: {total_time:.2f}s
 - Average time per file: {total_time/total_files:.2f}s
+- Reshape cache: {counters.get("cache_hits", 0)} hits, {counters.get("cache_misses", 0)} misses
+- BiDi: {counters.get("bidi_fast", 0)} runs reordered directly, {counters.get("bidi_slow", 0)} through the full algorithm
+- Run report: {report_path}
 """, "info")
+            
+            return settings, incremental
                     
         except Exception as e:
             self.log.append(f"Processing error: {str(e)}", "error")
             
         finally:
-            self.processing = False
-            self.process_btn.configure(
-                text=self.translations.data[self.current_language.get()]["process"],
-                state="normal"
-            )
+            self.run_lock.release()
+            
+    def on_processing_done(self, result=None):
+        """Reset the controls once process_files has returned, and start watching after a completed run.
+        
+        Runs on the Tk thread, like everything that reads the options or touches the widgets.
+        """
+        self.processing = False
+        translations = self.translations.data[self.current_language.get()]
+        self.process_btn.configure(text=translations["start"])
+        self.pause_btn.configure(text=translations["pause"], state="disabled")
+        self.cancel_btn.configure(text=translations["cancel"], state="disabled")
+        self.status_label.configure(text=translations["start"])
+        if result is not None and self.watch.get():
+            self.start_watching(*result)
+        
+    def on_processing_error(self, error):
+        self.log.append(f"Processing error: {str(error)}", "error")
+        self.on_processing_done()
+        
+    def start_watching(self, settings: Dict, incremental: bool = False):
+        """Reshape files of the input folder as they are saved, until watching is switched off.
+        
+        The watcher gets its own ArabicReshaper with the settings of the run, and
+        its own build manifest in incremental mode, both created on the thread its
+        batches run on. Batches hold run_lock, so a run started while a batch is
+        still going waits for it.
+        """
+        from reshaper import ArabicReshaper
+        from watcher import FolderWatcher
+        self.stop_watching()
+        input_dir = os.path.abspath(self.input_dir)
+        output_dir = os.path.abspath(self.output_dir)
+        state = {}
+        
+        def accept(root, name):
+            # An output folder inside the input folder must not trigger itself
+            root = os.path.abspath(root)
+            return (name.endswith(('.txt', '.yml', '.yaml')) and root != output_dir
+                    and not root.startswith(output_dir + os.sep))
+            
+        def process_changes(paths):
+            with self.run_lock:
+                if not state:
+                    state["reshaper"] = ArabicReshaper(**settings)
+                    state["manifest"] = (BuildManifest(output_dir, "arabic_reshaper", library_versions())
+                                         if incremental else None)
+                reshaper, manifest = state["reshaper"], state["manifest"]
+                for input_path in paths:
+                    if not os.path.isfile(input_path):
+                        continue
+                    rel_path = os.path.relpath(input_path, input_dir)
+                    output_path = os.path.join(output_dir, rel_path)
+                    try:
+                        lines, process_time = reshaper.process_file(input_path, output_path)
+                    except Exception as e:
+                        self.log.append(f"Error processing {rel_path}: {str(e)}", "error")
+                        if manifest is not None:
+                            manifest.forget(input_path)
+                        continue
+                    if manifest is not None:
+                        manifest.record(input_path, output_path)
+                    self.log.append(f"Updated {rel_path}: {lines} lines in {process_time:.2f}s", "success")
+                if manifest is not None:
+                    manifest.save()
+                
+        self.watcher = FolderWatcher(input_dir, process_changes, accept)
+        self.watcher.start()
+        self.log.append(f"Watching {input_dir} for changes ({self.watcher.backend})", "info")
+        
+    def stop_watching(self):
+        """Stop reprocessing saved files"""
+        if self.watcher is not None:
+            # A batch in progress is not waited for here, which would block the window;
+            # the next run waits for it on its own thread through run_lock
+            self.watcher.stop(wait=False)
+            self.watcher = None
+            self.log.append("Stopped watching for changes", "info")
+            
+    def on_watch_toggle(self, *args):
+        """Stop watching when the option is switched off; switching it on takes effect after the next run"""
+        if not self.watch.get():
+            self.stop_watching()
             
     def on_closing(self):
         """Handle window closing"""
         if self.processing:
             if tk.messagebox.askokcancel("Quit", "Processing is still running. Do you want to quit?"):
-                self.root.destroy()
+                # Let the files in progress finish so no output is left half written
+                self.cancel_processing()
+                self.stop_watching()
+                self.close_when_stopped()
         else:
+            self.stop_watching()
+            self.log.sink.close()
             self.root.destroy()
             
+    def close_when_stopped(self):
+        """Close the window once the cancelled run has stopped"""
+        if self.processing:
+            self.root.after(100, self.close_when_stopped)
+            return
+        self.log.sink.close()
+        self.root.destroy()
+            
     def run(self):
         """Start the application"""
         self.root.mainloop()
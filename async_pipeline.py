@@ -0,0 +1,256 @@
+import os
+import time
+import queue
+import codecs
+import asyncio
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from streaming import DEFAULT_CHUNK_LINES, read_chunks
+from run_report import FileReport
+from run_control import Cancelled
+
+# Tools that can run through the asyncio pipeline, by the module holding their reshaper
+TOOLS = ("reshape", "nt_reshape")
+
+_worker_reshaper = None
+_worker_key = None
+_worker_pid = None
+
+def process_chunk_job(tool: str, settings: Dict, lines: List[str]) -> Tuple[List[str], Dict, Dict]:
+    """Reshape one chunk of a file inside the CPU executor, reusing one reshaper per process.
+
+    Returns the processed lines and the stage times and counters spent on this chunk.
+    """
+    global _worker_reshaper, _worker_key, _worker_pid
+    key = (tool, sorted(settings.items()))
+    if _worker_reshaper is None or _worker_pid != os.getpid() or _worker_key != key:
+        if tool == "reshape":
+            from reshaper import ArabicReshaper as reshaper_class
+        else:
+            from nt_reshaper import ArabicNTReshaper as reshaper_class
+        _worker_reshaper = reshaper_class(**settings)
+        _worker_key = key
+        _worker_pid = os.getpid()
+    reshaper = _worker_reshaper
+
+    timings, counters = dict(reshaper.timings), reshaper.counters()
+    processed_lines = reshaper.process_chunk(lines)
+    reshaper.cache.flush()
+    return (
+        processed_lines,
+        {stage: seconds - timings[stage] for stage, seconds in reshaper.timings.items()},
+        {name: value - counters.get(name, 0) for name, value in reshaper.counters().items()},
+    )
+
+
+class _FileState:
+    """Progress of one file through the stages"""
+    def __init__(self, input_path: str, output_path: str):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.temp_path = output_path + ".part"
+        self.report = FileReport(input_path)
+        self.error: Optional[Exception] = None
+        self.outfile = None
+        self.lines = 0
+        self.counters: Dict[str, int] = {}
+
+
+class AsyncPipeline:
+    """Reshaping with disk reads, CPU work and writes overlapped by asyncio.
+
+    A reader stage reads files a chunk of lines at a time on its own thread, a
+    CPU stage hands every chunk to an executor (a process pool for more than
+    one worker, a single thread otherwise) and a writer stage writes the
+    results in order on another thread, so the disk and the CPU are busy at
+    the same time. The queues between the stages are bounded: the reader waits
+    once queue_size chunks are waiting to be shaped, and the CPU stage once
+    queue_size chunks are shaped or in flight, which keeps memory bounded on
+    any size of tree.
+
+    Every file gives the same output as the tool's process_file, and is
+    written to a temporary file that replaces the output once complete. The
+    key store is not used; incremental runs still skip unchanged files
+    through the build manifest.
+
+    With a run_control.RunControl the reader waits between chunks while the
+    run is paused. Once it is cancelled no further chunk is read, the file
+    being read fails with Cancelled and leaves its output untouched, and the
+    files after it are not started.
+    """
+    def __init__(self, tool: str, workers: int = 1, chunk_lines: int = DEFAULT_CHUNK_LINES,
+                 queue_size: Optional[int] = None, control=None, **settings):
+        if tool not in TOOLS:
+            raise ValueError(f"Unknown tool for the asyncio pipeline: {tool}")
+        self.tool = tool
+        self.workers = max(1, workers)
+        self.chunk_lines = chunk_lines
+        self.queue_size = queue_size or 2 * self.workers
+        self.control = control
+        settings.pop("key_store_path", None)
+        self.settings = settings
+
+    def _cpu_executor(self) -> Executor:
+        if self.workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=1)
+
+    async def run(self, files: Iterable[Tuple[str, str]], on_result):
+        """Process (input path, output path) pairs, calling on_result(paths, result, error) per file in order.
+
+        result is ((lines, time taken, counters), report dict), the shape of a
+        tool's process_file_job wrapped in run_report.report_job.
+        """
+        read_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        write_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        with ThreadPoolExecutor(max_workers=1) as reader_pool, ThreadPoolExecutor(max_workers=1) as writer_pool, \
+                self._cpu_executor() as cpu_pool:
+            await asyncio.gather(
+                self._read(files, read_queue, reader_pool),
+                self._shape(read_queue, write_queue, cpu_pool),
+                self._write(write_queue, writer_pool, on_result),
+            )
+
+    async def _read(self, files, read_queue: asyncio.Queue, pool: Executor):
+        loop = asyncio.get_running_loop()
+        for input_path, output_path in files:
+            if self.control is not None and self.control.cancelled:
+                break
+            state = _FileState(input_path, output_path)
+            try:
+                infile = await loop.run_in_executor(pool, codecs.open, input_path, 'r', 'utf-8')
+                try:
+                    chunks = read_chunks(infile, self.chunk_lines)
+                    while True:
+                        if self.control is not None and not await loop.run_in_executor(pool, self.control.wait):
+                            raise Cancelled()
+                        start = time.perf_counter()
+                        chunk = await loop.run_in_executor(pool, next, chunks, None)
+                        state.report.add_time("read", time.perf_counter() - start)
+                        if chunk is None:
+                            break
+                        await read_queue.put((state, chunk))
+                finally:
+                    infile.close()
+            except Exception as e:
+                state.error = e
+            # None marks the end of a file
+            await read_queue.put((state, None))
+        await read_queue.put(None)
+
+    async def _shape(self, read_queue: asyncio.Queue, write_queue: asyncio.Queue, pool: Executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await read_queue.get()
+            if item is None:
+                break
+            state, chunk = item
+            if chunk is not None and state.error is None:
+                future = loop.run_in_executor(pool, process_chunk_job, self.tool, self.settings, chunk)
+                await write_queue.put((state, future))
+            elif chunk is None:
+                await write_queue.put((state, None))
+        await write_queue.put(None)
+
+    async def _write(self, write_queue: asyncio.Queue, pool: Executor, on_result):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await write_queue.get()
+            if item is None:
+                break
+            state, future = item
+            if future is None:
+                await loop.run_in_executor(pool, self._finish, state)
+                on_result(*self._result(state))
+                continue
+            try:
+                processed_lines, timings, counters = await future
+            except Exception as e:
+                state.error = state.error or e
+                continue
+            if state.error is not None:
+                continue
+            state.lines += len(processed_lines)
+            for stage, seconds in timings.items():
+                state.report.add_time(stage, seconds)
+            for name, value in counters.items():
+                state.counters[name] = state.counters.get(name, 0) + value
+            try:
+                start = time.perf_counter()
+                await loop.run_in_executor(pool, self._write_chunk, state, processed_lines)
+                state.report.add_time("write", time.perf_counter() - start)
+            except Exception as e:
+                state.error = e
+
+    @staticmethod
+    def _open(state: _FileState):
+        os.makedirs(os.path.dirname(state.output_path) or '.', exist_ok=True)
+        state.outfile = codecs.open(state.temp_path, 'w', 'utf-8-sig')
+
+    def _write_chunk(self, state: _FileState, processed_lines: List[str]):
+        if state.outfile is None:
+            self._open(state)
+        state.outfile.writelines(processed_lines)
+
+    def _finish(self, state: _FileState):
+        """Move a completed file into place, or clean up after a failed one"""
+        try:
+            if state.error is None:
+                if state.outfile is None:
+                    # An empty input still gets its BOM
+                    self._open(state)
+                    state.outfile.writelines([])
+                state.outfile.close()
+                os.replace(state.temp_path, state.output_path)
+                return
+        except Exception as e:
+            state.error = e
+        if state.outfile is not None:
+            state.outfile.close()
+        if os.path.exists(state.temp_path):
+            os.remove(state.temp_path)
+
+    @staticmethod
+    def _result(state: _FileState):
+        paths = (state.input_path, state.output_path)
+        if state.error is not None:
+            return paths, None, state.error
+        report = state.report
+        for name, value in state.counters.items():
+            report.count(name, value)
+        report.finish(state.input_path, state.output_path, state.lines)
+        return paths, ((state.lines, report.elapsed, dict(state.counters)), report.to_dict()), None
+
+
+def run_async(tool: str, files: Iterable[Tuple[str, str]], workers: int = 1,
+              **options) -> Iterator[Tuple[Tuple[str, str], Optional[tuple], Optional[Exception]]]:
+    """Run the asyncio pipeline over (input path, output path) pairs and yield (paths, result, error) per file.
+
+    A drop-in for run_jobs(report_job(process_file_job)) of the reshapers: the
+    event loop runs on a background thread and results are yielded in order
+    as files complete. The options are passed on to AsyncPipeline.
+    """
+    pipeline = AsyncPipeline(tool, workers, **options)
+    results: queue.Queue = queue.Queue()
+    failure: List[BaseException] = []
+
+    def run():
+        try:
+            asyncio.run(pipeline.run(list(files), lambda *result: results.put(result)))
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            results.put(None)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while True:
+        result = results.get()
+        if result is None:
+            break
+        yield result
+    thread.join()
+    if failure:
+        raise failure[0]
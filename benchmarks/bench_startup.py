@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter and prints the wall clock time of each milestone
+CHILD = r'''
+import sys, json, time
+marks = {}
+app_module, class_name = sys.argv[1], sys.argv[2]
+module = __import__(app_module)
+marks["import"] = time.time()
+sample = ' KEY_0:0 "قوة $VAR$ جيش مصر §Yhello§! السعودية\\nسطر" #NT!\n'
+try:
+    app = module.Application()
+    app.root.update()
+    marks["window"] = time.time()
+    reshaper = app.reshaper
+except Exception as e:
+    # No display available: measure the processing path on its own
+    marks["window_error"] = str(e)
+    reshaper = getattr(module, class_name)()
+reshaper.process_line(sample)
+marks["first_line"] = time.time()
+print(json.dumps(marks))
+'''
+
+APPS = {
+    "reshape": ("arabic_reshaper_app", "ArabicReshaper"),
+    "nt-reshape": ("arabic_nt_reshaper", "ArabicNTReshaper"),
+}
+
+
+def measure(app: str) -> dict:
+    """Start the application in a new process and return milliseconds to each milestone"""
+    module, class_name = APPS[app]
+    start = time.time()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, module, class_name],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True
+    )
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+    timings = {name: (value - start) * 1000 for name, value in marks.items() if isinstance(value, float)}
+    if "window_error" in marks:
+        timings["window"] = None
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cold-start benchmark: time to first window and first processed line")
+    parser.add_argument("--app", choices=sorted(APPS), default="reshape")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-window-ms", type=float, help="fail if the median time to first window is higher")
+    parser.add_argument("--max-first-line-ms", type=float, help="fail if the median time to first line is higher")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    runs = [measure(args.app) for _ in range(args.repeat)]
+    results = {"app": args.app, "repeat": args.repeat}
+    for name in ("import", "window", "first_line"):
+        values = [run[name] for run in runs if run.get(name) is not None]
+        results[f"{name}_ms"] = round(statistics.median(values), 1) if values else None
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        window = f"{results['window_ms']} ms" if results["window_ms"] is not None else "n/a (no display)"
+        print(f"{args.app}: import {results['import_ms']} ms, first window {window}, "
+              f"first processed line {results['first_line_ms']} ms (median of {args.repeat})")
+
+    failed = False
+    for name, limit in (("window_ms", args.max_window_ms), ("first_line_ms", args.max_first_line_ms)):
+        if limit is not None and results[name] is not None and results[name] > limit:
+            print(f"Regression: {name} {results[name]} > {limit}", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
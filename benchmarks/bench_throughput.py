@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from corpus import PRESETS, generate_corpus
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def list_files(folder: str) -> List[str]:
+    """Relative paths of all .yml files below folder, in a stable order"""
+    files = []
+    for root, dirs, names in os.walk(folder):
+        for name in names:
+            if name.endswith('.yml'):
+                files.append(os.path.relpath(os.path.join(root, name), folder))
+    return sorted(files)
+
+
+def tool_runners(corpus: str) -> Dict[str, Callable[[List[str], str], None]]:
+    """Functions running each tool over a list of relative paths into an output folder"""
+    translated = os.path.join(corpus, "translated")
+    original = os.path.join(corpus, "original")
+
+    def per_file(process: Callable[[str, str], object]):
+        def run(files, output):
+            for rel_path in files:
+                output_path = os.path.join(output, rel_path)
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                process(os.path.join(translated, rel_path), output_path)
+        return run
+
+    def reshape(files, output):
+        from reshaper import ArabicReshaper
+        per_file(ArabicReshaper().process_file)(files, output)
+
+    def reshape_overlap(files, output):
+        from async_pipeline import run_async
+        for paths, result, error in run_async(
+            "reshape", [(os.path.join(translated, f), os.path.join(output, f)) for f in files]
+        ):
+            if error is not None:
+                raise error
+
+    def nt_reshape(files, output):
+        from nt_reshaper import ArabicNTReshaper
+        per_file(ArabicNTReshaper().process_file)(files, output)
+
+    def rtl(files, output):
+        from rtl_engine import default_engine
+        from rtl_processor import ArabicProcessor
+        # Every run starts without the reorder results of the previous one
+        default_engine.cache.clear()
+        per_file(ArabicProcessor.stream_yml_file)(files, output)
+
+    def rtl_nt(files, output):
+        from rtl_engine import default_engine
+        from rtl_nt_processor import stream_yml_file
+        default_engine.cache.clear()
+        per_file(stream_yml_file)(files, output)
+
+    def fix_newlines(files, output):
+        from newline_fixer import fix_or_copy_file
+        per_file(fix_or_copy_file)(files, output)
+
+    def numbering(files, output):
+        from key_index import KeyIndex
+        from renumbering import renumber_file
+        # As in hoi4_arabic numbering: the stored index is brought up to date, which only stats the
+        # unchanged originals, and every file is numbered from it
+        index = KeyIndex(original, os.path.join(corpus, "key_index.json"))
+        index.update()
+        index.save()
+        per_file(lambda translated_path, output_path: renumber_file(
+            None, translated_path, output_path,
+            number_dict=index.numbers_for(os.path.relpath(translated_path, translated))
+        ))(files, output)
+
+    def key_index(files, output):
+        from key_index import KeyIndex
+        # The index built from scratch, reading every original file, then looked up for each translated file
+        index = KeyIndex(original, os.path.join(output, "key_index.json"))
+        index.update()
+        for rel_path in files:
+            index.numbers_for(rel_path)
+
+    def parse(files, output):
+        from loc_parser import parse_line
+        # The line parser shared by the tools on its own: the files are read and parsed, nothing is written
+        for rel_path in files:
+            with open(os.path.join(translated, rel_path), 'r', encoding='utf-8-sig') as f:
+                for line in f:
+                    parse_line(line)
+
+    def corpus_load(files, output):
+        from loc_corpus import LocCorpus
+        # The translated tree loaded as the check command does, nothing is written
+        corpus = LocCorpus()
+        for rel_path in files:
+            corpus.add_file(os.path.join(translated, rel_path), rel_path)
+
+    def pipeline(files, output):
+        from pipeline import Pipeline, create_stages
+        engine = Pipeline(create_stages(["numbering", "fix_newlines", "reshape", "rtl"], original_dir=original))
+        for rel_path in files:
+            engine.process_file(os.path.join(translated, rel_path), os.path.join(output, rel_path), rel_path)
+
+    return {
+        "numbering": numbering,
+        "key-index": key_index,
+        "fix-newlines": fix_newlines,
+        "reshape": reshape,
+        "reshape-overlap": reshape_overlap,
+        "nt-reshape": nt_reshape,
+        "rtl": rtl,
+        "rtl-nt": rtl_nt,
+        "pipeline": pipeline,
+        "parse": parse,
+        "corpus-load": corpus_load,
+    }
+
+
+def measure(run: Callable[[List[str], str], None], files: List[str], repeat: int, min_time: float = 0.0) -> float:
+    """Best wall time of running a tool over files into a scratch folder.
+
+    The tool runs repeat times, and then again until min_time seconds were
+    spent on it, so a tool that takes a few milliseconds gets enough runs for
+    its best one not to depend on a single hiccup of the machine.
+    """
+    best = None
+    runs = spent = 0
+    while runs < repeat or spent < min_time:
+        output = tempfile.mkdtemp(prefix="hoi4_bench_")
+        try:
+            start = time.perf_counter()
+            run(files, output)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(output, ignore_errors=True)
+        best = elapsed if best is None else min(best, elapsed)
+        runs += 1
+        spent += elapsed
+    return best
+
+
+def corpus_size(folder: str, files: List[str]) -> Tuple[int, int]:
+    """Total lines and bytes of the given files"""
+    lines = size = 0
+    for rel_path in files:
+        path = os.path.join(folder, rel_path)
+        size += os.path.getsize(path)
+        with open(path, 'rb') as f:
+            lines += sum(1 for _ in f)
+    return lines, size
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Return a message for every tool whose throughput dropped more than threshold below the baseline"""
+    regressions = []
+    for tool, result in results.items():
+        reference = baseline.get(tool)
+        if not reference:
+            continue
+        ratio = result["lines_per_sec"] / reference["lines_per_sec"]
+        if ratio < 1 - threshold:
+            regressions.append(
+                f"{tool}: {result['lines_per_sec']:.0f} lines/s is {(1 - ratio) * 100:.0f}% below "
+                f"the baseline of {reference['lines_per_sec']:.0f} lines/s"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="End-to-end throughput of every tool on a synthetic corpus")
+    parser.add_argument("--preset", choices=sorted(PRESETS, key=lambda name: PRESETS[name][0]), default="small")
+    parser.add_argument("--seed", type=int, default=1936)
+    parser.add_argument("--corpus-dir", help="where to generate the corpus (default: a folder in the temp dir)")
+    parser.add_argument("--tools", help="comma-separated tools to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per tool, the best one counts")
+    parser.add_argument("--min-time", type=float, default=1.0,
+                        help="keep running a tool until it took this many seconds in total (default: %(default)s)")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="fail when lines/s drops more than this fraction below the baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    files_count, entries = PRESETS[args.preset]
+    corpus = args.corpus_dir or os.path.join(tempfile.gettempdir(), "hoi4_arabic_corpus", f"{args.preset}-{args.seed}")
+    generate_corpus(corpus, files_count, entries, args.seed)
+    files = list_files(os.path.join(corpus, "translated"))
+    lines, size = corpus_size(os.path.join(corpus, "translated"), files)
+
+    runners = tool_runners(corpus)
+    tools = [tool.strip() for tool in args.tools.split(',')] if args.tools else list(runners)
+    unknown = [tool for tool in tools if tool not in runners]
+    if unknown:
+        parser.error(f"unknown tools: {', '.join(unknown)}")
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baselines = json.load(f)
+    except (OSError, ValueError):
+        baselines = {}
+    baseline = baselines.get(args.preset, {}).get("tools", {})
+
+    results = {}
+    remeasured = {}
+    for tool in tools:
+        seconds = measure(runners[tool], files, args.repeat, args.min_time)
+        reference = baseline.get(tool, {}).get("lines_per_sec")
+        if reference and lines / seconds < (1 - args.threshold) * reference:
+            # A busy machine can slow down a whole round, so a slow result is measured again; the first
+            # one is still reported, so a regression the second run no longer shows can be looked into
+            remeasured[tool] = round(lines / seconds, 1)
+            seconds = min(seconds, measure(runners[tool], files, args.repeat, args.min_time))
+        results[tool] = {
+            "seconds": round(seconds, 4),
+            "lines_per_sec": round(lines / seconds, 1),
+            "mb_per_sec": round(size / seconds / 1e6, 3),
+        }
+
+    regressions = compare(results, baseline, args.threshold)
+    # A tool without a baseline is not compared at all, which must not pass for a clean run
+    missing = [tool for tool in results if tool not in baseline]
+
+    if args.json:
+        print(json.dumps({"preset": args.preset, "files": len(files), "lines": lines, "bytes": size,
+                          "tools": results, "regressions": regressions, "remeasured": remeasured,
+                          "missing_baseline": missing}))
+    else:
+        print(f"Corpus: {args.preset}, {len(files)} files, {lines} lines, {size / 1e6:.1f} MB")
+        print(f"{'tool':<14}{'seconds':>10}{'lines/s':>12}{'MB/s':>8}{'baseline':>12}")
+        for tool, result in results.items():
+            reference = baseline.get(tool, {}).get("lines_per_sec")
+            change = f"{(result['lines_per_sec'] / reference - 1) * 100:+.0f}%" if reference else "-"
+            print(f"{tool:<14}{result['seconds']:>10.3f}{result['lines_per_sec']:>12.0f}"
+                  f"{result['mb_per_sec']:>8.2f}{change:>12}")
+        for tool, first in remeasured.items():
+            print(f"Note: {tool} first measured {first:.0f} lines/s, more than {args.threshold:.0%} below the "
+                  f"baseline, and {results[tool]['lines_per_sec']:.0f} lines/s when measured again", file=sys.stderr)
+        for message in regressions:
+            print(f"Regression: {message}", file=sys.stderr)
+    if missing and not args.update_baseline:
+        print(f"No {args.preset} baseline for {', '.join(missing)} in {args.baseline}; "
+              f"store one with --update-baseline", file=sys.stderr)
+
+    if args.update_baseline:
+        entry = baselines.setdefault(args.preset, {})
+        entry.setdefault("tools", {}).update(results)
+        entry["python"] = platform.python_version()
+        entry["machine"] = platform.platform()
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+    return 1 if regressions or missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
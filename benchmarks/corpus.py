@@ -0,0 +1,119 @@
+import os
+import json
+import random
+import argparse
+from typing import Dict
+
+# Sizes of the generated trees: (files, entries per file)
+PRESETS: Dict[str, tuple] = {
+    "tiny": (10, 200),
+    "small": (100, 200),
+    "medium": (1000, 200),
+    "large": (10000, 100),
+    "huge": (50000, 100),
+}
+
+ARABIC_WORDS = [
+    "قوة", "جيش", "مصر", "السعودية", "الدولة", "الفرقة", "الحرب", "السلام", "الحكومة", "الشعب",
+    "الاقتصاد", "المصنع", "الطائرات", "البحرية", "الجنرال", "الحلفاء", "المحور", "الكومنترن", "الوطنية", "التحالف",
+    "لا", "الله", "بلاد", "العراق", "سوريا", "إيران", "تركيا", "فلسطين", "الأردن", "لبنان",
+    "يُعلن", "الإنتاج", "الموارد", "النفط", "الفولاذ", "المطاط", "الألمنيوم", "التنغستن", "الكروم", "البحث",
+]
+LATIN_WORDS = ["test", "Division", "Germany", "UK", "USA", "Reich", "Allies", "tank", "II", "1936"]
+MARKUP = ["$VAR$", "[ROOT.GetName]", "§Yhello§!", "§R", "§!", "£pol_power", "[?global.year]", "%", "+5"]
+PREFIXES = ["focus", "idea", "event", "decision", "tech", "unit", "state", "party", "modifier"]
+
+
+def _text(rng: random.Random, mixed: bool) -> str:
+    """Random entry text of Arabic words with markup, Latin words and \\n escapes"""
+    words = []
+    for _ in range(rng.randint(3, 18)):
+        roll = rng.random()
+        if roll < 0.12:
+            words.append(rng.choice(MARKUP))
+        elif roll < 0.22 and mixed:
+            words.append(rng.choice(LATIN_WORDS))
+        else:
+            words.append(rng.choice(ARABIC_WORDS))
+    if rng.random() < 0.15:
+        # Escaped newline, sometimes damaged into _ن or \ن the way machine translation leaves it
+        position = rng.randrange(len(words))
+        words[position] += rng.choice(["\\n", "\\n\\n", "_ن", "\\ن"])
+    return " ".join(words)
+
+
+def generate_file(rng: random.Random, index: int, entries: int):
+    """Return (original, translated) contents of one localisation file"""
+    original = ["l_english:\n"]
+    translated = ["l_english:\n"]
+    prefix = rng.choice(PREFIXES)
+    for entry in range(entries):
+        roll = rng.random()
+        if roll < 0.03:
+            original.append("\n")
+            translated.append("\n")
+            continue
+        if roll < 0.06:
+            comment = f" # {rng.choice(LATIN_WORDS)} {rng.choice(ARABIC_WORDS)}\n"
+            original.append(comment)
+            translated.append(comment)
+            continue
+        key = f"{prefix}_{index}_{entry}"
+        version = rng.choice([0, 0, 0, 1, 2, 10])
+        latin = " ".join(rng.choice(LATIN_WORDS) for _ in range(rng.randint(3, 12)))
+        text = _text(rng, mixed=rng.random() < 0.4)
+        tag = " #NT!" if rng.random() < 0.2 else ""
+        original.append(f' {key}:{version} "{latin}"\n')
+        # Translators usually drop the version number, numbering puts it back
+        number = "0" if rng.random() < 0.5 else ""
+        translated.append(f' {key}:{number} "{text}"{tag}\n')
+    return "".join(original), "".join(translated)
+
+
+def generate_corpus(root: str, files: int, entries: int, seed: int = 1936) -> Dict:
+    """Write a deterministic localisation tree below root and return its description.
+
+    root/original holds the files with version numbers, root/translated the
+    Arabic translations of the same keys. Most files sit directly in the
+    folder, as numbering expects, and about one in twenty under replace/.
+    Generation is skipped if root already holds a corpus of the same shape.
+    """
+    info = {"files": files, "entries": entries, "seed": seed}
+    info_path = os.path.join(root, "corpus.json")
+    try:
+        with open(info_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == info:
+                return info
+    except (OSError, ValueError):
+        pass
+
+    rng = random.Random(seed)
+    for index in range(files):
+        rel_path = f"f{index:05d}_l_english.yml"
+        if index % 20 == 19:
+            rel_path = os.path.join("replace", rel_path)
+        original, translated = generate_file(rng, index, entries)
+        for folder, content in (("original", original), ("translated", translated)):
+            path = os.path.join(root, folder, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                f.write(content)
+
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Hoi4 localisation tree")
+    parser.add_argument("root", help="folder to write the corpus to")
+    parser.add_argument("--preset", choices=sorted(PRESETS, key=lambda name: PRESETS[name][0]), default="small")
+    parser.add_argument("--seed", type=int, default=1936)
+    args = parser.parse_args()
+    files, entries = PRESETS[args.preset]
+    generate_corpus(args.root, files, entries, args.seed)
+    print(f"Wrote {files} files of {entries} entries to {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import hashlib
+from typing import Dict, Optional
+
+
+def file_hash(path: str) -> str:
+    """Return a hex digest of a file's contents"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def state_path(output_dir: str, name: str) -> str:
+    """Where a tool keeps its state about an output folder, outside it so it never ships with the mod"""
+    digest = hashlib.blake2b(os.path.abspath(output_dir).encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(os.path.expanduser("~"), ".hoi4_arabic_reshaper", "state", digest, name)
+
+
+class BuildManifest:
+    """Record of what every output file was built from, used to skip unchanged inputs.
+
+    Each entry maps an input path to its size, mtime and content hash plus the
+    output path, size, mtime and hash written for it. The manifest as a whole
+    is tied to a fingerprint of the tool name and its settings, so changing the
+    tool or its settings rebuilds everything. It is stored as
+    <tool>.manifest.json in the state folder of the output folder.
+    """
+    def __init__(self, output_dir: str, tool: str, settings: Optional[Dict] = None, kind: str = "manifest"):
+        self.path = state_path(output_dir, f"{tool}.{kind}.json")
+        self.fingerprint = hashlib.sha256(
+            json.dumps([tool, settings or {}], sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        self.entries: Dict[str, Dict] = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Load entries from disk, ignoring a missing, corrupt or stale manifest"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("fingerprint") == self.fingerprint:
+            self.entries = data.get("files", {})
+
+    def save(self):
+        """Write the manifest atomically if anything changed"""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"fingerprint": self.fingerprint, "files": self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def is_up_to_date(self, input_path: str, output_path: str) -> bool:
+        """Return True if output_path was built from the current contents of input_path.
+
+        Only stat() calls are needed when the input's size and mtime match the
+        manifest. If just the mtime moved, the input is hashed to tell a touch
+        from an edit.
+        """
+        entry = self.entries.get(os.path.abspath(input_path))
+        if entry is None or entry["output"] != os.path.abspath(output_path):
+            return False
+        try:
+            in_stat = os.stat(input_path)
+            out_stat = os.stat(output_path)
+        except OSError:
+            return False
+        if out_stat.st_size != entry["output_size"] or out_stat.st_mtime_ns != entry["output_mtime_ns"]:
+            return False
+        if in_stat.st_size != entry["size"]:
+            return False
+        if in_stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        if file_hash(input_path) != entry["hash"]:
+            return False
+        entry["mtime_ns"] = in_stat.st_mtime_ns
+        self._dirty = True
+        return True
+
+    def record(self, input_path: str, output_path: str):
+        """Remember that output_path was just built from input_path"""
+        in_stat = os.stat(input_path)
+        out_stat = os.stat(output_path)
+        self.entries[os.path.abspath(input_path)] = {
+            "size": in_stat.st_size,
+            "mtime_ns": in_stat.st_mtime_ns,
+            "hash": file_hash(input_path),
+            "output": os.path.abspath(output_path),
+            "output_size": out_stat.st_size,
+            "output_mtime_ns": out_stat.st_mtime_ns,
+            "output_hash": file_hash(output_path),
+        }
+        self._dirty = True
+
+    def forget(self, input_path: str):
+        """Drop the entry for input_path so it is rebuilt next time"""
+        if self.entries.pop(os.path.abspath(input_path), None) is not None:
+            self._dirty = True
+
+
+class Checkpoint(BuildManifest):
+    """Outputs completed by a run that has not finished yet, so a new run can resume it.
+
+    Entries are recorded like those of a BuildManifest and the file is saved
+    at most every save_interval seconds while the run goes on, as
+    <tool>.checkpoint.json next to the manifest. A stopped or killed run
+    leaves it behind; the next run skips the files it lists that are still
+    up to date and discards it once the whole run has completed.
+    """
+    def __init__(self, output_dir: str, tool: str, settings: Optional[Dict] = None, save_interval: float = 2.0):
+        super().__init__(output_dir, tool, settings, kind="checkpoint")
+        self.save_interval = save_interval
+        self._last_save = time.monotonic()
+
+    def record(self, input_path: str, output_path: str):
+        super().record(input_path, output_path)
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        super().save()
+        self._last_save = time.monotonic()
+
+    def discard(self):
+        """Remove the checkpoint after the run has completed"""
+        self.entries = {}
+        self._dirty = False
+        if os.path.exists(self.path):
+            os.remove(self.path)
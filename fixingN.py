@@ -1,8 +1,13 @@
 import os
 import shutil
-import codecs
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+from build_manifest import BuildManifest
+from newline_fixer import fix_newlines_in_file
+from run_report import FileReport, RunReport, default_report_path, timer
+from log_sink import LogSink, default_log_path
+from job_runner import JobRunner
+from progress import ProgressTracker, file_size
 
 class ModernTheme:
     # Modern dark theme colors
@@ -21,6 +26,7 @@ class NewlineFixerApp:
     def __init__(self, root):
         self.root = root
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
     def setup_gui(self):
         # Configure window
@@ -112,6 +118,15 @@ class NewlineFixerApp:
         )
         output_button.pack(side=tk.RIGHT)
         
+        # Incremental mode
+        self.incremental = tk.BooleanVar(value=True)
+        incremental_check = ttk.Checkbutton(
+            main_frame,
+            text="Skip unchanged files",
+            variable=self.incremental
+        )
+        incremental_check.pack(anchor=tk.W, pady=(0, 10))
+        
         # Progress frame
         progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding="10")
         progress_frame.pack(fill=tk.BOTH, expand=True)
@@ -123,7 +138,11 @@ class NewlineFixerApp:
             variable=self.progress_var,
             maximum=100
         )
-        self.progress_bar.pack(fill=tk.X, pady=(0, 10))
+        self.progress_bar.pack(fill=tk.X, pady=(0, 5))
+        
+        # Rate and ETA
+        self.rate_label = ttk.Label(progress_frame, text="")
+        self.rate_label.pack(fill=tk.X, pady=(0, 10))
         
         # Status text
         self.status_text = tk.Text(
@@ -138,6 +157,13 @@ class NewlineFixerApp:
             borderwidth=1
         )
         self.status_text.pack(fill=tk.BOTH, expand=True)
+        self.status_text.tag_configure("error", foreground=ModernTheme.ERROR)
+        self.status_text.tag_configure("success", foreground=ModernTheme.SUCCESS)
+        self.status_text.tag_configure("warning", foreground=ModernTheme.WARNING)
+        self.status_text.tag_configure("info", foreground=ModernTheme.FG)
+        self.log_sink = LogSink(
+            self.status_text, lambda entry: [(entry.text + "\n", (entry.level,))], log_path=default_log_path("fixingN")
+        )
         
         # Add scrollbar to status text
         scrollbar = ttk.Scrollbar(progress_frame, command=self.status_text.yview)
@@ -157,6 +183,8 @@ class NewlineFixerApp:
         style = ttk.Style()
         style.configure("Accent.TButton", font=("Segoe UI", 11))
         
+        self.runner = JobRunner(self.root, self.show_progress, controls=[self.process_button])
+        
     def browse_input(self):
         directory = filedialog.askdirectory(title="Select Input Directory")
         if directory:
@@ -171,57 +199,41 @@ class NewlineFixerApp:
             self.output_path.set(directory)
             
     def log_message(self, message, message_type="info"):
-        # Define tags for different message types if not already defined
-        if not hasattr(self, 'tags_configured'):
-            self.status_text.tag_configure("error", foreground=ModernTheme.ERROR)
-            self.status_text.tag_configure("success", foreground=ModernTheme.SUCCESS)
-            self.status_text.tag_configure("warning", foreground=ModernTheme.WARNING)
-            self.status_text.tag_configure("info", foreground=ModernTheme.FG)
-            self.tags_configured = True
-        
-        self.status_text.insert(tk.END, message + "\n", message_type)
-        self.status_text.see(tk.END)
-        self.root.update_idletasks()
-        
-    def fix_newlines_in_file(self, input_path, output_path):
-        """Fix newline characters in a single file"""
+        # Queued and drawn in batches; safe to call from any thread
+        self.log_sink.post(message, message_type)
+        
+    def fix_newlines_in_file(self, input_path, output_path, report=None):
+        """Fix newline characters in a single file, returning None if it could not be fixed"""
         try:
-            with codecs.open(input_path, 'r', encoding='utf-8-sig') as file:
-                content = file.read()
-            
-            count_underscore = content.count('_ن')
-            count_backslash = content.count('\\ن')
-            total_original = count_underscore + count_backslash
-            
-            content = content.replace('_ن', '\\n')
-            content = content.replace('\\ن', '\\n')
-            
-            with codecs.open(output_path, 'w', encoding='utf-8-sig') as file:
-                file.write(content)
-                
-            return total_original
+            return fix_newlines_in_file(input_path, output_path, report=report)
             
         except Exception as e:
-            self.log_message(f"Error processing {input_path}: {str(e)}")
-            return 0
+            self.log_message(f"Error processing {input_path}: {str(e)}", "error")
+            return None
             
-    def process_directory(self, input_dir, output_dir):
-        """Process all .yml files in the directory"""
+    def show_progress(self, done, total, current):
+        # Progress is measured in bytes, so big files move the bar as much as they take
+        self.progress_var.set((done / total) * 100 if total else 100)
+        self.rate_label.config(text=current)
+        
+    def process_directory(self, input_dir, output_dir, incremental=False):
+        """Process all .yml files in the directory; runs on the job runner's thread"""
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
             
         total_files = 0
         total_replacements = 0
+        skipped_files = 0
+        manifest = BuildManifest(output_dir, "fixingN") if incremental else None
+        run_report = RunReport("fixingN", {"incremental": incremental})
         
         self.log_message(f"Starting to process .yml files in {input_dir}")
         self.log_message(f"Output directory: {output_dir}\n")
         
-        # Count total files first for progress bar
-        yml_files_count = sum(1 for root, _, files in os.walk(input_dir) 
-                            if "processed_yml" not in root
-                            for f in files if f.lower().endswith('.yml'))
-        
-        processed_count = 0
+        # Measure the files first for the progress bar
+        tracker = ProgressTracker(sum(file_size(os.path.join(root, f)) for root, _, files in os.walk(input_dir)
+                                      if "processed_yml" not in root
+                                      for f in files if f.lower().endswith('.yml')))
         
         for root, dirs, files in os.walk(input_dir):
             if "processed_yml" in root:
@@ -238,19 +250,46 @@ class NewlineFixerApp:
                 
                 input_path = os.path.join(root, yml_file)
                 output_path = os.path.join(output_subdir, yml_file)
+                size = file_size(input_path)
                 
-                replacements = self.fix_newlines_in_file(input_path, output_path)
-                
-                if replacements > 0:
-                    self.log_message(f"Fixed {replacements} newline characters in {yml_file}")
-                    total_replacements += replacements
-                    total_files += 1
+                if manifest is not None and manifest.is_up_to_date(input_path, output_path):
+                    skipped_files += 1
+                    tracker.skip(size)
                 else:
-                    shutil.copy2(input_path, output_path)
+                    file_report = FileReport(os.path.relpath(input_path, input_dir))
+                    replacements = self.fix_newlines_in_file(input_path, output_path, file_report)
+                    failed = replacements is None
+                    
+                    if failed:
+                        # The file is still copied unchanged, but not recorded, so the next run fixes it
+                        replacements = 0
+                        run_report.add_error(file_report.path, "could not be fixed, copied unchanged")
+                    if replacements > 0:
+                        self.log_message(f"Fixed {replacements} newline characters in {yml_file}")
+                        total_replacements += replacements
+                        total_files += 1
+                    else:
+                        with timer(file_report, "write"):
+                            shutil.copy2(input_path, output_path)
+                        file_report.finish(input_path, output_path, file_report.lines)
+                    run_report.add(file_report)
+                    tracker.add(size, file_report.lines)
+                    
+                    if manifest is not None:
+                        if failed:
+                            manifest.forget(input_path)
+                        else:
+                            manifest.record(input_path, output_path)
                 
-                processed_count += 1
-                self.progress_var.set((processed_count / yml_files_count) * 100)
-                self.root.update_idletasks()
+                self.runner.progress(tracker.done_bytes, tracker.total_bytes, tracker.status())
+        
+        if manifest is not None:
+            manifest.save()
+        if skipped_files > 0:
+            self.log_message(f"Skipped {skipped_files} unchanged files")
+        report_path = default_report_path(output_dir, "fixingN")
+        run_report.write(report_path)
+        self.log_message(f"Run report: {report_path}")
         
         return total_files, total_replacements
     
@@ -263,26 +302,32 @@ class NewlineFixerApp:
             return
             
         self.status_text.delete(1.0, tk.END)
-        self.process_button.state(['disabled'])
+        # The files are processed on a background thread, which keeps the window responsive
+        self.runner.start(self.process_directory, input_dir, output_dir, self.incremental.get(),
+                          on_done=self.on_processing_done, on_error=self.on_processing_error)
         
-        try:
-            processed_files, total_fixes = self.process_directory(input_dir, output_dir)
-            
-            self.log_message("\nProcessing complete!")
-            self.log_message(f"Processed files with fixes: {processed_files}")
-            self.log_message(f"Total replacements made: {total_fixes}")
-            
-            messagebox.showinfo("Complete", 
-                              f"Processing complete!\n\n"
-                              f"Files processed: {processed_files}\n"
-                              f"Total fixes: {total_fixes}")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
-            
-        finally:
-            self.process_button.state(['!disabled'])
-            self.progress_var.set(0)
+    def on_processing_done(self, result):
+        processed_files, total_fixes = result
+        self.progress_var.set(0)
+        
+        self.log_message("\nProcessing complete!")
+        self.log_message(f"Processed files with fixes: {processed_files}")
+        self.log_message(f"Total replacements made: {total_fixes}")
+        
+        messagebox.showinfo("Complete", 
+                          f"Processing complete!\n\n"
+                          f"Files processed: {processed_files}\n"
+                          f"Total fixes: {total_fixes}")
+        self.log_sink.close_file()
+        
+    def on_processing_error(self, e):
+        self.progress_var.set(0)
+        messagebox.showerror("Error", f"An error occurred: {str(e)}")
+        self.log_sink.close_file()
+        
+    def on_closing(self):
+        self.log_sink.close()
+        self.root.destroy()
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,495 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from functools import partial
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from parallel import run_jobs, default_workers
+from build_manifest import BuildManifest
+from run_report import RunReport, report_job
+from progress import ProgressTracker, file_size, total_size
+from reshape_cache import DEFAULT_CACHE_SIZE
+
+
+class Run:
+    """Statistics, per-file report and progress output of one command"""
+    def __init__(self, command: str, quiet: bool = False):
+        self.quiet = quiet
+        self.start_time = time.time()
+        self.stats: Dict = {"command": command, "files": 0, "processed": 0, "skipped": 0, "errors": 0, "lines": 0}
+        self.aborted = False
+        self.failed: List[str] = []
+        self.report = RunReport(command)
+        self.progress: Optional[ProgressTracker] = None
+
+    def log(self, message: str):
+        if not self.quiet:
+            print(message, file=sys.stderr)
+
+    def start_progress(self, input_paths: List[str]):
+        """Measure the files about to be processed for the byte-weighted progress and ETA"""
+        self.progress = ProgressTracker(total_size(input_paths), len(input_paths))
+
+    def processed(self, rel_path: str, report: Dict):
+        """Log a processed file with the progress, rolling rates and ETA of the run"""
+        if self.progress is not None:
+            self.progress.add(report["counters"].get("bytes_in", 0), report["lines"])
+            self.log(f"Processed {rel_path} ({self.progress.status()})")
+        else:
+            self.log(f"Processed {rel_path}")
+
+    def error(self, rel_path: str, error: Exception, input_path: Optional[str] = None):
+        if self.progress is not None and input_path is not None:
+            self.progress.skip(file_size(input_path))
+        self.stats["errors"] += 1
+        self.failed.append(rel_path)
+        self.report.add_error(rel_path, error)
+        print(f"Error processing {rel_path}: {error}", file=sys.stderr)
+
+    def abort(self, error: Exception):
+        """Record an error that stopped the whole run rather than one file"""
+        self.aborted = True
+        self.stats["errors"] += 1
+        self.report.add_error(self.stats["command"], error)
+        print(f"Error: {error}", file=sys.stderr)
+
+    def add(self, name: str, value: int):
+        self.stats[name] = self.stats.get(name, 0) + value
+
+    def finish(self, as_json: bool, report_path: Optional[str] = None) -> int:
+        """Report the statistics, write the run report if asked to and return the exit status"""
+        self.stats["time"] = round(time.time() - self.start_time, 3)
+        if report_path:
+            self.report.write(report_path)
+        self.stats["failed"] = self.failed
+        if as_json:
+            print(json.dumps(self.stats, ensure_ascii=False))
+        else:
+            summary = ", ".join(
+                f"{name}: {value}" for name, value in self.stats.items() if name not in ("command", "failed")
+            )
+            self.log(f"Processing complete ({summary})")
+        if self.aborted:
+            return 3
+        return 1 if self.stats["errors"] else 0
+
+
+def find_files(input_dir: str, output_dir: str, accept: Callable[[str, str], bool]) -> List[Tuple[str, str]]:
+    """List (input path, output path) for the files under input_dir accepted by accept(root, name)"""
+    files = []
+    for root, dirs, names in os.walk(input_dir):
+        for name in names:
+            if accept(root, name):
+                input_path = os.path.join(root, name)
+                files.append((input_path, os.path.join(output_dir, os.path.relpath(input_path, input_dir))))
+    return files
+
+
+def parse_stages(value: str) -> List[str]:
+    """The stage names of a comma-separated --stages value"""
+    return [stage.strip() for stage in value.split(',') if stage.strip()]
+
+
+def is_yml(root: str, name: str) -> bool:
+    return name.lower().endswith('.yml')
+
+
+def run_files(args, run: Run, files: List[Tuple[str, str]], job: Callable,
+              collect: Callable[[Run, object], None], tool: Optional[str] = None,
+              settings: Optional[Dict] = None, runner: Optional[Callable] = None):
+    """Run job(input_path, output_path, report=...) over files with the requested number of workers.
+
+    With --incremental the files recorded as up to date in the tool's build
+    manifest, which is shared with the Tk application, are skipped. runner,
+    if given, replaces the worker pool: it is called with the files and
+    yields (paths, (result, report), error) like run_jobs over report_job.
+    """
+    run.stats["files"] = len(files)
+    manifest = None
+    if tool is not None and getattr(args, "incremental", False):
+        manifest = BuildManifest(args.output, tool, settings)
+        pending = [paths for paths in files if not manifest.is_up_to_date(*paths)]
+        run.stats["skipped"] = len(files) - len(pending)
+        files = pending
+
+    run.log(f"Found {run.stats['files']} files to process")
+    run.start_progress([input_path for input_path, output_path in files])
+    for input_path, output_path in files:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    if runner is not None:
+        results = runner(files)
+    else:
+        results = run_jobs(partial(report_job, job), files, args.workers)
+    for (input_path, output_path), result, error in results:
+        rel_path = os.path.relpath(input_path, args.input)
+        if error is not None:
+            run.error(rel_path, error, input_path)
+            if manifest is not None:
+                manifest.forget(input_path)
+            continue
+        result, report = result
+        run.stats["processed"] += 1
+        run.report.add(report, rel_path)
+        collect(run, result)
+        if manifest is not None:
+            manifest.record(input_path, output_path)
+        run.processed(rel_path, report)
+
+    if manifest is not None:
+        manifest.save()
+
+
+def collect_reshape(run: Run, result):
+    lines, process_time, counters = result
+    run.add("lines", lines)
+    for name, value in counters.items():
+        run.add(name, value)
+
+
+def collect_lines(run: Run, lines):
+    run.add("lines", lines)
+
+
+def collect_replacements(run: Run, replacements):
+    run.add("replacements", replacements)
+
+
+def command_reshape(args, run: Run):
+    from key_store import default_key_store_path
+    from reshape_cache import default_cache_path, library_versions
+    if args.command == "reshape":
+        from reshaper import process_file_job
+        tool = "arabic_reshaper"
+        extensions = ('.txt', '.yml', '.yaml')
+    else:
+        from nt_reshaper import process_file_job
+        tool = "arabic_nt_reshaper"
+        extensions = ('.yml', '.yaml')
+
+    key_store_path = default_key_store_path(args.output, tool) if args.incremental else None
+    cache_path = None if args.no_disk_cache else default_cache_path()
+    job = partial(process_file_job, cache_size=args.cache_size, cache_path=cache_path, key_store_path=key_store_path)
+    runner = None
+    if args.overlap:
+        from async_pipeline import run_async
+        runner = partial(run_async, args.command.replace('-', '_'), workers=args.workers,
+                         cache_size=args.cache_size, cache_path=cache_path)
+    files = find_files(args.input, args.output, lambda root, name: name.endswith(extensions))
+    run_files(args, run, files, job, collect_reshape, tool, library_versions(), runner)
+
+
+def command_rtl(args, run: Run):
+    from loc_parser import PARSER_SETTINGS
+    if args.command == "rtl":
+        from rtl_processor import ArabicProcessor
+        job, tool = ArabicProcessor.stream_yml_file, "rtl"
+    else:
+        from rtl_nt_processor import stream_yml_file
+        job, tool = stream_yml_file, "rtl_nt"
+    run_files(args, run, find_files(args.input, args.output, is_yml), job, collect_lines, tool, PARSER_SETTINGS)
+
+
+def command_fix_newlines(args, run: Run):
+    from newline_fixer import fix_or_copy_file
+    files = find_files(
+        args.input, args.output, lambda root, name: "processed_yml" not in root and is_yml(root, name)
+    )
+    run_files(args, run, files, fix_or_copy_file, collect_replacements, "fixingN")
+
+
+def command_numbering(args, run: Run):
+    from key_index import shared_index
+    # Like the Tk application, number every translated file from the key index of the whole original tree
+    index = shared_index(args.original, refresh=True)
+    report_index_errors(run, index)
+    run.log(f"Indexed {len(index)} keys in {len(index.files)} original files")
+    files = sorted(find_files(args.input, args.output, is_yml))
+    run_files(args, run, files, partial(_renumber_job, args.original, args.input), collect_lines)
+
+
+def report_index_errors(run: Run, index):
+    """Report the original files the key index could not read; their keys are missing from it"""
+    for rel_path, error in index.errors.items():
+        run.error(os.path.join(index.original_dir, rel_path), error)
+
+
+def _renumber_job(original_dir: str, input_dir: str, translated_path: str, output_path: str, report=None) -> int:
+    from key_index import shared_index
+    from renumbering import renumber_file
+    numbers = shared_index(original_dir).numbers_for(os.path.relpath(translated_path, input_dir))
+    return renumber_file(None, translated_path, output_path, report=report, number_dict=numbers)
+
+
+def command_pipeline(args, run: Run):
+    from pipeline import run_pipeline
+    from reshape_cache import default_cache_path
+    stages = parse_stages(args.stages)
+
+    def on_files(files):
+        # The key index was brought up to date just before the files were listed
+        if "numbering" in stages:
+            from key_index import shared_index
+            report_index_errors(run, shared_index(args.original))
+        run.start_progress([input_path for input_path, output_path, rel_path in files])
+
+    results = run_pipeline(
+        args.input, args.output, stages, args.workers, on_files=on_files,
+        original_dir=args.original, cache_size=args.cache_size,
+        cache_path=None if args.no_disk_cache else default_cache_path()
+    )
+    for rel_path, lines, error, report in results:
+        run.stats["files"] += 1
+        if error is not None:
+            run.error(rel_path, error, os.path.join(args.input, rel_path))
+            continue
+        run.stats["processed"] += 1
+        run.report.add(report)
+        run.add("lines", lines)
+        run.processed(rel_path, report)
+
+
+def load_corpus(run: Run, folder: str):
+    """Every .yml file under folder in one LocCorpus, in path order, reporting the files that cannot be read"""
+    from loc_corpus import LocCorpus
+    corpus = LocCorpus()
+    for input_path, output_path in sorted(find_files(folder, folder, is_yml)):
+        rel_path = os.path.relpath(input_path, folder)
+        try:
+            corpus.add_file(input_path, rel_path)
+        except (OSError, UnicodeDecodeError) as e:
+            run.error(rel_path, e, input_path)
+    return corpus
+
+
+def command_check(args, run: Run):
+    # The whole translated tree, and the original one, are loaded so keys can be compared across files
+    translated = load_corpus(run, args.input)
+    run.stats["files"] = len(translated.files) + run.stats["errors"]
+    run.stats["processed"] = len(translated.files)
+    original = load_corpus(run, args.original) if args.original else None
+    # Entries are counted instead of lines, which the corpus does not keep
+    del run.stats["lines"]
+    run.stats.update(entries=len(translated), duplicates=0, unknown=0)
+    problem_files = set()
+
+    def problem(entry_id: int, message: str):
+        file, line = translated.location(entry_id)
+        problem_files.add(file)
+        print(f"{file}:{line}: {message}", file=sys.stderr)
+
+    for key in translated.keys:
+        entries = translated.entries_of(key)
+        if len(entries) > 1:
+            first_file, first_line = translated.location(entries[0])
+            for entry_id in entries[1:]:
+                problem(entry_id, f"{key} is already defined at {first_file}:{first_line}")
+            run.add("duplicates", len(entries) - 1)
+        if original is not None and key not in original:
+            problem(entries[0], f"{key} is not in the original files")
+            run.add("unknown", 1)
+    if original is not None:
+        # Untranslated keys are expected while a translation is in progress, so they are only listed
+        missing = [key for key in original.keys if key not in translated]
+        for key in missing:
+            entry = original.find(key)
+            run.log(f"{os.path.join(args.original, entry.file)}:{entry.line}: {key} is not translated")
+        run.stats["missing"] = len(missing)
+    run.stats["errors"] += len(problem_files)
+    run.failed.extend(sorted(problem_files))
+
+
+def command_watch(args, run: Run):
+    from loc_parser import entry_key
+    from pipeline import Pipeline, create_stages
+    from reshape_cache import default_cache_path
+    from run_report import FileReport
+    from watcher import FolderWatcher
+    stages = parse_stages(args.stages)
+    pipeline = Pipeline(create_stages(
+        stages, original_dir=args.original, cache_size=args.cache_size,
+        cache_path=None if args.no_disk_cache else default_cache_path()
+    ))
+
+    # Bring the whole output folder up to date before watching for changes
+    command_pipeline(args, run)
+
+    input_dir = os.path.abspath(args.input)
+    output_dir = os.path.abspath(args.output)
+    lock = threading.Lock()
+
+    def accept(root: str, name: str) -> bool:
+        # An output folder inside the input folder must not trigger itself
+        root = os.path.abspath(root)
+        return root != output_dir and not root.startswith(output_dir + os.sep)
+
+    def process_changes(paths: List[str]):
+        with lock:
+            for input_path in paths:
+                rel_path = os.path.relpath(input_path, input_dir)
+                if not os.path.isfile(input_path) or not pipeline.accepts(input_path, rel_path):
+                    continue
+                report = FileReport(rel_path)
+                try:
+                    lines = pipeline.process_file(input_path, os.path.join(output_dir, rel_path), rel_path, report)
+                except Exception as e:
+                    run.error(rel_path, e)
+                    continue
+                run.stats["processed"] += 1
+                run.add("lines", lines)
+                run.report.add(report)
+                run.log(f"Updated {rel_path} in {report.elapsed:.2f}s")
+
+    def uses_any(input_path: str, keys: Set[str]) -> bool:
+        try:
+            with open(input_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+                return any(entry_key(line) in keys for line in f)
+        except OSError:
+            return False
+
+    def process_original_changes(paths: List[str]):
+        # Take the new numbers into the key index, then renumber every translated file that uses one of
+        # the keys they changed, whichever original file the key is in now or was in before
+        changed_keys: Set[str] = set()
+        with lock:
+            numbering.index.update(changed_keys)
+            numbering.index.save()
+            report_index_errors(run, numbering.index)
+            for stage in pipeline.stages:
+                stage.refresh()
+        if changed_keys:
+            process_changes([input_path for input_path, output_path, rel_path
+                             in pipeline.find_files(input_dir, output_dir) if uses_any(input_path, changed_keys)])
+
+    watchers = [FolderWatcher(input_dir, process_changes, accept, args.debounce, args.poll_interval, args.polling)]
+    if "numbering" in stages:
+        numbering = next(stage for stage in pipeline.stages if stage.name == "numbering")
+        watchers.append(FolderWatcher(args.original, process_original_changes, accept, args.debounce,
+                                      args.poll_interval, args.polling))
+    for watcher in watchers:
+        watcher.start()
+    run.log(f"Watching {input_dir} for changes ({watchers[0].backend}), press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for watcher in watchers:
+            watcher.stop()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m hoi4_arabic",
+        description="Process Hoi4 localisation files without the Tk interface. Every command processes "
+                    "the same files as its Tk application and writes the same output.",
+        epilog="Progress goes to stderr. The exit status is 0 when every file was processed, "
+               "1 when some failed, 2 for usage errors and 3 when an error stopped the whole run."
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-w", "--workers", type=int, default=default_workers(),
+                        help="number of worker processes (default: %(default)s)")
+    common.add_argument("-q", "--quiet", action="store_true", help="only report errors")
+    common.add_argument("--json", action="store_true", help="print run statistics to stdout as JSON")
+    common.add_argument("--report", metavar="PATH",
+                        help="write per-file stage timings and counters with a summary to PATH, "
+                             "as JSON Lines if it ends in .jsonl and JSON otherwise")
+    incremental = argparse.ArgumentParser(add_help=False)
+    incremental.add_argument("--incremental", action="store_true",
+                             help="skip files that are unchanged since the last run")
+    disk_cache = argparse.ArgumentParser(add_help=False)
+    disk_cache.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, metavar="RUNS",
+                            help="distinct Arabic runs each worker keeps reshaped in memory, 0 to keep none "
+                                 "(default: %(default)s)")
+    disk_cache.add_argument("--no-disk-cache", action="store_true",
+                            help="do not use the persistent reshape cache")
+    overlap = argparse.ArgumentParser(add_help=False)
+    overlap.add_argument("--overlap", action="store_true",
+                         help="overlap reading, shaping and writing through the asyncio pipeline, with the "
+                              "workers shaping chunks of lines (does not use the key store of --incremental)")
+
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, handler, help_text, parents in (
+        ("reshape", command_reshape, "reshape Arabic text (arabic_reshaper_app.py)",
+         [incremental, disk_cache, overlap]),
+        ("nt-reshape", command_reshape, "reshape lines ending in #NT! (arabic_nt_reshaper.py)",
+         [incremental, disk_cache, overlap]),
+        ("rtl", command_rtl, "reverse Arabic word order (rtl.py)", [incremental]),
+        ("rtl-nt", command_rtl, "reverse word order of lines ending in #NT! (rtl_nt.py)", [incremental]),
+        ("fix-newlines", command_fix_newlines, "turn _ن and \\ن back into \\n (fixingN.py)", [incremental]),
+    ):
+        sub = commands.add_parser(name, help=help_text, parents=[common] + parents)
+        sub.add_argument("input", help="input folder")
+        sub.add_argument("output", help="output folder")
+        sub.set_defaults(handler=handler)
+
+    sub = commands.add_parser("numbering", help="copy version numbers from the original files (numbering.py)",
+                              parents=[common])
+    sub.add_argument("original", help="folder of original files")
+    sub.add_argument("input", help="folder of translated files")
+    sub.add_argument("output", help="output folder")
+    sub.set_defaults(handler=command_numbering)
+
+    sub = commands.add_parser("check", help="report duplicate keys, and keys missing from either side when "
+                                            "given the original files", parents=[common])
+    sub.add_argument("input", help="folder of translated files")
+    sub.add_argument("--original", help="folder of original files to compare the keys with")
+    sub.set_defaults(handler=command_check)
+
+    sub = commands.add_parser("pipeline", help="run several tools in one pass per file", parents=[common, disk_cache])
+    sub.add_argument("input", help="input folder")
+    sub.add_argument("output", help="output folder")
+    sub.add_argument("--stages", default="numbering,fix_newlines,reshape,rtl",
+                     help="comma-separated stages out of numbering, fix_newlines, reshape, nt_reshape, rtl "
+                          "and rtl_nt (default: %(default)s)")
+    sub.add_argument("--original", help="folder of original files, needed by the numbering stage")
+    sub.set_defaults(handler=command_pipeline)
+
+    sub = commands.add_parser("watch", help="run the pipeline, then update the output whenever input files change",
+                              parents=[common, disk_cache])
+    sub.add_argument("input", help="input folder")
+    sub.add_argument("output", help="output folder")
+    sub.add_argument("--stages", default="numbering,fix_newlines,reshape,rtl",
+                     help="comma-separated pipeline stages, as for the pipeline command (default: %(default)s)")
+    sub.add_argument("--original", help="folder of original files, needed by the numbering stage")
+    sub.add_argument("--debounce", type=float, default=0.25,
+                     help="seconds without further changes before a burst of saves is processed "
+                          "(default: %(default)s)")
+    sub.add_argument("--polling", action="store_true",
+                     help="poll the folder instead of using native change notifications from watchdog")
+    sub.add_argument("--poll-interval", type=float, default=0.5,
+                     help="seconds between scans of the folder when polling (default: %(default)s)")
+    sub.set_defaults(handler=command_watch)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if getattr(args, "cache_size", 0) < 0:
+        parser.error("--cache-size cannot be negative")
+    for folder in (args.input, getattr(args, "original", None)):
+        if folder is not None and not os.path.isdir(folder):
+            parser.error(f"not a folder: {folder}")
+    if getattr(args, "stages", None) is not None:
+        from pipeline import check_stages
+        try:
+            check_stages(parse_stages(args.stages), args.original)
+        except ValueError as e:
+            parser.error(str(e))
+
+    run = Run(args.command, args.quiet)
+    try:
+        args.handler(args, run)
+    except Exception as e:
+        run.abort(e)
+    return run.finish(args.json, args.report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import threading
+import tkinter as tk
+from tkinter import ttk
+from collections import deque
+from typing import Callable, Optional, Sequence
+
+
+def set_enabled(widget: tk.Widget, enabled: bool):
+    """Enable or disable a ttk or classic Tk widget"""
+    if isinstance(widget, ttk.Widget):
+        widget.state(['!disabled'] if enabled else ['disabled'])
+    else:
+        widget.configure(state="normal" if enabled else "disabled")
+
+
+class JobRunner:
+    """Runs the processing job of a Tk application on a background thread.
+
+    Only one job runs at a time: start() returns False while a job is
+    running, and the widgets in controls (e.g. the process button) are
+    disabled until it ends. The job reports its progress with progress(),
+    which can be called as often as it likes from the job's thread; a timer
+    on the Tk thread hands only the latest state to on_progress(done, total,
+    current) every interval_ms, where current is a short status text. call() runs anything else that has to touch
+    the widgets, such as a message box, on the Tk thread in the order of the
+    calls. When the job ends, on_done receives its result or on_error the
+    exception it raised, after all its progress and calls were delivered.
+    """
+    def __init__(self, widget: tk.Misc, on_progress: Optional[Callable[[int, int, str], None]] = None,
+                 controls: Sequence[tk.Widget] = (), interval_ms: int = 100):
+        self.widget = widget
+        self.on_progress = on_progress
+        self.controls = list(controls)
+        self.interval_ms = interval_ms
+        self._lock = threading.Lock()
+        self._progress = None
+        self._calls: deque = deque()
+        self._thread: Optional[threading.Thread] = None
+        self._outcome = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, job: Callable, *args, on_done: Optional[Callable] = None,
+              on_error: Optional[Callable[[Exception], None]] = None, **kwargs) -> bool:
+        """Run job(*args, **kwargs) in the background; must be called on the Tk thread"""
+        if self.running:
+            return False
+        self._progress = None
+        self._outcome = None
+        for control in self.controls:
+            set_enabled(control, False)
+        self._thread = threading.Thread(target=self._run, args=(job, args, kwargs), daemon=True)
+        self._thread.start()
+        self.widget.after(self.interval_ms, self._tick, on_done, on_error)
+        return True
+
+    def progress(self, done: int, total: int, current: str = ""):
+        """Report progress from the job; only the latest report before each tick is delivered"""
+        with self._lock:
+            self._progress = (done, total, current)
+
+    def call(self, function: Callable, *args, **kwargs):
+        """Run function(*args, **kwargs) on the Tk thread"""
+        with self._lock:
+            self._calls.append((function, args, kwargs))
+
+    def _run(self, job, args, kwargs):
+        try:
+            outcome = (True, job(*args, **kwargs))
+        except Exception as e:
+            outcome = (False, e)
+        with self._lock:
+            self._outcome = outcome
+
+    def _deliver(self):
+        with self._lock:
+            calls = list(self._calls)
+            self._calls.clear()
+            progress, self._progress = self._progress, None
+            outcome = self._outcome
+        for function, args, kwargs in calls:
+            function(*args, **kwargs)
+        if progress is not None and self.on_progress is not None:
+            self.on_progress(*progress)
+        return outcome
+
+    def _tick(self, on_done, on_error):
+        outcome = self._deliver()
+        if outcome is None:
+            self.widget.after(self.interval_ms, self._tick, on_done, on_error)
+            return
+
+        self._thread.join()
+        self._thread = None
+        for control in self.controls:
+            set_enabled(control, True)
+        succeeded, value = outcome
+        if succeeded:
+            if on_done is not None:
+                on_done(value)
+        elif on_error is not None:
+            on_error(value)
+        else:
+            raise value
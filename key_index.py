@@ -0,0 +1,171 @@
+import os
+import json
+import hashlib
+import threading
+from collections import ChainMap
+from typing import Dict, List, Mapping, Optional, Set
+from loc_parser import PARSER_SETTINGS
+from renumbering import load_numbers
+
+INDEX_VERSION = 1
+
+
+def default_index_path(original_dir: str) -> str:
+    """Location of the key index of an original folder, next to the persistent reshape cache"""
+    digest = hashlib.blake2b(os.path.abspath(original_dir).encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(os.path.expanduser("~"), ".hoi4_arabic_reshaper", "key_index", f"{digest}.json")
+
+
+class KeyIndex:
+    """Version number of every key in a whole tree of original localisation files.
+
+    Each .yml file under original_dir is read once and its keys are stored
+    with the file's size and mtime in a JSON file outside the game folder.
+    Every file is read again when the line parser changes.
+    update() walks the tree with stat() calls only and re-reads just the
+    files that were added or changed since, e.g. by a game patch, and drops
+    the ones that were removed. numbers_for() then gives a translated file
+    the numbers of its keys without reading any original file: the keys of
+    the original file at the same relative path, or else with the same name,
+    come first, and every other key is looked up in the rest of the tree, so
+    keys that moved to another file are still found. A key defined in
+    several files takes the number of the first of them in path order.
+    """
+    def __init__(self, original_dir: str, path: Optional[str] = None):
+        self.original_dir = os.path.abspath(original_dir)
+        self.path = path if path is not None else default_index_path(original_dir)
+        self.files: Dict[str, Dict] = {}
+        # Original files the last update() could not read, with the error; their keys are left out
+        self.errors: Dict[str, Exception] = {}
+        self._numbers: Optional[Dict[str, str]] = None
+        self._by_name: Optional[Dict[str, str]] = None
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Load the stored index, ignoring a missing, corrupt or foreign one or one parsed another way"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (isinstance(data, dict) and data.get("version") == INDEX_VERSION and data.get("root") == self.original_dir
+                and data.get("parser") == PARSER_SETTINGS):
+            self.files = data.get("files", {})
+            self._numbers = self._by_name = None
+
+    def save(self):
+        """Write the index atomically if anything changed"""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Pool workers may save the same index, so each writes its own temporary file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": INDEX_VERSION, "parser": PARSER_SETTINGS, "root": self.original_dir,
+                       "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def update(self, changed_keys: Optional[Set[str]] = None) -> List[str]:
+        """Bring the index in line with the original folder and return the relative paths that changed.
+
+        With a changed_keys set, every key that was added, removed or given
+        another number in one of those files is added to it. A file that
+        cannot be read or decoded is left out of the index as if it were
+        removed, and recorded in errors.
+        """
+        seen = set()
+        changed = []
+        errors: Dict[str, Exception] = {}
+        for root, dirs, names in os.walk(self.original_dir):
+            for name in names:
+                if not name.lower().endswith('.yml'):
+                    continue
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, self.original_dir)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entry = self.files.get(rel_path)
+                if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                    seen.add(rel_path)
+                    continue
+                try:
+                    keys = load_numbers(path)
+                except (OSError, UnicodeDecodeError) as e:
+                    errors[rel_path] = e
+                    continue
+                seen.add(rel_path)
+                if changed_keys is not None:
+                    old_keys = entry["keys"] if entry is not None else {}
+                    changed_keys.update(key for key in old_keys.keys() | keys.keys()
+                                        if old_keys.get(key) != keys.get(key))
+                self.files[rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "keys": keys}
+                changed.append(rel_path)
+        removed = [rel_path for rel_path in self.files if rel_path not in seen]
+        for rel_path in removed:
+            if changed_keys is not None:
+                changed_keys.update(self.files[rel_path]["keys"])
+            del self.files[rel_path]
+        changed.extend(removed)
+        self.errors = errors
+        if changed:
+            self._dirty = True
+            self._numbers = self._by_name = None
+        return changed
+
+    @property
+    def numbers(self) -> Dict[str, str]:
+        """Every key of the tree, mapped to its version number"""
+        if self._numbers is None:
+            numbers: Dict[str, str] = {}
+            for rel_path in sorted(self.files, reverse=True):
+                numbers.update(self.files[rel_path]["keys"])
+            self._numbers = numbers
+        return self._numbers
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def find_original(self, rel_path: str) -> Optional[str]:
+        """Relative path of the original file a translated file corresponds to, if there is one"""
+        if rel_path in self.files:
+            return rel_path
+        if self._by_name is None:
+            by_name: Dict[str, str] = {}
+            for original in sorted(self.files, reverse=True):
+                by_name[os.path.basename(original)] = original
+            self._by_name = by_name
+        return self._by_name.get(os.path.basename(rel_path))
+
+    def numbers_for(self, rel_path: str) -> Mapping[str, str]:
+        """Version numbers for the translated file at rel_path, preferring those of its own original file"""
+        original = self.find_original(rel_path)
+        if original is None:
+            return self.numbers
+        return ChainMap(self.files[original]["keys"], self.numbers)
+
+
+_shared: Dict[str, KeyIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_index(original_dir: str, refresh: bool = False) -> KeyIndex:
+    """The KeyIndex of original_dir kept by this process, updated when it is first used or refresh is set.
+
+    A run refreshes it once before it starts. Pool workers then use the copy
+    they were forked with, or load the one the run saved, so no original
+    file is read again.
+    """
+    key = os.path.abspath(original_dir)
+    with _shared_lock:
+        index = _shared.get(key)
+        if index is None:
+            index = _shared[key] = KeyIndex(original_dir)
+            refresh = True
+        if refresh:
+            index.update()
+            index.save()
+        return index
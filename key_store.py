@@ -0,0 +1,173 @@
+import os
+import json
+import sqlite3
+import hashlib
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from loc_parser import entry_key
+from build_manifest import state_path
+
+
+def line_key(line: str) -> Optional[str]:
+    """Return the localisation key of a line such as ` KEY:0 "text"`, or None for headers, comments and blanks"""
+    return entry_key(line)
+
+
+def default_key_store_path(output_dir: str, tool: str) -> str:
+    """Where a tool keeps the key store of an output folder, with its sqlite -wal and -shm files"""
+    return state_path(output_dir, f"{tool}.keys.sqlite")
+
+
+class KeyStore:
+    """Per-key record of processed localisation entries, stored in a sqlite file.
+
+    For every file the store maps each key to a hash of its source line and the
+    processed line produced from it. When a file is processed again only the
+    entries whose source line changed are run through the processing function;
+    everything else is spliced back in from the store. The store is tagged with
+    the settings the outputs depend on and is emptied when they change.
+    """
+    def __init__(self, path: str, tag: Optional[Dict] = None):
+        self.path = path
+        self.reused = 0
+        self.processed = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "file TEXT, key TEXT, source_hash BLOB, output TEXT, PRIMARY KEY (file, key)"
+                ") WITHOUT ROWID"
+            )
+
+        tag_json = json.dumps(tag or {}, sort_keys=True)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'tag'").fetchone()
+        if row is None or row[0] != tag_json:
+            with self._conn:
+                self._conn.execute("DELETE FROM entries")
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('tag', ?)", (tag_json,))
+
+    @staticmethod
+    def line_hash(line: str) -> bytes:
+        return hashlib.blake2b(line.encode("utf-8"), digest_size=16).digest()
+
+    def lookup(self, file_id: str, keys: Iterable[str]) -> Dict[str, Tuple[bytes, str]]:
+        """Return key -> (source hash, processed line) for the given keys of one file"""
+        keys = list(keys)
+        found = {}
+        # Stay below sqlite's limit on bound parameters
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self._conn.execute(
+                "SELECT key, source_hash, output FROM entries WHERE file = ? AND key IN (%s)"
+                % ",".join("?" * len(batch)),
+                [file_id, *batch]
+            )
+            for key, source_hash, output in rows:
+                found[key] = (source_hash, output)
+        return found
+
+    def update(self, file_id: str, entries: Dict[str, Tuple[bytes, str]]):
+        """Store new or changed entries of one file"""
+        if not entries:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (file, key, source_hash, output) VALUES (?, ?, ?, ?)",
+                ((file_id, key, source_hash, output) for key, (source_hash, output) in entries.items())
+            )
+
+    def prune(self, file_id: str, keep: Set[str]):
+        """Delete the stored entries of one file whose keys are not in keep"""
+        stale = [
+            (file_id, key) for (key,) in
+            self._conn.execute("SELECT key FROM entries WHERE file = ?", (file_id,)).fetchall()
+            if key not in keep
+        ]
+        if stale:
+            with self._conn:
+                self._conn.executemany("DELETE FROM entries WHERE file = ? AND key = ?", stale)
+
+    def session(self, file_id: str) -> "KeyStoreSession":
+        """Start processing one file a chunk of lines at a time"""
+        return KeyStoreSession(self, file_id)
+
+    def process_lines(self, file_id: str, lines: List[str], process_line: Callable[[str], str],
+                      process_batch: Optional[Callable[[List[str]], List[str]]] = None) -> List[str]:
+        """Process all lines of one file, reusing stored results for unchanged keys"""
+        session = self.session(file_id)
+        processed_lines = session.process(lines, process_line, process_batch)
+        session.close()
+        return processed_lines
+
+    def close(self):
+        self._conn.close()
+
+
+class KeyStoreSession:
+    """Incremental processing of one file through a KeyStore, one chunk of lines at a time.
+
+    Stored entries are looked up per chunk, so memory use does not grow with
+    the size of the file apart from the set of keys seen. close() removes the
+    entries of keys that no longer exist in the file.
+    """
+    def __init__(self, store: KeyStore, file_id: str):
+        self.store = store
+        self.file_id = file_id
+        self.seen: Set[str] = set()
+
+    def process(self, lines: List[str], process_line: Callable[[str], str],
+                process_batch: Optional[Callable[[List[str]], List[str]]] = None) -> List[str]:
+        """Process a chunk of lines, reusing stored results for unchanged keys.
+
+        When process_batch is given, every line that needs processing is handed
+        to it in a single call instead of going through process_line one by one.
+        """
+        store = self.store
+        line_hashes = [None] * len(lines)
+        for index, line in enumerate(lines):
+            key = line_key(line)
+            if key is not None:
+                line_hashes[index] = (key, store.line_hash(line))
+        stored = store.lookup(self.file_id, {key_hash[0] for key_hash in line_hashes if key_hash is not None})
+
+        processed_lines = list(lines)
+        pending = []
+        for index, key_hash in enumerate(line_hashes):
+            if key_hash is None:
+                pending.append(index)
+                continue
+            cached = stored.get(key_hash[0])
+            if cached is not None and cached[0] == key_hash[1]:
+                processed_lines[index] = cached[1]
+                store.reused += 1
+            else:
+                pending.append(index)
+                store.processed += 1
+
+        pending_lines = [lines[index] for index in pending]
+        if process_batch is not None:
+            outputs = process_batch(pending_lines)
+        else:
+            outputs = [process_line(line) for line in pending_lines]
+        for index, output in zip(pending, outputs):
+            processed_lines[index] = output
+
+        changed = {}
+        for index, key_hash in enumerate(line_hashes):
+            if key_hash is not None:
+                key, source_hash = key_hash
+                self.seen.add(key)
+                if stored.get(key) != (source_hash, processed_lines[index]):
+                    changed[key] = (source_hash, processed_lines[index])
+        store.update(self.file_id, changed)
+        return processed_lines
+
+    def close(self):
+        """Finish the file, dropping entries for keys it no longer contains"""
+        self.store.prune(self.file_id, self.seen)
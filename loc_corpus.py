@@ -0,0 +1,186 @@
+import os
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional
+from loc_parser import parse_line
+
+NO_VERSION = -1
+
+
+class LocEntry:
+    """One entry of a LocCorpus, built on demand from its columns"""
+    __slots__ = ("id", "key", "version", "text", "file", "line")
+
+    def __init__(self, id: int, key: str, version: Optional[int], text: str, file: str, line: int):
+        self.id = id
+        self.key = key
+        self.version = version
+        self.text = text
+        self.file = file
+        self.line = line
+
+    def __repr__(self):
+        version = "" if self.version is None else self.version
+        return f"<LocEntry {self.file}:{self.line} {self.key}:{version}>"
+
+
+class LocCorpus:
+    """Every KEY:N "text" entry of a localisation tree, held in a few flat arrays.
+
+    Keys are interned in a table of their own and entries refer to them by id. Each entry is a
+    row across typed arrays (key id, version, line number and the span of
+    its text), and the texts of a file are joined into one string,
+    so an entry costs a few dozen bytes plus its text instead of a str per
+    line and a dict per file. Entries are numbered in load order and the
+    entries of a file are contiguous, so the file of an entry is found by
+    bisecting the first entry of every file. entries_of() finds every entry of a
+    key through a chain of entry ids, without a list per key, and entry()
+    builds a LocEntry view of a row when one is needed.
+    """
+    def __init__(self):
+        self.files: List[str] = []
+        self.keys: List[str] = []
+        self._key_ids: Dict[str, int] = {}
+        # Columns, one row per entry; 'i' is 4 bytes on every platform
+        self._key = array('i')
+        self._version = array('q')
+        self._line = array('i')
+        self._text_start = array('i')
+        self._text_end = array('i')
+        # The joined texts and first entry of each file, plus the end of the last file
+        self._texts: List[str] = []
+        self._file_start = array('i', [0])
+        # First and last entry of each key, and the next entry with the same key
+        self._key_first = array('i')
+        self._key_last = array('i')
+        self._next = array('i')
+
+    @classmethod
+    def load(cls, root: str, extensions=('.yml',)) -> "LocCorpus":
+        """Load every localisation file under root, in path order"""
+        corpus = cls()
+        paths = []
+        for folder, dirs, names in os.walk(root):
+            for name in names:
+                if name.lower().endswith(extensions):
+                    paths.append(os.path.join(folder, name))
+        for path in sorted(paths):
+            corpus.add_file(path, os.path.relpath(path, root))
+        return corpus
+
+    def add_file(self, path: str, name: Optional[str] = None) -> int:
+        """Add the entries of one file and return its file id; a file that cannot be decoded adds nothing"""
+        # Text mode numbers lines the way editors do, and reads much faster than codecs
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            lines = f.readlines()
+        return self.add_lines(lines, name if name is not None else path)
+
+    def add_lines(self, lines, name: str) -> int:
+        """Add the entries of lines read from the file called name and return its file id"""
+        file_id = len(self.files)
+        self.files.append(name)
+        key_ids, keys = self._key_ids, self.keys
+        key_first, key_last, next_entry = self._key_first, self._key_last, self._next
+        add_key, add_version, add_line = self._key.append, self._version.append, self._line.append
+        add_start, add_end = self._text_start.append, self._text_end.append
+        entry_id = len(self._key)
+        pieces = []
+        offset = 0
+        for number, line in enumerate(lines, 1):
+            match = parse_line(line)
+            key = match.group('key')
+            start = match.start('text')
+            if key is None or start == -1:
+                continue
+            key_id = key_ids.get(key)
+            if key_id is None:
+                key_id = key_ids[key] = len(keys)
+                keys.append(key)
+                key_first.append(entry_id)
+                key_last.append(entry_id)
+            else:
+                next_entry[key_last[key_id]] = entry_id
+                key_last[key_id] = entry_id
+            version = match.group('version')
+            text = line[start:match.end('text')]
+            pieces.append(text)
+
+            add_key(key_id)
+            add_version(int(version) if version else NO_VERSION)
+            add_line(number)
+            add_start(offset)
+            offset += len(text)
+            add_end(offset)
+            next_entry.append(-1)
+            entry_id += 1
+        self._texts.append(''.join(pieces))
+        self._file_start.append(entry_id)
+        return file_id
+
+    def __len__(self) -> int:
+        return len(self._key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._key_ids
+
+    def key_id(self, key: str) -> Optional[int]:
+        return self._key_ids.get(key)
+
+    def entries_of(self, key: str) -> List[int]:
+        """Ids of every entry of key, in load order"""
+        key_id = self._key_ids.get(key)
+        if key_id is None:
+            return []
+        entries = []
+        entry_id = self._key_first[key_id]
+        while entry_id != -1:
+            entries.append(entry_id)
+            entry_id = self._next[entry_id]
+        return entries
+
+    def file_entries(self, file_id: int) -> range:
+        """Ids of the entries of a file, in line order"""
+        return range(self._file_start[file_id], self._file_start[file_id + 1])
+
+    def file_of(self, entry_id: int) -> int:
+        """Id of the file an entry was read from"""
+        return bisect_right(self._file_start, entry_id) - 1
+
+    def key(self, entry_id: int) -> str:
+        return self.keys[self._key[entry_id]]
+
+    def version(self, entry_id: int) -> Optional[int]:
+        """The N of KEY:N, None for KEY:"""
+        version = self._version[entry_id]
+        return None if version == NO_VERSION else version
+
+    def text(self, entry_id: int) -> str:
+        return self._texts[self.file_of(entry_id)][self._text_start[entry_id]:self._text_end[entry_id]]
+
+    def location(self, entry_id: int) -> tuple:
+        """(file, line number) an entry was read from"""
+        return self.files[self.file_of(entry_id)], self._line[entry_id]
+
+    def entry(self, entry_id: int) -> LocEntry:
+        file, line = self.location(entry_id)
+        return LocEntry(entry_id, self.key(entry_id), self.version(entry_id), self.text(entry_id), file, line)
+
+    def find(self, key: str) -> Optional[LocEntry]:
+        """The first entry of key in load order"""
+        key_id = self._key_ids.get(key)
+        return None if key_id is None else self.entry(self._key_first[key_id])
+
+    def __iter__(self) -> Iterator[LocEntry]:
+        return (self.entry(entry_id) for entry_id in range(len(self)))
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the corpus: its arrays, texts, keys and file names"""
+        size = sum(column.buffer_info()[1] * column.itemsize for column in (
+            self._key, self._version, self._line, self._text_start, self._text_end,
+            self._file_start, self._key_first, self._key_last, self._next,
+        ))
+        size += sum(sys.getsizeof(text) for text in self._texts)
+        size += sum(sys.getsizeof(key) for key in self.keys) + sys.getsizeof(self._key_ids)
+        size += sum(sys.getsizeof(name) for name in self.files)
+        return size
@@ -0,0 +1,52 @@
+import re
+from typing import Optional
+
+NT_TAG = '#NT!'
+
+# Part of the settings of incremental state built from parsed lines, so that
+# outputs and stored entries are rebuilt when the way lines are parsed changes
+PARSER_SETTINGS = {"loc_parser": 1}
+
+# One localisation line such as ` KEY:0 "text" #NT!`, matched as a whole so the
+# match holds the offsets of its parts and nothing is copied out of the line:
+#   indent   the whitespace before the key
+#   key      KEY, when the line starts with KEY: or KEY:N
+#   version  N, empty for KEY:
+#   text     what follows the first quote of the line, unless a # comes
+#            before it, up to the last quote (quotes inside the text are
+#            kept, as the game reads them) or, if the quote is never closed,
+#            up to the end of the line
+#   close    the closing quote, None for an unterminated text
+#   comment  whatever follows the closing quote, such as #NT!, and the whole
+#            line for headers and comments
+#   nt       present when the line ends in #NT!
+# Groups that do not apply to a line are None, except indent and comment which
+# are always there; comment always ends where the content of the line does,
+# before any trailing whitespace and line break.
+LINE_PATTERN = re.compile(r'''
+    (?P<indent>[^\S\r\n]*)
+    (?:(?P<key>[^\s:#"]+):(?P<version>\d*)(?:[^\S\r\n]+(?=\S))?)?
+    (?:[^"#\r\n]*?"(?P<text>.*(?=")|.*?(?=\s*\Z))(?:(?P<close>")(?:[^\S\r\n]+(?=\S))?)?)?
+    (?P<comment>.*?)
+    (?P<nt>(?<=\#NT!))?
+    \s*\Z
+''', re.VERBOSE)
+
+# parse_line(line) -> re.Match with the groups above; every line matches
+parse_line = LINE_PATTERN.match
+
+
+def is_nt_line(line: str) -> bool:
+    """Whether a line ends in #NT!, without parsing the rest of it"""
+    return line.rstrip().endswith(NT_TAG)
+
+
+def is_entry(match: re.Match) -> bool:
+    """Whether a parsed line is a KEY:N "text" entry"""
+    return match.start('key') != -1 and match.start('text') != -1
+
+
+def entry_key(line: str) -> Optional[str]:
+    """The key of a KEY:N "text" entry, None for headers, comments and blanks"""
+    match = parse_line(line)
+    return match.group('key') if is_entry(match) else None
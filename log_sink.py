@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+import tkinter as tk
+from collections import deque
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# Size at which a log file is moved aside to <name>.1 when a sink opens it
+MAX_LOG_FILE_BYTES = 5 * 1024 * 1024
+
+
+def default_log_path(tool: str) -> str:
+    """Location of the full log of a tool, next to the persistent reshape cache"""
+    return os.path.join(os.path.expanduser("~"), ".hoi4_arabic_reshaper", "logs", f"{tool}.log")
+
+
+class LogEntry:
+    """A message posted to a LogSink, with how often it was repeated in a row"""
+    __slots__ = ("message", "level", "created", "options", "count")
+
+    def __init__(self, message: str, level: str, options: dict):
+        self.message = message
+        self.level = level
+        self.created = time.time()
+        self.options = options
+        self.count = 1
+
+    @property
+    def timestamp(self) -> str:
+        return time.strftime("%H:%M:%S", time.localtime(self.created))
+
+    @property
+    def text(self) -> str:
+        """The message with the number of repeats it stands for"""
+        return f"{self.message} (×{self.count})" if self.count > 1 else self.message
+
+
+def format_entry(entry: LogEntry) -> Sequence[Tuple[str, tuple]]:
+    """Default rendering: [HH:MM:SS] message, tagged with the level"""
+    return [(f"[{entry.timestamp}] {entry.text}\n", (entry.level,))]
+
+
+class LogSink:
+    """Thread-safe log of a Tk Text widget that is written in batches.
+
+    post() can be called from any thread. It only queues the message and
+    appends it to the log file, if there is one, which keeps every message.
+    On the Tk thread a timer drains the queue every interval_ms: consecutive
+    repeats of a message become one line with a repeat count, the batch is
+    inserted with a single widget update and the widget is trimmed to its
+    last max_lines lines. Messages posted on the Tk thread itself, e.g. by a
+    loop that has not handed its work to a background thread, are drained
+    and drawn at most once per interval as well.
+
+    The applications call close_file() when a run ends, so the log file is
+    not held open between runs, and close() when their window closes.
+
+    format_entry turns a LogEntry into (text, tags) pieces to insert.
+    read_only leaves the widget disabled after every batch.
+    """
+    def __init__(self, widget: tk.Text, format_entry: Callable[[LogEntry], Sequence[Tuple[str, tuple]]] = format_entry,
+                 max_lines: int = 2000, interval_ms: int = 100, log_path: Optional[str] = None,
+                 read_only: bool = False):
+        self.widget = widget
+        self.format_entry = format_entry
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self.read_only = read_only
+        self.log_path = log_path
+        self._closed = False
+        self._pending: deque = deque()
+        self._lock = threading.Lock()
+        self._tk_thread = threading.get_ident()
+        self._last_drain = 0.0
+        self._file = self._open_log_file(log_path) if log_path else None
+        self._timer = None
+        self._schedule()
+
+    @staticmethod
+    def _open_log_file(path: str):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) > MAX_LOG_FILE_BYTES:
+                os.replace(path, path + ".1")
+            return open(path, 'a', encoding='utf-8')
+        except OSError:
+            # The window log still works without a log file
+            return None
+
+    def post(self, message: str, level: str = "info", **options):
+        """Queue a message for the widget; options are passed on to format_entry through the entry"""
+        entry = LogEntry(message, level, options)
+        with self._lock:
+            self._pending.append(entry)
+            if self._file is None and self.log_path is not None and not self._closed:
+                # Opened again after close_file(); a file that cannot be opened is not tried again
+                self._file = self._open_log_file(self.log_path)
+                if self._file is None:
+                    self.log_path = None
+            if self._file is not None:
+                created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.created))
+                self._file.write(f"{created} {level.upper():<7} {message}\n")
+        if threading.get_ident() == self._tk_thread and \
+                time.monotonic() - self._last_drain >= self.interval_ms / 1000:
+            self.drain()
+            self.widget.update_idletasks()
+
+    def _take(self) -> List[LogEntry]:
+        """Remove the queued entries, merging consecutive repeats"""
+        with self._lock:
+            entries = list(self._pending)
+            self._pending.clear()
+            if self._file is not None:
+                self._file.flush()
+        merged: List[LogEntry] = []
+        for entry in entries:
+            previous = merged[-1] if merged else None
+            if previous is not None and previous.message == entry.message and previous.level == entry.level \
+                    and previous.options == entry.options:
+                previous.count += 1
+            else:
+                merged.append(entry)
+        return merged
+
+    def drain(self):
+        """Insert everything queued into the widget; must run on the Tk thread"""
+        self._last_drain = time.monotonic()
+        entries = self._take()
+        if not entries:
+            return
+        widget = self.widget
+        state = widget.cget("state")
+        if state == "disabled":
+            widget.configure(state="normal")
+        for entry in entries:
+            for text, tags in self.format_entry(entry):
+                widget.insert("end", text, tags)
+
+        # Keep the last max_lines lines; "end-1c" is on the last, empty line
+        lines = int(widget.index("end-1c").split('.')[0]) - 1
+        if lines > self.max_lines:
+            widget.delete("1.0", f"{lines - self.max_lines + 1}.0")
+        widget.see("end")
+        if self.read_only or state == "disabled":
+            widget.configure(state="disabled")
+
+    def _schedule(self):
+        try:
+            self._timer = self.widget.after(self.interval_ms, self._tick)
+        except tk.TclError:
+            # The widget is gone
+            self._timer = None
+
+    def _tick(self):
+        try:
+            self.drain()
+        except tk.TclError:
+            return
+        self._schedule()
+
+    def close_file(self):
+        """Close the log file until the next message, e.g. when a run ends; the widget keeps logging"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def close(self):
+        """Stop the timer, write out what is queued and close the log file for good"""
+        self._closed = True
+        if self._timer is not None:
+            try:
+                self.widget.after_cancel(self._timer)
+                self.drain()
+            except tk.TclError:
+                pass
+            self._timer = None
+        self.close_file()
@@ -0,0 +1,48 @@
+import codecs
+import shutil
+from streaming import DEFAULT_CHUNK_LINES, read_chunks, replace_on_success
+from run_report import timer
+
+
+def fix_newlines_in_file(input_path, output_path, chunk_lines=DEFAULT_CHUNK_LINES, report=None):
+    """Replace _ن and \\ن with \\n, write the result with a BOM and return the number replaced.
+    
+    With a FileReport the time spent reading, replacing and writing, the file
+    sizes and the number of replacements are recorded.
+    """
+    total_original = 0
+    line_count = 0
+    
+    # Neither pattern spans a line break, so the file can be fixed a chunk of lines at a time
+    with replace_on_success(output_path) as temp_path:
+        with codecs.open(input_path, 'r', encoding='utf-8-sig') as infile, \
+                codecs.open(temp_path, 'w', encoding='utf-8-sig') as outfile:
+            for lines in read_chunks(infile, chunk_lines, report):
+                line_count += len(lines)
+                with timer(report, "scan"):
+                    content = ''.join(lines)
+                    
+                    count_underscore = content.count('_ن')
+                    count_backslash = content.count('\\ن')
+                    total_original += count_underscore + count_backslash
+                    
+                    content = content.replace('_ن', '\\n')
+                    content = content.replace('\\ن', '\\n')
+                with timer(report, "write"):
+                    outfile.write(content)
+        
+    if report is not None:
+        report.count("replacements", total_original)
+        report.finish(input_path, output_path, line_count)
+    return total_original
+
+
+def fix_or_copy_file(input_path, output_path, report=None):
+    """Fix input_path into output_path, copying it unchanged when there is nothing to fix"""
+    replacements = fix_newlines_in_file(input_path, output_path, report=report)
+    if replacements == 0:
+        with timer(report, "write"):
+            shutil.copy2(input_path, output_path)
+        if report is not None:
+            report.finish(input_path, output_path, report.lines)
+    return replacements
@@ -0,0 +1,39 @@
+from typing import Optional, Dict, List
+from loc_parser import is_nt_line
+from reshaper import ArabicReshaper, run_file_job, warm_up
+
+class ArabicNTReshaper(ArabicReshaper):
+    """ArabicReshaper for the lines ending with #NT! only, every other line is kept as it is"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Running total of #NT! lines seen
+        self.nt_lines = 0
+        
+    def counters(self) -> Dict[str, int]:
+        counters = super().counters()
+        counters["nt_lines"] = self.nt_lines
+        return counters
+        
+    def process_line(self, line: str) -> str:
+        """Process a single line of text if it ends with #NT!"""
+        # Skip lines that don't end with #NT!
+        if not is_nt_line(line):
+            return line
+        return super().process_line(line)
+        
+    def process_lines(self, lines: List[str], selected: Optional[List[bool]] = None) -> List[str]:
+        """Process the #NT! lines of many lines at once, reshaping every distinct Arabic run only once"""
+        if selected is None:
+            selected = [is_nt_line(line) for line in lines]
+        return super().process_lines(lines, selected)
+        
+    def select_lines(self, lines: List[str]) -> List[bool]:
+        # Each line is checked for the tag once, for the count and for processing
+        nt_flags = [is_nt_line(line) for line in lines]
+        self.nt_lines += sum(nt_flags)
+        return nt_flags
+
+def process_file_job(input_path: str, output_path: str, report=None,
+                     **settings) -> tuple[int, float, Dict[str, int]]:
+    """run_file_job with an ArabicNTReshaper"""
+    return run_file_job(ArabicNTReshaper, input_path, output_path, report, **settings)
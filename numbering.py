@@ -1,10 +1,13 @@
 import os
-import codecs
-import re
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from tkinter.scrolledtext import ScrolledText
-from datetime import datetime
+from renumbering import renumber_file
+from key_index import shared_index
+from run_report import FileReport, RunReport, default_report_path
+from log_sink import LogSink, default_log_path
+from job_runner import JobRunner
+from progress import ProgressTracker, file_size
 
 class ModernTheme:
     # Modern dark theme colors
@@ -35,6 +38,7 @@ class TranslationProcessor:
         self.output_folder = tk.StringVar()
         
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
     def setup_styles(self):
         style = ttk.Style()
@@ -143,13 +147,17 @@ class TranslationProcessor:
                                           maximum=100,
                                           style="Modern.Horizontal.TProgressbar",
                                           length=300)
-        self.progress_bar.pack(fill=tk.X, pady=(0, 10))
+        self.progress_bar.pack(fill=tk.X, pady=(0, 5))
+        
+        # Rate and ETA
+        self.status_label = ttk.Label(process_frame, text="", style="Modern.TLabel")
+        self.status_label.pack(fill=tk.X, pady=(0, 10))
         
         # Process button
-        process_btn = self.RoundedButton(process_frame,
+        self.process_button = self.RoundedButton(process_frame,
                                text="Process Files",
                                command=self.start_processing)
-        process_btn.pack(pady=5)
+        self.process_button.pack(pady=5)
         
         # Log section
         log_frame = ttk.LabelFrame(main_frame,
@@ -168,6 +176,13 @@ class TranslationProcessor:
                                    insertbackground=ModernTheme.FG)
         self.log_text.pack(fill=tk.BOTH, expand=True)
         
+        # Color coding based on message level
+        for level, color in (("info", ModernTheme.FG), ("success", ModernTheme.SUCCESS),
+                             ("error", ModernTheme.ERROR), ("warning", ModernTheme.WARNING)):
+            self.log_text.tag_config(level, foreground=color)
+        self.log_sink = LogSink(self.log_text, self.format_log_entry, log_path=default_log_path("numbering"))
+        self.runner = JobRunner(self.root, self.show_progress, controls=[self.process_button])
+        
     def create_folder_entry(self, parent, label_text, var, row):
         container = ttk.Frame(parent, style="Modern.TFrame")
         container.pack(fill=tk.X, pady=5)
@@ -214,22 +229,16 @@ class TranslationProcessor:
             var.set(folder)
             
     def log_message(self, message, level="info"):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        # Color coding based on message level
-        colors = {
-            "info": ModernTheme.FG,
-            "success": ModernTheme.SUCCESS,
-            "error": ModernTheme.ERROR,
-            "warning": ModernTheme.WARNING
-        }
+        # Queued and drawn in batches; safe to call from any thread
+        self.log_sink.post(message, level)
         
-        self.log_text.tag_config(level, foreground=colors.get(level, ModernTheme.FG))
+    def format_log_entry(self, entry):
+        return [(f"[{entry.timestamp}] ", ("info",)), (f"{entry.text}\n", (entry.level,))]
         
-        self.log_text.insert(tk.END, f"[{timestamp}] ", "info")
-        self.log_text.insert(tk.END, f"{message}\n", level)
-        self.log_text.see(tk.END)
-        self.root.update()
+    def show_progress(self, done, total, current):
+        # Progress is measured in bytes, so big files move the bar as much as they take
+        self.progress_var.set(done / total * 100 if total else 100)
+        self.status_label.config(text=current)
         
     def start_processing(self):
         # Validate folders
@@ -237,17 +246,26 @@ class TranslationProcessor:
             messagebox.showerror("Error", "Please select all folders first")
             return
             
-        try:
-            self.process_files()
-            messagebox.showinfo("Success", "Processing completed successfully!")
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+        # The files are processed on a background thread, which keeps the window responsive
+        self.runner.start(
+            self.process_files, self.original_folder.get(), self.translated_folder.get(), self.output_folder.get(),
+            on_done=self.on_processing_done, on_error=self.on_processing_error
+        )
+        
+    def on_processing_done(self, result):
+        messagebox.showinfo("Success", "Processing completed successfully!")
+        self.log_sink.close_file()
+        
+    def on_processing_error(self, e):
+        messagebox.showerror("Error", f"An error occurred: {str(e)}")
+        self.log_sink.close_file()
+        
+    def on_closing(self):
+        self.log_sink.close()
+        self.root.destroy()
             
-    def process_files(self):
-        original_folder = self.original_folder.get()
-        translated_folder = self.translated_folder.get()
-        output_folder = self.output_folder.get()
-        
+    def process_files(self, original_folder, translated_folder, output_folder):
+        """Renumber every translated file from the original key index; runs on the job runner's thread"""
         # Create output folder if needed
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
@@ -255,74 +273,64 @@ class TranslationProcessor:
             
         self.log_message("Starting to process files...", "info")
         
+        # Index the keys of the whole original tree; only files changed since the last run are read
+        index = shared_index(original_folder, refresh=True)
+        for rel_path, error in index.errors.items():
+            self.log_message(f"Could not read original file {rel_path}, its keys are left out: {error}", "error")
+        self.log_message(f"Indexed {len(index)} keys in {len(index.files)} original files", "info")
+        
         # Get list of files
-        original_files = os.listdir(original_folder)
-        translated_files = os.listdir(translated_folder)
-        matching_files = [f for f in original_files if f in translated_files]
+        matching_files = sorted(
+            os.path.relpath(os.path.join(root, name), translated_folder)
+            for root, dirs, names in os.walk(translated_folder)
+            for name in names if name.lower().endswith('.yml')
+        )
         
         if not matching_files:
-            self.log_message("No matching files found in both folders!", "warning")
+            self.log_message("No .yml files found in the translated folder!", "warning")
             return
             
         self.log_message(f"Found {len(matching_files)} files to process", "info")
         
         # Update progress bar setup
-        self.progress_var.set(0)
-        total_files = len(matching_files)
-        
-        for index, filename in enumerate(matching_files):
+        sizes = {filename: file_size(os.path.join(translated_folder, filename)) for filename in matching_files}
+        tracker = ProgressTracker(sum(sizes.values()), len(matching_files))
+        self.runner.progress(0, tracker.total_bytes)
+        run_report = RunReport("numbering")
+        for rel_path, error in index.errors.items():
+            run_report.add_error(os.path.join(original_folder, rel_path), error)
+        
+        for filename in matching_files:
             self.log_message(f"Processing {filename}...", "info")
             
             try:
-                # Read original file to get the numbers
-                number_dict = {}
-                with codecs.open(os.path.join(original_folder, filename), 'r', 'utf-8-sig') as f:
-                    for line in f:
-                        if ':' in line and '"' in line:
-                            parts = line.split(':', 1)
-                            if len(parts) == 2:
-                                key = parts[0].strip()
-                                match = re.search(r':(\d+)\s*"', line)
-                                if match:
-                                    number_dict[key] = match.group(1)
-
-                # Process translated file
-                output_lines = []
-                with codecs.open(os.path.join(translated_folder, filename), 'r', 'utf-8-sig') as f:
-                    for line in f:
-                        if not line.strip() or 'l_english' in line:
-                            output_lines.append(line)
-                            continue
-                        
-                        if ':' in line and '"' in line:
-                            parts = line.split(':', 1)
-                            if len(parts) == 2:
-                                key = parts[0].strip()
-                                if key in number_dict:
-                                    match = re.search(r'"([^"]*)"', line)
-                                    if match:
-                                        translated_text = match.group(1)
-                                        new_line = f' {key}:{number_dict[key]} "{translated_text}"\n'
-                                        output_lines.append(new_line)
-                                        continue
-                        
-                        output_lines.append(line)
-
-                # Write output file
+                # Copy the numbers of the original keys over to the translated file
+                file_report = FileReport(filename)
                 output_path = os.path.join(output_folder, filename)
-                with codecs.open(output_path, 'w', 'utf-8-sig') as f:
-                    f.writelines(output_lines)
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                renumber_file(
+                    None,
+                    os.path.join(translated_folder, filename),
+                    output_path,
+                    report=file_report,
+                    number_dict=index.numbers_for(filename)
+                )
+                run_report.add(file_report)
+                tracker.add(sizes[filename], file_report.lines)
                 
                 self.log_message(f"Successfully processed {filename}", "success")
                 
             except Exception as e:
+                tracker.skip(sizes[filename])
                 self.log_message(f"Error processing {filename}: {str(e)}", "error")
-                continue
+                run_report.add_error(filename, e)
                 
             # Update progress
-            progress = (index + 1) / total_files * 100
-            self.progress_var.set(progress)
+            self.runner.progress(tracker.done_bytes, tracker.total_bytes, tracker.status())
             
+        report_path = default_report_path(output_folder, "numbering")
+        run_report.write(report_path)
+        self.log_message(f"Run report: {report_path}", "info")
         self.log_message("Processing completed successfully!", "success")
 
 def main():
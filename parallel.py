@@ -0,0 +1,60 @@
+import os
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+
+def default_workers() -> int:
+    """Number of worker processes to use when none is configured"""
+    return os.cpu_count() or 1
+
+
+def run_jobs(job: Callable, tasks: Iterable[tuple], workers: int = 1,
+             control=None) -> Iterator[Tuple[tuple, object, Optional[Exception]]]:
+    """Run job(*task) for every task and yield (task, result, error) as each one finishes.
+
+    With a single worker the tasks run in order in the calling process. With more
+    workers they are sent to a process pool and yielded in completion order, so the
+    caller can report progress while the rest of the pool is still busy. The job
+    must be a module-level function so it can be pickled.
+
+    With a run_control.RunControl no new task is started while the run is paused,
+    and once it is cancelled the tasks already running are yielded and the rest
+    are dropped.
+    """
+    tasks = list(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            if control is not None and not control.wait():
+                return
+            try:
+                yield task, job(*task), None
+            except Exception as e:
+                yield task, None, e
+        return
+
+    # Loading the process pool pulls in multiprocessing, so only do it when it is used
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    workers = min(workers, len(tasks))
+    pending = iter(tasks)
+    exhausted = False
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        while True:
+            # Keep every worker busy with one task queued behind it, unless paused or cancelled
+            while not exhausted and len(futures) < 2 * workers and \
+                    (control is None or not (control.paused or control.cancelled)):
+                task = next(pending, None)
+                if task is None:
+                    exhausted = True
+                    break
+                futures[executor.submit(job, *task)] = task
+            if not futures:
+                if exhausted or not control.wait():
+                    return
+                continue
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = futures.pop(future)
+                try:
+                    yield task, future.result(), None
+                except Exception as e:
+                    yield task, None, e
@@ -0,0 +1,376 @@
+import os
+import codecs
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+from parallel import run_jobs
+from streaming import DEFAULT_CHUNK_LINES, read_chunks, replace_on_success
+from run_report import FileReport, report_job, timer
+from renumbering import renumber_line
+from key_index import shared_index
+from reshape_cache import DEFAULT_CACHE_SIZE
+from reshaper import ArabicReshaper
+from nt_reshaper import ArabicNTReshaper
+from rtl_processor import ArabicProcessor
+import rtl_nt_processor
+
+BOM = '\ufeff'
+
+
+def split_codecs_lines(pieces: Iterable[str]) -> Iterator[str]:
+    """Regroup text into lines the way iterating a codecs reader splits it (str.splitlines)"""
+    pending = ''
+    for piece in pieces:
+        pending += piece
+        lines = pending.splitlines(True)
+        pending = ''
+        # Hold back an unterminated line, or a \r that may be the first half of \r\n
+        if lines and (lines[-1].endswith('\r') or lines[-1].splitlines()[0] == lines[-1]):
+            pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def split_text_lines(pieces: Iterable[str]) -> Iterator[str]:
+    """Regroup text into lines the way a file opened in text mode reads it, with \\r\\n and \\r read as \\n"""
+    pending = ''
+    for piece in pieces:
+        pending += piece
+        held = '\r' if pending.endswith('\r') else ''
+        if held:
+            pending = pending[:-1]
+        parts = pending.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        pending = parts.pop() + held
+        for part in parts:
+            yield part + '\n'
+    if pending:
+        yield pending.replace('\r', '\n')
+
+
+class Stage:
+    """One tool's transformation of a file, applied to a stream of decoded lines.
+
+    Lines carry any BOM as a leading U+FEFF, the way a plain UTF-8 reader sees
+    it. read_mode says how the tool splits its input into lines: "codecs" for
+    codecs.open and "text" for open() in text mode. strip_bom is set for tools
+    that read with utf-8-sig and add_bom for tools that write a BOM.
+    """
+    name = ""
+    read_mode = "codecs"
+    strip_bom = False
+    add_bom = False
+
+    def accepts(self, input_path: str, rel_path: str) -> bool:
+        """Return True if the tool would pick up this file when walking its input folder"""
+        return rel_path.lower().endswith('.yml')
+
+    def start(self, input_path: str, rel_path: str):
+        """Prepare for a new file"""
+
+    def refresh(self):
+        """Pick up changes to files the stage reads besides its input, such as the original files"""
+
+    def process(self, lines: List[str]) -> List[str]:
+        """Transform a chunk of lines"""
+        raise NotImplementedError
+
+    def finish(self, report: Optional[FileReport] = None):
+        """Called once a file has been written, with the file's report if there is one"""
+
+    def apply(self, pieces: Iterable[str], chunk_lines: int = DEFAULT_CHUNK_LINES,
+              report: Optional[FileReport] = None) -> Iterator[str]:
+        """Run the stage over a stream of text, yielding the text the tool would have written.
+
+        With a FileReport the time spent in process() is added to the stage's name.
+        """
+        lines = split_text_lines(pieces) if self.read_mode == "text" else split_codecs_lines(pieces)
+        lines = iter(lines)
+        first_chunk = True
+        for chunk in read_chunks(lines, chunk_lines):
+            if self.strip_bom and first_chunk and chunk[0].startswith(BOM):
+                chunk[0] = chunk[0][1:]
+                if not chunk[0]:
+                    del chunk[0]
+            with timer(report, self.name):
+                output = self.process(chunk) if chunk else []
+            if self.add_bom and first_chunk:
+                if output:
+                    output[0] = BOM + output[0]
+                else:
+                    output = [BOM]
+            first_chunk = False
+            yield from output
+        if first_chunk and self.add_bom:
+            yield BOM
+
+
+class NumberingStage(Stage):
+    """numbering.py: copy version numbers over from the key index of the original files"""
+    name = "numbering"
+    strip_bom = True
+    add_bom = True
+
+    def __init__(self, original_dir: str):
+        self.original_dir = original_dir
+        self.index = shared_index(original_dir)
+        self.number_dict: Mapping[str, str] = {}
+
+    def start(self, input_path, rel_path):
+        self.number_dict = self.index.numbers_for(rel_path)
+
+    def refresh(self):
+        self.index = shared_index(self.original_dir, refresh=True)
+
+    def process(self, lines):
+        number_dict = self.number_dict
+        return [renumber_line(line, number_dict) for line in lines]
+
+
+class FixNewlinesStage(Stage):
+    """fixingN.py: turn _ن and \\ن back into \\n"""
+    name = "fix_newlines"
+    PATTERNS = ('_ن', '\\ن')
+
+    def accepts(self, input_path, rel_path):
+        return "processed_yml" not in os.path.dirname(input_path) and rel_path.lower().endswith('.yml')
+
+    def start(self, input_path, rel_path):
+        # The tool copies files without any match unchanged and rewrites the rest
+        # with a BOM. Numbering always writes a BOM, so only the raw input decides
+        # whether one is added.
+        changed = self._contains_pattern(input_path)
+        self.strip_bom = changed
+        self.add_bom = changed
+
+    def _contains_pattern(self, path: str) -> bool:
+        needles = [pattern.encode('utf-8') for pattern in self.PATTERNS]
+        overlap = max(len(needle) for needle in needles) - 1
+        tail = b''
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                data = tail + block
+                if any(needle in data for needle in needles):
+                    return True
+                tail = data[-overlap:]
+        return False
+
+    def process(self, lines):
+        return [line.replace('_ن', '\\n').replace('\\ن', '\\n') for line in lines]
+
+
+class ReshapeStage(Stage):
+    """arabic_reshaper_app.py: reshape and reorder every Arabic run"""
+    name = "reshape"
+    add_bom = True
+    extensions = ('.txt', '.yml', '.yaml')
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE, cache_path: Optional[str] = None):
+        self.reshaper = self._create_reshaper(cache_size, cache_path)
+        self.counters: Dict[str, int] = {}
+
+    def _create_reshaper(self, cache_size, cache_path):
+        return ArabicReshaper(cache_size=cache_size, cache_path=cache_path)
+
+    def accepts(self, input_path, rel_path):
+        return rel_path.endswith(self.extensions)
+
+    def start(self, input_path, rel_path):
+        self.counters = self.reshaper.counters()
+
+    def process(self, lines):
+        return self.reshaper.process_chunk(lines)
+
+    def finish(self, report=None):
+        self.reshaper.cache.flush()
+        if report is not None:
+            for name, value in self.reshaper.counters().items():
+                report.count(name, value - self.counters.get(name, 0))
+
+
+class NTReshapeStage(ReshapeStage):
+    """arabic_nt_reshaper.py: reshape the Arabic runs of lines tagged #NT!"""
+    name = "nt_reshape"
+    extensions = ('.yml', '.yaml')
+
+    def _create_reshaper(self, cache_size, cache_path):
+        return ArabicNTReshaper(cache_size=cache_size, cache_path=cache_path)
+
+
+class RTLStage(Stage):
+    """rtl.py: reverse the word order of Arabic entries"""
+    name = "rtl"
+    read_mode = "text"
+
+    def process(self, lines):
+        lines = ArabicProcessor.process_yml_lines(lines)
+        # The tool writes in text mode, which translates newlines on Windows
+        if os.linesep != '\n':
+            lines = [line.replace('\n', os.linesep) for line in lines]
+        return lines
+
+
+class RTLNTStage(Stage):
+    """rtl_nt.py: reverse the word order of entries tagged #NT!"""
+    name = "rtl_nt"
+    read_mode = "text"
+    strip_bom = True
+    add_bom = True
+
+    def process(self, lines):
+        return rtl_nt_processor.process_yml_lines(lines)
+
+
+# Stages in the order the tools are meant to be run in
+STAGE_ORDER = ("numbering", "fix_newlines", "reshape", "nt_reshape", "rtl", "rtl_nt")
+
+
+def check_stages(names: Iterable[str], original_dir: Optional[str] = None):
+    """Raise ValueError unless the named stages can be created with these settings"""
+    names = set(names)
+    unknown = names.difference(STAGE_ORDER)
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages: {', '.join(sorted(unknown))}")
+    if not names:
+        raise ValueError("No pipeline stages selected")
+    if "numbering" in names and not original_dir:
+        raise ValueError("The numbering stage needs the folder of original files")
+
+
+def create_stages(names: Iterable[str], original_dir: Optional[str] = None, cache_size: int = DEFAULT_CACHE_SIZE,
+                  cache_path: Optional[str] = None) -> List[Stage]:
+    """Create the named stages in tool order"""
+    names = set(names)
+    check_stages(names, original_dir)
+
+    stages = []
+    for name in STAGE_ORDER:
+        if name not in names:
+            continue
+        if name == "numbering":
+            stages.append(NumberingStage(original_dir))
+        elif name == "fix_newlines":
+            stages.append(FixNewlinesStage())
+        elif name == "reshape":
+            stages.append(ReshapeStage(cache_size, cache_path))
+        elif name == "nt_reshape":
+            stages.append(NTReshapeStage(cache_size, cache_path))
+        elif name == "rtl":
+            stages.append(RTLStage())
+        else:
+            stages.append(RTLNTStage())
+    return stages
+
+
+class Pipeline:
+    """Several tools fused into a single read and write per file.
+
+    Each file is decoded once, streamed through every stage a chunk of lines at
+    a time and only the final result is written. The output is the same as
+    running the tools one after another, each on the previous tool's output.
+    """
+    def __init__(self, stages: List[Stage], chunk_lines: int = DEFAULT_CHUNK_LINES):
+        self.stages = stages
+        self.chunk_lines = chunk_lines
+
+    def accepts(self, input_path: str, rel_path: str) -> bool:
+        """Return True if every tool in the chain would process this file"""
+        return all(stage.accepts(input_path, rel_path) for stage in self.stages)
+
+    def find_files(self, input_dir: str, output_dir: str) -> List[Tuple[str, str, str]]:
+        """List (input path, output path, relative path) for every file the pipeline processes"""
+        files = []
+        for root, dirs, names in os.walk(input_dir):
+            for name in names:
+                input_path = os.path.join(root, name)
+                rel_path = os.path.relpath(input_path, input_dir)
+                if self.accepts(input_path, rel_path):
+                    files.append((input_path, os.path.join(output_dir, rel_path), rel_path))
+        return files
+
+    def process_file(self, input_path: str, output_path: str, rel_path: Optional[str] = None,
+                     report: Optional[FileReport] = None) -> int:
+        """Run one file through all stages and return the number of lines read.
+
+        With a FileReport the time spent reading, in each stage and writing, the
+        file sizes and the reshape counters are recorded.
+        """
+        rel_path = rel_path if rel_path is not None else os.path.basename(input_path)
+        for stage in self.stages:
+            with timer(report, stage.name):
+                stage.start(input_path, rel_path)
+
+        line_count = 0
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with replace_on_success(output_path) as temp_path:
+            with codecs.open(input_path, 'r', 'utf-8') as infile, open(temp_path, 'wb') as outfile:
+                def counted(lines):
+                    nonlocal line_count
+                    for chunk in read_chunks(lines, self.chunk_lines, report):
+                        line_count += len(chunk)
+                        yield from chunk
+
+                stream = counted(infile)
+                for stage in self.stages:
+                    stream = stage.apply(stream, self.chunk_lines, report)
+                for chunk in read_chunks(stream, self.chunk_lines):
+                    data = ''.join(chunk).encode('utf-8')
+                    with timer(report, "write"):
+                        outfile.write(data)
+
+        for stage in self.stages:
+            stage.finish(report)
+        if report is not None:
+            report.finish(input_path, output_path, line_count)
+        return line_count
+
+
+_worker_pipeline = None
+_worker_settings = None
+_worker_pid = None
+
+def process_file_job(input_path: str, output_path: str, rel_path: str, report: Optional[FileReport] = None,
+                     **settings) -> int:
+    """Run one file through a pipeline inside a pool worker, reusing one pipeline per process.
+
+    The settings are stages, original_dir, cache_size, cache_path and chunk_lines.
+    Returns the number of lines read and fills in the optional FileReport.
+    """
+    global _worker_pipeline, _worker_settings, _worker_pid
+    if _worker_pipeline is None or _worker_pid != os.getpid() or _worker_settings != settings:
+        options = dict(settings)
+        chunk_lines = options.pop("chunk_lines", DEFAULT_CHUNK_LINES)
+        _worker_pipeline = Pipeline(create_stages(options.pop("stages"), **options), chunk_lines)
+        _worker_settings = settings
+        _worker_pid = os.getpid()
+    return _worker_pipeline.process_file(input_path, output_path, rel_path, report)
+
+
+def run_pipeline(input_dir: str, output_dir: str, stages: Iterable[str], workers: int = 1,
+                 on_files: Optional[Callable[[List[Tuple[str, str, str]]], None]] = None,
+                 **settings) -> Iterator[Tuple[str, Optional[int], Optional[Exception], Optional[Dict]]]:
+    """Run the named stages over every matching file of input_dir.
+
+    Yields (relative path, lines read, error, report) as each file finishes,
+    where report is the file's FileReport as a dict. on_files, if given, is
+    called with the (input path, output path, relative path) of every file
+    before the first one is processed. The settings are passed on to
+    create_stages, plus an optional chunk_lines.
+    """
+    stages = tuple(name for name in STAGE_ORDER if name in set(stages))
+    options = {key: value for key, value in settings.items() if key != "chunk_lines"}
+    pipeline = Pipeline(create_stages(stages, **options))
+    # Bring the key index up to date once, before any worker starts using it
+    for stage in pipeline.stages:
+        stage.refresh()
+    files = pipeline.find_files(input_dir, output_dir)
+    if on_files is not None:
+        on_files(files)
+    for (input_path, output_path, rel_path), result, error in run_jobs(
+        partial(report_job, partial(process_file_job, stages=stages, **settings)), files, workers
+    ):
+        if error is not None:
+            yield rel_path, None, error, None
+        else:
+            lines, report = result
+            report["path"] = rel_path
+            yield rel_path, lines, None, report
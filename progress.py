@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Iterable, Optional
+
+
+def file_size(path: str) -> int:
+    """Bytes of a file, 0 if it cannot be read"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def total_size(paths: Iterable[str]) -> int:
+    return sum(file_size(path) for path in paths)
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def format_count(value: float) -> str:
+    """1234567 -> 1.2M, 12345 -> 12.3k"""
+    for limit, suffix in ((1e6, "M"), (1e3, "k")):
+        if value >= limit:
+            return f"{value / limit:.1f}{suffix}"
+    return f"{value:.0f}"
+
+
+class ProgressTracker:
+    """Progress of a run weighted by file size, with a rolling rate and an ETA.
+
+    total_bytes is the size of every file of the run, taken when the files
+    are listed. Each file adds its size when it is done, so a large file
+    moves the progress as much as it costs. The lines and bytes per second
+    are measured over the last window seconds of processed files; skipped
+    files count as done without taking part in the rate, and the ETA is the
+    remaining bytes at that rate. Files can be added from any thread.
+    """
+    def __init__(self, total_bytes: int, total_files: int = 0, window: float = 5.0):
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.window = window
+        self.done_bytes = 0
+        self.done_files = 0
+        self._processed_bytes = 0
+        self._processed_lines = 0
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        # (time, processed bytes, processed lines) after each file within the window
+        self._samples: deque = deque([(self._start, 0, 0)])
+
+    def add(self, size: int, lines: int = 0):
+        """Record a processed file of size bytes and lines lines"""
+        now = time.monotonic()
+        with self._lock:
+            self.done_bytes += size
+            self.done_files += 1
+            self._processed_bytes += size
+            self._processed_lines += lines
+            self._samples.append((now, self._processed_bytes, self._processed_lines))
+            # Keep one sample older than the window as the start of the rate
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                self._samples.popleft()
+
+    def skip(self, size: int):
+        """Record a file that was done without processing, e.g. because it was up to date"""
+        with self._lock:
+            self.done_bytes += size
+            self.done_files += 1
+
+    @property
+    def fraction(self) -> float:
+        if self.total_bytes:
+            return min(1.0, self.done_bytes / self.total_bytes)
+        return self.done_files / self.total_files if self.total_files else 0.0
+
+    def rates(self):
+        """Rolling (lines per second, bytes per second)"""
+        now = time.monotonic()
+        with self._lock:
+            start, start_bytes, start_lines = self._samples[0]
+            processed_bytes, processed_lines = self._processed_bytes, self._processed_lines
+        elapsed = now - start
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (processed_lines - start_lines) / elapsed, (processed_bytes - start_bytes) / elapsed
+
+    def eta(self) -> Optional[float]:
+        """Seconds until the remaining bytes are done at the current rate, None before there is a rate"""
+        lines_per_sec, bytes_per_sec = self.rates()
+        remaining = max(0, self.total_bytes - self.done_bytes)
+        if not remaining:
+            return 0.0
+        return remaining / bytes_per_sec if bytes_per_sec else None
+
+    def status(self) -> str:
+        """e.g. 42% · 12.3k lines/s · 4.56 MB/s · ETA 0:42"""
+        lines_per_sec, bytes_per_sec = self.rates()
+        eta = self.eta()
+        return (f"{self.fraction:.0%} · {format_count(lines_per_sec)} lines/s · {bytes_per_sec / 1e6:.2f} MB/s · "
+                f"ETA {format_duration(eta) if eta is not None else '-'}")
@@ -0,0 +1,52 @@
+import codecs
+from loc_parser import parse_line
+from streaming import DEFAULT_CHUNK_LINES, stream_lines, replace_on_success
+from run_report import timer
+
+def load_numbers(original_path):
+    """Map every key of an original localisation file to its version number"""
+    number_dict = {}
+    with codecs.open(original_path, 'r', 'utf-8-sig') as f:
+        for line in f:
+            # Entries written as KEY:N "text"
+            match = parse_line(line)
+            version = match.group('version')
+            if version and match.start('text') != -1:
+                number_dict[match.group('key')] = version
+    return number_dict
+
+def renumber_line(line, number_dict):
+    """Give a translated line the version number its key has in the original file.
+    
+    The quoted text and anything after it, such as a #NT! tag, are kept as they are.
+    """
+    match = parse_line(line)
+    key = match.group('key')
+    if key is None or match.start('close') == -1 or key not in number_dict:
+        return line
+    return f' {key}:{number_dict[key]} {line[match.start("text") - 1:match.end("comment")]}\n'
+
+def renumber_file(original_path, translated_path, output_path, chunk_lines=DEFAULT_CHUNK_LINES, report=None,
+                  number_dict=None):
+    """Write translated_path to output_path with the version numbers of original_path and return the line count.
+    
+    With a number_dict, such as KeyIndex.numbers_for() gives, original_path is
+    not read and may be None. With a FileReport the time spent loading the
+    original, reading, renumbering and writing and the file sizes are recorded.
+    """
+    if number_dict is None:
+        with timer(report, "load"):
+            number_dict = load_numbers(original_path)
+    
+    def process_chunk(lines):
+        with timer(report, "scan"):
+            return [renumber_line(line, number_dict) for line in lines]
+    
+    with replace_on_success(output_path) as temp_path:
+        with codecs.open(translated_path, 'r', 'utf-8-sig') as infile, \
+                codecs.open(temp_path, 'w', 'utf-8-sig') as outfile:
+            line_count = stream_lines(infile, outfile, process_chunk, chunk_lines, report)
+    if report is not None:
+        report.count("original_keys", len(number_dict))
+        report.finish(translated_path, output_path, line_count)
+    return line_count
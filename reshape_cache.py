@@ -0,0 +1,191 @@
+import os
+import json
+import sqlite3
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+# Distinct runs kept in memory by each reshaper and reorder engine, a few MB of strings
+DEFAULT_CACHE_SIZE = 65536
+
+
+def library_versions() -> Dict[str, str]:
+    """Versions of the shaping libraries that reshaped output depends on"""
+    # Imported here as it is slow to load and only needed once a run starts
+    import importlib.metadata
+    versions = {}
+    for dist in ("arabic-reshaper", "python-bidi"):
+        try:
+            versions[dist] = importlib.metadata.version(dist)
+        except importlib.metadata.PackageNotFoundError:
+            versions[dist] = "unknown"
+    return versions
+
+
+def default_cache_path() -> str:
+    """Location of the persistent reshape cache shared by all runs"""
+    return os.path.join(os.path.expanduser("~"), ".hoi4_arabic_reshaper", "reshape_cache.sqlite")
+
+
+class PersistentReshapeCache:
+    """Reshaped runs stored in a sqlite file and shared across runs.
+
+    Entries are keyed by a hash of the run text. The file is tagged with the
+    arabic-reshaper and python-bidi versions, and opening it with different
+    versions installed discards everything stored so far. New entries are
+    buffered and written in batches by flush().
+    """
+    def __init__(self, path: str, versions: Optional[Dict[str, str]] = None, batch_size: int = 1000):
+        self.path = path
+        self.versions = versions if versions is not None else library_versions()
+        self.batch_size = batch_size
+        self._pending: Dict[bytes, str] = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS runs (key BLOB PRIMARY KEY, value TEXT) WITHOUT ROWID")
+        self._check_versions()
+
+    def _check_versions(self):
+        """Drop stored entries if they were produced by other library versions"""
+        tag = json.dumps(self.versions, sort_keys=True)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'versions'").fetchone()
+        if row is None or row[0] != tag:
+            with self._conn:
+                self._conn.execute("DELETE FROM runs")
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('versions', ?)", (tag,))
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, text: str) -> Optional[str]:
+        """Return the stored result for text, or None if it has not been seen"""
+        key = self._key(text)
+        value = self._pending.get(key)
+        if value is not None:
+            return value
+        row = self._conn.execute("SELECT value FROM runs WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, text: str, value: str):
+        """Store the result for text, writing to disk once a batch has built up"""
+        self._pending[self._key(text)] = value
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered entries to disk"""
+        if not self._pending:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO runs (key, value) VALUES (?, ?)",
+                self._pending.items()
+            )
+        self._pending.clear()
+
+    def close(self):
+        """Flush buffered entries and close the file"""
+        self.flush()
+        self._conn.close()
+
+
+class ReshapeCache:
+    """Bounded LRU memo of reshaped Arabic runs.
+
+    Shaping and bidi reordering of a run only depend on the letters inside it,
+    so the reshaped result of a run can be reused wherever the same run appears
+    again. A maxsize of 0 disables the in-memory layer while still counting
+    misses. When a persistent store is given, runs missing from memory are
+    looked up there before being computed, and new results are written to it.
+    """
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE, store: Optional[PersistentReshapeCache] = None):
+        self.maxsize = maxsize
+        self.store = store
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, text: str, compute: Callable[[str], str]) -> str:
+        """Return the cached result for text, computing and storing it on a miss"""
+        try:
+            result = self._data[text]
+        except KeyError:
+            result = self.store.get(text) if self.store is not None else None
+            if result is not None:
+                self.hits += 1
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                result = compute(text)
+                if self.store is not None:
+                    self.store.put(text, result)
+            self._remember(text, result)
+            return result
+
+        self._data.move_to_end(text)
+        self.hits += 1
+        return result
+
+    def get_many(self, texts: List[str], compute_many: Callable[[List[str]], List[str]]) -> List[str]:
+        """get() for many texts at once, computing every distinct miss in a single compute_many call"""
+        data = self._data
+        results = [data.get(text) for text in texts]
+        missing = dict.fromkeys(text for text, result in zip(texts, results) if result is None)
+        for text in texts:
+            if text in data:
+                data.move_to_end(text)
+        if self.store is not None:
+            for text in list(missing):
+                stored = self.store.get(text)
+                if stored is not None:
+                    self.disk_hits += 1
+                    missing[text] = stored
+        computed = [text for text, stored in missing.items() if stored is None]
+        self.misses += len(computed)
+        self.hits += len(texts) - len(computed)
+        if computed:
+            for text, result in zip(computed, compute_many(computed)):
+                missing[text] = result
+                if self.store is not None:
+                    self.store.put(text, result)
+        if missing:
+            if self.maxsize > 0:
+                data.update(missing)
+                while len(data) > self.maxsize:
+                    data.popitem(last=False)
+            results = [missing[text] if result is None else result for text, result in zip(texts, results)]
+        return results
+
+    def _remember(self, text: str, result: str):
+        if self.maxsize > 0:
+            self._data[text] = result
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def flush(self):
+        """Write pending results to the persistent store, if there is one"""
+        if self.store is not None:
+            self.store.flush()
+
+    def clear(self):
+        """Drop all in-memory entries and reset the counters"""
+        self._data.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current number of in-memory entries"""
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "size": len(self._data)}
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,188 @@
+import re
+import os
+import time
+import codecs
+from functools import partial
+from typing import Optional, Dict, List
+from reshape_cache import DEFAULT_CACHE_SIZE, ReshapeCache, PersistentReshapeCache, library_versions
+from key_store import KeyStore
+from streaming import DEFAULT_CHUNK_LINES, stream_lines, replace_on_success
+import shaping
+
+class ArabicReshaper:
+    """Core text processing functionality"""
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE, cache_path: Optional[str] = None,
+                 key_store_path: Optional[str] = None, batch: bool = True,
+                 chunk_lines: int = DEFAULT_CHUNK_LINES):
+        self.arabic_pattern = re.compile(
+            r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF\u200C\u200D]+'
+        )
+        self.cache_path = cache_path
+        store = PersistentReshapeCache(cache_path) if cache_path else None
+        self.cache = ReshapeCache(cache_size, store)
+        self.arabic_split_pattern = re.compile('(' + self.arabic_pattern.pattern + ')')
+        self.batch = batch
+        self.key_store_path = key_store_path
+        self.key_store = KeyStore(key_store_path, library_versions()) if key_store_path else None
+        self.chunk_lines = chunk_lines
+        # Running totals of time spent per processing stage and Arabic runs found
+        self.timings = {"scan": 0.0, "reshape": 0.0, "bidi": 0.0}
+        self.arabic_runs = 0
+        
+    def reshape_run(self, text: str) -> str:
+        """Reshape and reorder a single Arabic run"""
+        start = time.perf_counter()
+        reshaped = shaping.reshape(text)
+        middle = time.perf_counter()
+        displayed = shaping.display(reshaped)
+        timings = self.timings
+        timings["reshape"] += middle - start
+        timings["bidi"] += time.perf_counter() - middle
+        return displayed
+        
+    def reshape_runs(self, runs) -> Dict[str, str]:
+        """Reshape a collection of distinct Arabic runs in one pass"""
+        get = self.cache.get
+        reshape_run = self.reshape_run
+        return {run: get(run, reshape_run) for run in runs}
+        
+    def counters(self) -> Dict[str, int]:
+        """Running totals of Arabic runs, reshape cache, key store and bidi fast path usage"""
+        counters = {
+            "arabic_runs": self.arabic_runs,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "bidi_fast": shaping.display_stats["fast"],
+            "bidi_slow": shaping.display_stats["slow"],
+        }
+        if self.key_store is not None:
+            counters["keys_reused"] = self.key_store.reused
+            counters["keys_processed"] = self.key_store.processed
+        return counters
+        
+    def process_line(self, line: str) -> str:
+        """Process a single line of text"""
+        def reshape_match(match):
+            self.arabic_runs += 1
+            return self.cache.get(match.group(0), self.reshape_run)
+            
+        return self.arabic_pattern.sub(reshape_match, line)
+        
+    def process_lines(self, lines: List[str], selected: Optional[List[bool]] = None) -> List[str]:
+        """Process many lines at once, reshaping every distinct Arabic run only once.
+        
+        selected, if given, says which lines to process; the others are kept as they are.
+        """
+        # Splitting on the capturing pattern puts the runs at the odd positions
+        split = self.arabic_split_pattern.split
+        if selected is None:
+            split_lines = [split(line) for line in lines]
+        else:
+            split_lines = [split(line) if keep else None for line, keep in zip(lines, selected)]
+        runs = [run for parts in split_lines if parts is not None for run in parts[1::2]]
+        self.arabic_runs += len(runs)
+        distinct_runs = set(runs)
+        shaped = self.reshape_runs(distinct_runs)
+        # Each repeat of a run within the chunk is served from the one just looked up, so it counts as a hit
+        self.cache.hits += len(runs) - len(distinct_runs)
+        
+        processed_lines = []
+        for line, parts in zip(lines, split_lines):
+            if parts is None:
+                processed_lines.append(line)
+                continue
+            if len(parts) > 1:
+                parts[1::2] = [shaped[run] for run in parts[1::2]]
+            processed_lines.append(''.join(parts))
+        return processed_lines
+        
+    def select_lines(self, lines: List[str]) -> Optional[List[bool]]:
+        """Which lines of a chunk to process, None for all of them"""
+        return None
+        
+    def process_chunk(self, lines: List[str], session=None) -> List[str]:
+        """Process one chunk of a file through the key store session, the batch path or line by line"""
+        timings = self.timings
+        start = time.perf_counter()
+        shaping_time = timings["reshape"] + timings["bidi"]
+        selected = self.select_lines(lines)
+        if session is not None:
+            # Only reshape entries whose source line changed since the last run
+            processed_lines = session.process(lines, self.process_line, self.process_lines if self.batch else None)
+        elif self.batch:
+            processed_lines = self.process_lines(lines, selected)
+        else:
+            processed_lines = [self.process_line(line) for line in lines]
+        # Whatever was not spent reshaping runs went into finding them
+        timings["scan"] += time.perf_counter() - start - (timings["reshape"] + timings["bidi"] - shaping_time)
+        return processed_lines
+        
+    def add_to_report(self, report, timings: Dict[str, float], counters: Dict[str, int]):
+        """Add the stage times and counters accumulated since the given snapshots to a FileReport"""
+        for stage, seconds in self.timings.items():
+            report.add_time(stage, seconds - timings[stage])
+        for name, value in self.counters().items():
+            report.count(name, value - counters.get(name, 0))
+        
+    def process_file(self, input_path: str, output_path: str, report=None) -> tuple[int, int]:
+        """Process a single file and return lines processed and time taken.
+        
+        With a FileReport the time spent reading, scanning, reshaping, reordering
+        and writing, the file sizes and the counters of this file are recorded.
+        """
+        start_time = time.time()
+        if report is not None:
+            timings, counters = dict(self.timings), self.counters()
+        session = self.key_store.session(os.path.abspath(input_path)) if self.key_store is not None else None
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        
+        # Stream UTF-8 input to UTF-8-BOM output a chunk at a time so memory use
+        # does not depend on the size of the file
+        with replace_on_success(output_path) as temp_path:
+            with codecs.open(input_path, 'r', 'utf-8') as infile, \
+                    codecs.open(temp_path, 'w', 'utf-8-sig') as outfile:
+                line_count = stream_lines(
+                    infile, outfile, partial(self.process_chunk, session=session), self.chunk_lines, report
+                )
+                
+        if session is not None:
+            session.close()
+        self.cache.flush()
+        if report is not None:
+            self.add_to_report(report, timings, counters)
+            report.finish(input_path, output_path, line_count)
+            
+        return line_count, time.time() - start_time
+
+_worker_reshaper = None
+_worker_key = None
+_worker_pid = None
+
+def run_file_job(reshaper_class, input_path: str, output_path: str, report=None,
+                 **settings) -> tuple[int, float, Dict[str, int]]:
+    """Process a single file inside a pool worker, reusing one reshaper_class instance per process.
+    
+    The settings are passed on to reshaper_class. Returns the lines processed,
+    time taken and the reshaper counters for this file, and fills in the
+    optional FileReport.
+    """
+    global _worker_reshaper, _worker_key, _worker_pid
+    key = (reshaper_class, settings)
+    # A forked worker must not reuse the parent's sqlite connections
+    if _worker_reshaper is None or _worker_pid != os.getpid() or _worker_key != key:
+        _worker_reshaper = reshaper_class(**settings)
+        _worker_key = key
+        _worker_pid = os.getpid()
+    before = _worker_reshaper.counters()
+    lines, process_time = _worker_reshaper.process_file(input_path, output_path, report)
+    after = _worker_reshaper.counters()
+    return lines, process_time, {name: after[name] - before[name] for name in after}
+
+def process_file_job(input_path: str, output_path: str, report=None,
+                     **settings) -> tuple[int, float, Dict[str, int]]:
+    """run_file_job with an ArabicReshaper"""
+    return run_file_job(ArabicReshaper, input_path, output_path, report, **settings)
+
+def warm_up():
+    """Prepare everything the first processed line needs, e.g. from a background thread"""
+    shaping.warm_up()
@@ -1,9 +1,15 @@
 import os
-import re
-import unicodedata
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
+from build_manifest import BuildManifest
+from key_store import KeyStore, default_key_store_path
+from loc_parser import PARSER_SETTINGS
+from rtl_processor import ArabicProcessor
+from run_report import FileReport, RunReport, default_report_path
+from log_sink import LogSink, default_log_path
+from job_runner import JobRunner
+from progress import ProgressTracker, file_size
 
 class ModernTheme:
     BG = "#1E1E2E"  # Dark background
@@ -17,87 +23,6 @@ class ModernTheme:
     WARNING = "#FAB387"  # Orange for warnings
     BORDER = "#45475A"  # Border color
 
-class ArabicProcessor:
-    @staticmethod
-    def is_arabic_char(char):
-        if not char:
-            return False
-        return unicodedata.category(char) in ['Lo', 'Mn'] and any([
-            0x0600 <= ord(char) <= 0x06FF,  # Arabic
-            0x0750 <= ord(char) <= 0x077F,  # Arabic Supplement
-            0x08A0 <= ord(char) <= 0x08FF,  # Arabic Extended-A
-            0xFB50 <= ord(char) <= 0xFDFF,  # Arabic Presentation Forms-A
-            0xFE70 <= ord(char) <= 0xFEFF   # Arabic Presentation Forms-B
-        ])
-
-    @staticmethod
-    def contains_arabic(text):
-        return any(ArabicProcessor.is_arabic_char(char) for char in text)
-
-    @staticmethod
-    def reverse_arabic_text(text):
-        if not ArabicProcessor.contains_arabic(text):
-            return text
-            
-        # Split into words while preserving whitespace
-        words = re.findall(r'\S+|\s+', text)
-        
-        # Separate Arabic and non-Arabic words
-        arabic_words = [word for word in words if ArabicProcessor.contains_arabic(word)]
-        non_arabic_words = [word for word in words if not ArabicProcessor.contains_arabic(word)]
-        
-        if not arabic_words:
-            return text
-        
-        # Reverse Arabic words order
-        reversed_arabic_words = arabic_words[::-1]
-        
-        # Reconstruct text maintaining original word positions
-        result_words = []
-        arabic_index = 0
-        non_arabic_index = 0
-        
-        for word in words:
-            if ArabicProcessor.contains_arabic(word):
-                result_words.append(reversed_arabic_words[arabic_index])
-                arabic_index += 1
-            else:
-                result_words.append(non_arabic_words[non_arabic_index])
-                non_arabic_index += 1
-        
-        return ''.join(result_words)
-
-    @staticmethod
-    def process_yml_file(input_file):
-        try:
-            with open(input_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            processed_lines = []
-            for line in lines:
-                if not line.strip() or '"' not in line:
-                    processed_lines.append(line)
-                    continue
-                
-                # Split on first and last quote
-                parts = line.split('"')
-                if len(parts) >= 2:
-                    prefix = parts[0] + '"'
-                    text = parts[1].strip().rstrip('"')
-                    
-                    # Only process if contains Arabic text
-                    if ArabicProcessor.contains_arabic(text):
-                        text = ArabicProcessor.reverse_arabic_text(text)
-                    
-                    processed_line = f'{prefix}{text}"\n'
-                    processed_lines.append(processed_line)
-                else:
-                    processed_lines.append(line)
-            
-            return processed_lines
-        except Exception as e:
-            raise Exception(f"Error processing file: {str(e)}")
-
 class YMLProcessorApp:
     def __init__(self, master):
         self.master = master
@@ -188,22 +113,28 @@ class YMLProcessorApp:
         self.output_button = ttk.Button(self.main_frame, text="تصفح", command=self.select_output_folder)
         self.output_button.grid(row=1, column=2, padx=(5, 0))
 
+        # Incremental mode
+        self.incremental = tk.BooleanVar(value=True)
+        self.incremental_check = ttk.Checkbutton(self.main_frame, text="تخطي الملفات غير المعدلة",
+                                                 variable=self.incremental)
+        self.incremental_check.grid(row=2, column=0, columnspan=3, sticky="w", pady=(5, 0))
+
         # Process button
         self.process_button = ttk.Button(self.main_frame, text="بدأ", 
                                        command=self.process_files, style='Accent.TButton')
-        self.process_button.grid(row=2, column=0, columnspan=3, pady=10)
+        self.process_button.grid(row=3, column=0, columnspan=3, pady=10)
 
         # Progress bar
         self.progress = ttk.Progressbar(self.main_frame, orient="horizontal", mode="determinate")
-        self.progress.grid(row=3, column=0, columnspan=3, sticky="ew", pady=(0, 5))
+        self.progress.grid(row=4, column=0, columnspan=3, sticky="ew", pady=(0, 5))
 
         # Status label
         self.status_label = ttk.Label(self.main_frame, text="جاهز")
-        self.status_label.grid(row=4, column=0, columnspan=3, pady=(0, 5))
+        self.status_label.grid(row=5, column=0, columnspan=3, pady=(0, 5))
 
         # Log area
         self.log_frame = ttk.Frame(self.main_frame)
-        self.log_frame.grid(row=5, column=0, columnspan=3, sticky="nsew")
+        self.log_frame.grid(row=6, column=0, columnspan=3, sticky="nsew")
         self.log_frame.columnconfigure(0, weight=1)
         self.log_frame.rowconfigure(0, weight=1)
 
@@ -211,10 +142,18 @@ class YMLProcessorApp:
                                    bg=ModernTheme.SECOND_BG, fg=ModernTheme.FG,
                                    font=('Consolas', 9))
         self.log_area.grid(row=0, column=0, sticky="nsew")
+        
+        # Color coding based on message level
+        for level, color in (("info", ModernTheme.FG), ("success", ModernTheme.SUCCESS),
+                             ("error", ModernTheme.ERROR), ("warning", ModernTheme.WARNING)):
+            self.log_area.tag_config(level, foreground=color)
+        self.log_sink = LogSink(self.log_area, log_path=default_log_path("rtl"))
+        self.runner = JobRunner(self.master, self.show_progress, controls=[self.process_button])
 
     def setup_bindings(self):
         # Allow the log frame to expand
-        self.main_frame.rowconfigure(5, weight=1)
+        self.main_frame.rowconfigure(6, weight=1)
+        self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     def select_input_folder(self):
         folder = filedialog.askdirectory(title="Select Input Folder")
@@ -230,22 +169,15 @@ class YMLProcessorApp:
             self.output_path.set(folder)
 
     def log_message(self, message, level="info"):
-        # Add timestamp
-        import time
-        timestamp = time.strftime("%H:%M:%S")
-        
-        # Color coding based on message level
-        colors = {
-            "info": ModernTheme.FG,
-            "success": ModernTheme.SUCCESS,
-            "error": ModernTheme.ERROR,
-            "warning": ModernTheme.WARNING
-        }
-        
-        self.log_area.tag_config(level, foreground=colors.get(level, ModernTheme.FG))
-        self.log_area.insert(tk.END, f"[{timestamp}] {message}\n", level)
-        self.log_area.see(tk.END)
-        self.master.update_idletasks()
+        # Queued and drawn with a timestamp in batches; safe to call from any thread
+        self.log_sink.post(message, level)
+
+    def show_progress(self, done, total, current):
+        # Progress is measured in bytes, so big files move the bar as much as they take
+        self.progress["maximum"] = max(total, 1)
+        self.progress["value"] = done
+        if current:
+            self.status_label.config(text=current)
 
     def process_files(self):
         input_folder = self.input_path.get()
@@ -255,69 +187,113 @@ class YMLProcessorApp:
             messagebox.showwarning("Warning", "Please select both input and output folders.")
             return
 
-        try:
-            # Find all YML files recursively
-            yml_files = []
-            for root, dirs, files in os.walk(input_folder):
-                for file in files:
-                    if file.lower().endswith('.yml'):
-                        # Get full path and relative path
-                        full_path = os.path.join(root, file)
-                        rel_path = os.path.relpath(full_path, input_folder)
-                        yml_files.append((full_path, rel_path))
-
-            if not yml_files:
-                messagebox.showinfo("Info", "No YML files found in the selected folder and its subdirectories.")
-                return
-
-            self.progress["maximum"] = len(yml_files)
-            self.progress["value"] = 0
-            processed_count = 0
-            error_count = 0
-
-            self.log_message(f"Found {len(yml_files)} YML files to process", "info")
-            self.log_message(f"Input folder: {input_folder}", "info")
-            self.log_message(f"Output folder: {output_folder}", "info")
-
-            for input_file, rel_path in yml_files:
-                try:
-                    # Create output path maintaining folder structure
-                    output_file = os.path.join(output_folder, rel_path)
-                    
-                    # Create necessary subdirectories
-                    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-                    
-                    # Process the file
-                    processed_lines = ArabicProcessor.process_yml_file(input_file)
-                    
-                    # Write the processed content
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        f.writelines(processed_lines)
-                    
-                    processed_count += 1
-                    self.status_label.config(text=f"Processing: {rel_path}")
-                    self.log_message(f"Processed: {rel_path}", "success")
-                    
-                except Exception as e:
-                    error_count += 1
-                    self.log_message(f"Error processing {rel_path}: {str(e)}", "error")
+        # The files are processed on a background thread, which keeps the window responsive
+        self.runner.start(self.run_files, input_folder, output_folder, self.incremental.get(),
+                          on_done=self.on_files_done, on_error=self.on_files_error)
+
+    def run_files(self, input_folder, output_folder, incremental):
+        """Process every YML file below input_folder; runs on the job runner's thread"""
+        # Find all YML files recursively
+        yml_files = []
+        for root, dirs, files in os.walk(input_folder):
+            for file in files:
+                if file.lower().endswith('.yml'):
+                    # Get full path and relative path
+                    full_path = os.path.join(root, file)
+                    rel_path = os.path.relpath(full_path, input_folder)
+                    yml_files.append((full_path, rel_path, file_size(full_path)))
+
+        if not yml_files:
+            self.runner.call(messagebox.showinfo, "Info",
+                             "No YML files found in the selected folder and its subdirectories.")
+            return None
+
+        processed_count = 0
+        skipped_count = 0
+        error_count = 0
+        tracker = ProgressTracker(sum(size for _, _, size in yml_files), len(yml_files))
+        self.runner.progress(0, tracker.total_bytes)
+
+        manifest = None
+        key_store = None
+        if incremental:
+            manifest = BuildManifest(output_folder, "rtl", PARSER_SETTINGS)
+            key_store = KeyStore(default_key_store_path(output_folder, "rtl"), PARSER_SETTINGS)
+        run_report = RunReport("rtl", {"incremental": incremental})
+
+        self.log_message(f"Found {len(yml_files)} YML files to process", "info")
+        self.log_message(f"Input folder: {input_folder}", "info")
+        self.log_message(f"Output folder: {output_folder}", "info")
+
+        for input_file, rel_path, size in yml_files:
+            # Create output path maintaining folder structure
+            output_file = os.path.join(output_folder, rel_path)
+
+            # Skip files that are unchanged since the last run
+            if manifest is not None and manifest.is_up_to_date(input_file, output_file):
+                skipped_count += 1
+                tracker.skip(size)
+                self.runner.progress(tracker.done_bytes, tracker.total_bytes, tracker.status())
+                continue
+
+            try:
+                # Create necessary subdirectories
+                os.makedirs(os.path.dirname(output_file), exist_ok=True)
                 
-                self.progress["value"] += 1
-                self.master.update_idletasks()
-
-            # Final status update
-            completion_message = f"Completed! Processed {processed_count} files"
-            if error_count > 0:
-                completion_message += f" ({error_count} errors)"
-            self.status_label.config(text=completion_message)
-            self.log_message(completion_message, "success" if error_count == 0 else "warning")
+                # Process the file, writing the output as it goes
+                file_report = FileReport(rel_path)
+                ArabicProcessor.stream_yml_file(input_file, output_file, key_store, report=file_report)
+                run_report.add(file_report)
+                tracker.add(size, file_report.lines)
+                
+                if manifest is not None:
+                    manifest.record(input_file, output_file)
+                processed_count += 1
+                self.log_message(f"Processed: {rel_path}", "success")
+                
+            except Exception as e:
+                error_count += 1
+                tracker.skip(size)
+                self.log_message(f"Error processing {rel_path}: {str(e)}", "error")
+                run_report.add_error(rel_path, e)
+                if manifest is not None:
+                    manifest.forget(input_file)
             
-            # Reset progress bar
-            self.progress["value"] = 0
-
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
-            self.log_message(f"Critical error: {str(e)}", "error")
+            self.runner.progress(tracker.done_bytes, tracker.total_bytes,
+                                 f"Processing: {rel_path} · {tracker.status()}")
+
+        if manifest is not None:
+            manifest.save()
+            key_store.close()
+        report_path = default_report_path(output_folder, "rtl")
+        run_report.write(report_path)
+
+        # Final status update
+        completion_message = f"Completed! Processed {processed_count} files"
+        if skipped_count > 0:
+            completion_message += f", skipped {skipped_count} unchanged"
+        if error_count > 0:
+            completion_message += f" ({error_count} errors)"
+        self.log_message(completion_message, "success" if error_count == 0 else "warning")
+        self.log_message(f"Run report: {report_path}", "info")
+        return completion_message
+
+    def on_files_done(self, completion_message):
+        if completion_message:
+            self.status_label.config(text=completion_message)
+        # Reset progress bar
+        self.progress["value"] = 0
+        self.log_sink.close_file()
+
+    def on_files_error(self, e):
+        self.progress["value"] = 0
+        messagebox.showerror("Error", f"An error occurred: {str(e)}")
+        self.log_message(f"Critical error: {str(e)}", "error")
+        self.log_sink.close_file()
+
+    def on_closing(self):
+        self.log_sink.close()
+        self.master.destroy()
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,148 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+from reshape_cache import DEFAULT_CACHE_SIZE, ReshapeCache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Blocks the rtl tools count as Arabic, for characters of category Lo or Mn
+ARABIC_BLOCKS = ((0x0600, 0x06FF), (0x0750, 0x077F), (0x08A0, 0x08FF), (0xFB50, 0xFDFF), (0xFE70, 0xFEFF))
+
+# Words and the whitespace between them, as the tools have always split entries
+_WORDS = re.compile(r'\S+|\s+')
+_SPACE = re.compile(r'\s')
+
+_arabic_chars: Optional[frozenset] = None
+_arabic_re: Optional[re.Pattern] = None
+# One entry per BMP code point plus one for everything above it, which is neither Arabic nor whitespace
+_arabic_table = None
+_space_table = None
+_tables_lock = threading.Lock()
+
+
+def _build_tables():
+    with _tables_lock:
+        if _arabic_re is None:
+            _build_tables_locked()
+
+
+def _build_tables_locked():
+    global _arabic_chars, _arabic_re, _arabic_table, _space_table
+    chars = [
+        chr(code) for start, end in ARABIC_BLOCKS for code in range(start, end + 1)
+        if unicodedata.category(chr(code)) in ('Lo', 'Mn')
+    ]
+    if np is not None:
+        arabic = np.zeros(0x10001, dtype=bool)
+        arabic[[ord(char) for char in chars]] = True
+        space = np.zeros(0x10001, dtype=bool)
+        # Every code point \s matches is in the BMP
+        space[[code for code in range(0x10000) if _SPACE.match(chr(code))]] = True
+        _arabic_table, _space_table = arabic, space
+    _arabic_chars = frozenset(chars)
+    _arabic_re = re.compile('[' + ''.join(re.escape(char) for char in chars) + ']')
+
+
+def is_arabic_char(char: str) -> bool:
+    if _arabic_chars is None:
+        _build_tables()
+    return char in _arabic_chars
+
+
+def contains_arabic(text: str) -> bool:
+    if _arabic_re is None:
+        _build_tables()
+    return _arabic_re.search(text) is not None
+
+
+def _reorder(words: List[str], positions: List[int]) -> str:
+    """Reverse the words at positions among themselves, in place, and join all words"""
+    for front, back in zip(positions[:len(positions) // 2], reversed(positions)):
+        words[front], words[back] = words[back], words[front]
+    return ''.join(words)
+
+
+def reverse_arabic_text(text: str) -> str:
+    """Reverse the order of the words containing Arabic, leaving every other word and all whitespace in place"""
+    if not contains_arabic(text):
+        return text
+    words = _WORDS.findall(text)
+    search = _arabic_re.search
+    return _reorder(words, [index for index, word in enumerate(words) if search(word) is not None])
+
+
+def reverse_arabic_texts(texts: List[str]) -> List[str]:
+    """reverse_arabic_text for many texts, classifying all of their characters in one pass.
+
+    With numpy the texts are joined into one array of code points that is
+    looked up in the Arabic and whitespace tables at once, which gives the word
+    boundaries and a per-word Arabic flag without a Python call per character.
+    Only texts that contain Arabic are then rebuilt word by word. Without numpy
+    every text goes through reverse_arabic_text.
+    """
+    if _arabic_re is None:
+        _build_tables()
+    if np is None or not texts:
+        return [reverse_arabic_text(text) for text in texts]
+
+    joined = ''.join(texts)
+    if not joined:
+        return list(texts)
+    codes = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32)
+    codes = np.minimum(codes, 0x10000)
+    arabic = _arabic_table[codes]
+    if not arabic.any():
+        return list(texts)
+    space = _space_table[codes]
+
+    # A word starts where whitespace turns into text or back, and at the start of every text
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    boundary = np.empty(len(codes), dtype=bool)
+    boundary[0] = True
+    np.not_equal(space[1:], space[:-1], out=boundary[1:])
+    boundary[offsets[:-1][lengths > 0]] = True
+    starts = np.flatnonzero(boundary)
+    word_arabic = np.logical_or.reduceat(arabic, starts)
+
+    # Texts with at least one Arabic word, and the range of words of each text
+    text_of_word = np.searchsorted(offsets, starts, side='right') - 1
+    first_word = np.searchsorted(starts, offsets).tolist()
+    bounds = starts.tolist() + [len(joined)]
+    flags = word_arabic.tolist()
+    result = list(texts)
+    for index in np.unique(text_of_word[word_arabic]).tolist():
+        begin, end = first_word[index], first_word[index + 1]
+        words = [joined[bounds[i]:bounds[i + 1]] for i in range(begin, end)]
+        result[index] = _reorder(words, [i - begin for i in range(begin, end) if flags[i]])
+    return result
+
+
+class ReorderEngine:
+    """Word reordering with every distinct text reordered once.
+
+    Results are memoized in a bounded LRU, so entries repeated across a tree
+    (names, tooltips, shared phrases) are classified and reordered only the
+    first time. reverse_many() looks a whole batch up at once and sends the
+    misses through reverse_arabic_texts together.
+    """
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.cache = ReshapeCache(cache_size)
+
+    def reverse(self, text: str) -> str:
+        return self.cache.get(text, reverse_arabic_text)
+
+    def reverse_many(self, texts: List[str]) -> List[str]:
+        return self.cache.get_many(texts, reverse_arabic_texts)
+
+    def counters(self) -> Dict[str, int]:
+        return {"rtl_cache_hits": self.cache.hits, "rtl_cache_misses": self.cache.misses}
+
+
+# Shared by the rtl tools within a process
+default_engine = ReorderEngine()
@@ -1,9 +1,16 @@
 import os
-import re
-import unicodedata
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from tkinter.scrolledtext import ScrolledText
+from build_manifest import BuildManifest
+from key_store import KeyStore, default_key_store_path
+from loc_parser import PARSER_SETTINGS
+from rtl_nt_processor import (is_arabic_char, contains_arabic, reverse_arabic_text,
+                              process_yml_line, process_yml_file, stream_yml_file)
+from run_report import FileReport, RunReport, default_report_path
+from log_sink import LogSink, default_log_path
+from job_runner import JobRunner
+from progress import ProgressTracker, file_size
 
 # Translations dictionary
 TRANSLATIONS = {
@@ -24,7 +31,10 @@ TRANSLATIONS = {
         "processed_success": "تمت معالجة {} بنجاح",
         "processing_error": "خطأ في معالجة {}: {}",
         "processed_files": "تمت معالجة {} من {} ملفات",
-        "processing_complete": "اكتملت المعالجة"
+        "processing_complete": "اكتملت المعالجة",
+        "incremental": "تخطي الملفات غير المعدلة",
+        "skipped": "تم تخطي {} ملف غير معدل",
+        "report": "تم حفظ تقرير التشغيل في {}"
     }
 }
 
@@ -48,84 +58,6 @@ class ModernTheme:
     def get_text(key):
         return TRANSLATIONS[ModernTheme.LANGUAGE][key]
 
-def is_arabic_char(char):
-    if not char:
-        return False
-    return unicodedata.category(char) in ['Lo', 'Mn'] and any([
-        0x0600 <= ord(char) <= 0x06FF,  # Arabic
-        0x0750 <= ord(char) <= 0x077F,  # Arabic Supplement
-        0x08A0 <= ord(char) <= 0x08FF,  # Arabic Extended-A
-        0xFB50 <= ord(char) <= 0xFDFF,  # Arabic Presentation Forms-A
-        0xFE70 <= ord(char) <= 0xFEFF   # Arabic Presentation Forms-B
-    ])
-
-def contains_arabic(text):
-    return any(is_arabic_char(char) for char in text)
-
-def reverse_arabic_text(text):
-    if not contains_arabic(text):
-        return text
-        
-    words = re.findall(r'\S+|\s+', text)
-    arabic_words = [word for word in words if contains_arabic(word)]
-    non_arabic_words = [word for word in words if not contains_arabic(word)]
-    
-    if not arabic_words:
-        return text
-    
-    reversed_arabic_words = arabic_words[::-1]
-    result_words = []
-    arabic_index = 0
-    non_arabic_index = 0
-    
-    for word in words:
-        if contains_arabic(word):
-            result_words.append(reversed_arabic_words[arabic_index])
-            arabic_index += 1
-        else:
-            result_words.append(non_arabic_words[non_arabic_index])
-            non_arabic_index += 1
-    
-    return ''.join(result_words)
-
-def process_yml_file(input_file):
-    try:
-        with open(input_file, 'r', encoding='utf-8-sig') as f:
-            lines = f.readlines()
-        
-        processed_lines = []
-        for line in lines:
-            # Skip empty lines
-            if not line.strip():
-                processed_lines.append(line)
-                continue
-                
-            # Check for #NT! tag
-            is_nt_line = line.strip().endswith('#NT!')
-            
-            # If no #NT! tag or no quotes, add line as is
-            if not is_nt_line or '"' not in line:
-                processed_lines.append(line)
-                continue
-            
-            # Process lines with #NT! tag
-            parts = line.split('"')
-            if len(parts) >= 2:
-                prefix = parts[0] + '"'
-                # Remove #NT! tag for processing
-                text = parts[1].strip().rstrip('"').strip()
-                text = text.replace(' #NT!', '')
-                
-                reversed_text = reverse_arabic_text(text)
-                processed_line = f'{prefix}{reversed_text}" #NT!\n'
-                processed_lines.append(processed_line)
-            else:
-                processed_lines.append(line)
-        
-        return processed_lines
-    except Exception as e:
-        raise Exception(f"Error in file {input_file}: {str(e)}")
-
 class YMLProcessorApp:
     def __init__(self, master):
         self.master = master
@@ -161,24 +93,35 @@ class YMLProcessorApp:
         ttk.Button(container, text=ModernTheme.get_text("browse"), 
                   command=self.select_output_folder).grid(row=1, column=2, padx=5)
 
+        # Incremental Mode
+        self.incremental = tk.BooleanVar(value=True)
+        ttk.Checkbutton(container, text=ModernTheme.get_text("incremental"),
+                        variable=self.incremental).grid(row=2, column=0, columnspan=3, sticky="w", pady=5)
+
         # Process Button
-        ttk.Button(container, text=ModernTheme.get_text("process_files"),
-                  command=self.process_yml_files, style='Accent.TButton').grid(row=2, column=0, 
-                  columnspan=3, pady=10)
+        self.process_button = ttk.Button(container, text=ModernTheme.get_text("process_files"),
+                                         command=self.process_yml_files, style='Accent.TButton')
+        self.process_button.grid(row=3, column=0, columnspan=3, pady=10)
 
         # Progress Bar
         self.progress = ttk.Progressbar(container, orient="horizontal", mode="determinate")
-        self.progress.grid(row=3, column=0, columnspan=3, sticky="ew", pady=5)
+        self.progress.grid(row=4, column=0, columnspan=3, sticky="ew", pady=5)
 
         # Status Label
         self.status_label = ttk.Label(container, text="")
-        self.status_label.grid(row=4, column=0, columnspan=3, pady=5)
+        self.status_label.grid(row=5, column=0, columnspan=3, pady=5)
 
         # Log Area
         self.log_area = ScrolledText(container, height=15, bg=ModernTheme.SECOND_BG,
                                    fg=ModernTheme.FG, font=('Consolas', 9))
-        self.log_area.grid(row=5, column=0, columnspan=3, sticky="nsew", pady=5)
-        container.rowconfigure(5, weight=1)
+        self.log_area.grid(row=6, column=0, columnspan=3, sticky="nsew", pady=5)
+        for level, color in (("info", ModernTheme.FG), ("success", ModernTheme.SUCCESS),
+                             ("error", ModernTheme.ERROR), ("warning", ModernTheme.WARNING)):
+            self.log_area.tag_config(level, foreground=color)
+        self.log_sink = LogSink(self.log_area, log_path=default_log_path("rtl_nt"))
+        self.runner = JobRunner(master, self.show_progress, controls=[self.process_button])
+        master.protocol("WM_DELETE_WINDOW", self.on_closing)
+        container.rowconfigure(6, weight=1)
 
     def select_input_folder(self):
         folder = filedialog.askdirectory()
@@ -191,18 +134,15 @@ class YMLProcessorApp:
             self.output_path.set(folder)
 
     def log_message(self, message, level="info"):
-        colors = {
-            "info": ModernTheme.FG,
-            "success": ModernTheme.SUCCESS,
-            "error": ModernTheme.ERROR,
-            "warning": ModernTheme.WARNING
-        }
-        
-        timestamp = time.strftime("%H:%M:%S")
-        self.log_area.tag_config(level, foreground=colors.get(level, ModernTheme.FG))
-        self.log_area.insert(tk.END, f"[{timestamp}] {message}\n", level)
-        self.log_area.see(tk.END)
-        self.master.update_idletasks()
+        # Queued and drawn with a timestamp in batches; safe to call from any thread
+        self.log_sink.post(message, level)
+
+    def show_progress(self, done, total, current):
+        # Progress is measured in bytes, so big files move the bar as much as they take
+        self.progress["maximum"] = max(total, 1)
+        self.progress["value"] = done
+        if current:
+            self.status_label.config(text=current)
 
     def process_yml_files(self):
         input_folder = self.input_path.get()
@@ -217,65 +157,104 @@ class YMLProcessorApp:
                                  ModernTheme.get_text("select_output"))
             return
 
-        try:
-            # Get all YML files recursively from all subfolders
-            yml_files = []
-            for root, dirs, files in os.walk(input_folder):
-                for file in files:
-                    if file.lower().endswith('.yml'):
-                        full_path = os.path.join(root, file)
-                        rel_path = os.path.relpath(full_path, input_folder)
-                        yml_files.append((full_path, rel_path))
-
-            if not yml_files:
-                messagebox.showinfo(ModernTheme.get_text("info"), 
-                                  ModernTheme.get_text("no_files"))
-                return
-
-            self.progress["maximum"] = len(yml_files)
-            self.progress["value"] = 0
-            processed_count = 0
-
-            for input_file, rel_path in yml_files:
-                try:
-                    # Create output path maintaining folder structure
-                    output_file = os.path.join(output_folder, rel_path)
-                    
-                    # Create necessary subdirectories
-                    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-                    
-                    processed_lines = process_yml_file(input_file)
-                    if processed_lines is not None:
-                        # Write with UTF-8 BOM
-                        with open(output_file, 'wb') as f:
-                            f.write(b'\xef\xbb\xbf')
-                            content = ''.join(processed_lines)
-                            f.write(content.encode('utf-8'))
-                        processed_count += 1
-                        
-                        self.status_label.config(
-                            text=ModernTheme.get_text("processing").format(rel_path))
-                        self.log_message(
-                            ModernTheme.get_text("processed_success").format(rel_path), 
-                            "success")
-                    
-                    self.progress["value"] += 1
-                    self.master.update_idletasks()
+        # The files are processed on a background thread, which keeps the window responsive
+        self.runner.start(self.run_yml_files, input_folder, output_folder, self.incremental.get(),
+                          on_done=self.on_files_done, on_error=self.on_files_error)
+
+    def run_yml_files(self, input_folder, output_folder, incremental):
+        """Process every YML file below input_folder; runs on the job runner's thread"""
+        # Get all YML files recursively from all subfolders
+        yml_files = []
+        for root, dirs, files in os.walk(input_folder):
+            for file in files:
+                if file.lower().endswith('.yml'):
+                    full_path = os.path.join(root, file)
+                    rel_path = os.path.relpath(full_path, input_folder)
+                    yml_files.append((full_path, rel_path, file_size(full_path)))
+
+        if not yml_files:
+            self.runner.call(messagebox.showinfo, ModernTheme.get_text("info"), 
+                             ModernTheme.get_text("no_files"))
+            return None
+
+        tracker = ProgressTracker(sum(size for _, _, size in yml_files), len(yml_files))
+        self.runner.progress(0, tracker.total_bytes)
+        processed_count = 0
+        skipped_count = 0
+
+        manifest = None
+        key_store = None
+        if incremental:
+            manifest = BuildManifest(output_folder, "rtl_nt", PARSER_SETTINGS)
+            key_store = KeyStore(default_key_store_path(output_folder, "rtl_nt"), PARSER_SETTINGS)
+        run_report = RunReport("rtl_nt", {"incremental": incremental})
+
+        for input_file, rel_path, size in yml_files:
+            # Create output path maintaining folder structure
+            output_file = os.path.join(output_folder, rel_path)
+            
+            # Skip files that are unchanged since the last run
+            if manifest is not None and manifest.is_up_to_date(input_file, output_file):
+                skipped_count += 1
+                tracker.skip(size)
+                self.runner.progress(tracker.done_bytes, tracker.total_bytes, tracker.status())
+                continue
+            
+            try:
+                # Create necessary subdirectories
+                os.makedirs(os.path.dirname(output_file), exist_ok=True)
                 
-                except Exception as e:
-                    self.log_message(
-                        ModernTheme.get_text("processing_error").format(rel_path, str(e)), 
-                        "error")
-
+                file_report = FileReport(rel_path)
+                stream_yml_file(input_file, output_file, key_store, report=file_report)
+                run_report.add(file_report)
+                tracker.add(size, file_report.lines)
+                if manifest is not None:
+                    manifest.record(input_file, output_file)
+                processed_count += 1
+                
+                self.log_message(
+                    ModernTheme.get_text("processed_success").format(rel_path), 
+                    "success")
+            
+            except Exception as e:
+                tracker.skip(size)
+                self.log_message(
+                    ModernTheme.get_text("processing_error").format(rel_path, str(e)), 
+                    "error")
+                run_report.add_error(rel_path, e)
+                if manifest is not None:
+                    manifest.forget(input_file)
+            
+            self.runner.progress(tracker.done_bytes, tracker.total_bytes,
+                                 f"{ModernTheme.get_text('processing')}{rel_path} · {tracker.status()}")
+
+        if manifest is not None:
+            manifest.save()
+            key_store.close()
+        if skipped_count > 0:
+            self.log_message(ModernTheme.get_text("skipped").format(skipped_count), "info")
+        report_path = default_report_path(output_folder, "rtl_nt")
+        run_report.write(report_path)
+        self.log_message(ModernTheme.get_text("report").format(report_path), "info")
+        return processed_count, len(yml_files)
+
+    def on_files_done(self, counts):
+        if counts is not None:
             messagebox.showinfo(
                 ModernTheme.get_text("complete"),
-                ModernTheme.get_text("processed_files").format(processed_count, len(yml_files)))
-            
+                ModernTheme.get_text("processed_files").format(*counts))
             self.status_label.config(text=ModernTheme.get_text("processing_complete"))
-            self.progress["value"] = 0
+        self.progress["value"] = 0
+        self.log_sink.close_file()
+
+    def on_files_error(self, e):
+        self.progress["value"] = 0
+        messagebox.showerror(ModernTheme.get_text("error"), str(e))
+        self.log_sink.close_file()
 
-        except Exception as e:
-            messagebox.showerror(ModernTheme.get_text("error"), str(e))
+    def on_closing(self):
+        self.log_sink.close()
+        self.master.destroy()
 
 def apply_styles():
     style = ttk.Style()
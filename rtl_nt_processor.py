@@ -0,0 +1,90 @@
+import os
+from typing import List, Optional, Tuple
+import rtl_engine
+from rtl_engine import contains_arabic, reverse_arabic_text
+from loc_parser import parse_line
+from streaming import DEFAULT_CHUNK_LINES, stream_lines, replace_on_success
+from run_report import timer
+
+def is_arabic_char(char):
+    if not char:
+        return False
+    return rtl_engine.is_arabic_char(char)
+
+def split_yml_line(line) -> Optional[Tuple[str, str, str]]:
+    """Split a #NT! entry into the part up to its opening quote, its text without the tag and the rest.
+    
+    Returns None for other lines. The rest runs from the closing quote to
+    the tag, or is just the tag if the text was never closed.
+    """
+    match = parse_line(line)
+    start = match.start('text')
+    # Lines without the #NT! tag or without a quote are left as they are
+    if start == -1 or match.start('nt') == -1:
+        return None
+    end = match.end('text')
+    suffix = line[end:match.end('comment')] if match.start('close') != -1 else '" #NT!'
+    return line[:start], line[start:end].strip().replace(' #NT!', ''), suffix
+
+def process_yml_line(line):
+    entry = split_yml_line(line)
+    if entry is None:
+        return line
+    prefix, text, suffix = entry
+    return f'{prefix}{rtl_engine.default_engine.reverse(text)}{suffix}\n'
+
+def process_yml_lines(lines: List[str]) -> List[str]:
+    """process_yml_line for a chunk of lines, reordering the texts of all #NT! entries in one batch"""
+    entries = [split_yml_line(line) for line in lines]
+    texts = iter(rtl_engine.default_engine.reverse_many([entry[1] for entry in entries if entry is not None]))
+    return [line if entry is None else f'{entry[0]}{next(texts)}{entry[2]}\n' for line, entry in zip(lines, entries)]
+
+def process_yml_file(input_file, key_store=None):
+    try:
+        with open(input_file, 'r', encoding='utf-8-sig') as f:
+            lines = f.readlines()
+        
+        # Only reorder entries whose source line changed since the last run
+        if key_store is not None:
+            return key_store.process_lines(os.path.abspath(input_file), lines, process_yml_line, process_yml_lines)
+        
+        return process_yml_lines(lines)
+    except Exception as e:
+        raise Exception(f"Error in file {input_file}: {str(e)}")
+
+def stream_yml_file(input_file, output_file, key_store=None, chunk_lines=DEFAULT_CHUNK_LINES, report=None):
+    """Process input_file into a UTF-8 BOM output_file a chunk of lines at a time and return the line count.
+    
+    With a FileReport the time spent reading, reordering and writing, the
+    file sizes and the hits of the reorder cache are recorded.
+    """
+    try:
+        engine = rtl_engine.default_engine
+        counters = engine.counters()
+
+        # Only reorder entries whose source line changed since the last run
+        session = key_store.session(os.path.abspath(input_file)) if key_store is not None else None
+        
+        def process_chunk(lines):
+            with timer(report, "bidi"):
+                if session is not None:
+                    lines = session.process(lines, process_yml_line, process_yml_lines)
+                else:
+                    lines = process_yml_lines(lines)
+            return [''.join(lines).encode('utf-8')]
+        
+        with replace_on_success(output_file) as temp_file:
+            with open(input_file, 'r', encoding='utf-8-sig') as infile, open(temp_file, 'wb') as outfile:
+                # Write with UTF-8 BOM
+                outfile.write(b'\xef\xbb\xbf')
+                line_count = stream_lines(infile, outfile, process_chunk, chunk_lines, report)
+        
+        if session is not None:
+            session.close()
+        if report is not None:
+            for name, value in engine.counters().items():
+                report.count(name, value - counters[name])
+            report.finish(input_file, output_file, line_count)
+        return line_count
+    except Exception as e:
+        raise Exception(f"Error in file {input_file}: {str(e)}")
@@ -0,0 +1,105 @@
+import os
+from typing import List, Optional, Tuple
+import rtl_engine
+from loc_parser import parse_line
+from streaming import DEFAULT_CHUNK_LINES, stream_lines, replace_on_success
+from run_report import timer
+
+class ArabicProcessor:
+    @staticmethod
+    def is_arabic_char(char):
+        if not char:
+            return False
+        return rtl_engine.is_arabic_char(char)
+
+    @staticmethod
+    def contains_arabic(text):
+        return rtl_engine.contains_arabic(text)
+
+    @staticmethod
+    def reverse_arabic_text(text):
+        return rtl_engine.default_engine.reverse(text)
+
+    @staticmethod
+    def split_yml_line(line) -> Optional[Tuple[str, str, str]]:
+        """Split an entry into the part up to its opening quote, its text and the rest from its closing quote on.
+        
+        Returns None for lines left as they are. The rest keeps what follows
+        the closing quote, such as a comment, and is a lone quote if the text
+        was never closed.
+        """
+        match = parse_line(line)
+        start = match.start('text')
+        if start == -1:
+            return None
+        end = match.end('text')
+        suffix = line[end:match.end('comment')] if match.start('close') != -1 else '"'
+        return line[:start], line[start:end].strip(), suffix
+
+    @staticmethod
+    def process_yml_line(line):
+        entry = ArabicProcessor.split_yml_line(line)
+        if entry is None:
+            return line
+        prefix, text, suffix = entry
+        return f'{prefix}{rtl_engine.default_engine.reverse(text)}{suffix}\n'
+
+    @staticmethod
+    def process_yml_lines(lines: List[str]) -> List[str]:
+        """process_yml_line for a chunk of lines, reordering the texts of all entries in one batch"""
+        entries = [ArabicProcessor.split_yml_line(line) for line in lines]
+        texts = iter(rtl_engine.default_engine.reverse_many([entry[1] for entry in entries if entry is not None]))
+        return [line if entry is None else f'{entry[0]}{next(texts)}{entry[2]}\n'
+                for line, entry in zip(lines, entries)]
+
+    @staticmethod
+    def process_yml_file(input_file, key_store=None):
+        try:
+            with open(input_file, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+            
+            # Only reorder entries whose source line changed since the last run
+            if key_store is not None:
+                return key_store.process_lines(
+                    os.path.abspath(input_file), lines, ArabicProcessor.process_yml_line,
+                    ArabicProcessor.process_yml_lines)
+            
+            return ArabicProcessor.process_yml_lines(lines)
+        except Exception as e:
+            raise Exception(f"Error processing file: {str(e)}")
+
+    @staticmethod
+    def stream_yml_file(input_file, output_file, key_store=None, chunk_lines=DEFAULT_CHUNK_LINES, report=None):
+        """Process input_file into output_file a chunk of lines at a time and return the line count.
+        
+        With a FileReport the time spent reading, reordering and writing, the
+        file sizes and the hits of the reorder cache are recorded.
+        """
+        try:
+            engine = rtl_engine.default_engine
+            counters = engine.counters()
+
+            # Only reorder entries whose source line changed since the last run
+            session = key_store.session(os.path.abspath(input_file)) if key_store is not None else None
+            
+            def process_chunk(lines):
+                with timer(report, "bidi"):
+                    if session is not None:
+                        return session.process(lines, ArabicProcessor.process_yml_line,
+                                               ArabicProcessor.process_yml_lines)
+                    return ArabicProcessor.process_yml_lines(lines)
+            
+            with replace_on_success(output_file) as temp_file:
+                with open(input_file, 'r', encoding='utf-8') as infile, \
+                        open(temp_file, 'w', encoding='utf-8') as outfile:
+                    line_count = stream_lines(infile, outfile, process_chunk, chunk_lines, report)
+            
+            if session is not None:
+                session.close()
+            if report is not None:
+                for name, value in engine.counters().items():
+                    report.count(name, value - counters[name])
+                report.finish(input_file, output_file, line_count)
+            return line_count
+        except Exception as e:
+            raise Exception(f"Error processing file: {str(e)}")
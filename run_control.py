@@ -0,0 +1,44 @@
+import threading
+
+
+class Cancelled(Exception):
+    """Raised for a file whose processing was stopped by RunControl.cancel()"""
+    def __init__(self):
+        super().__init__("Cancelled")
+
+
+class RunControl:
+    """Cooperative cancel and pause of a run, shared by the UI and the processing thread.
+
+    Nothing is interrupted: the processing code calls wait() between files or
+    chunks, which blocks while the run is paused and returns False once it is
+    cancelled. cancel() also wakes up a paused run so it can stop.
+    """
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()
+
+    def pause(self):
+        if not self._cancelled.is_set():
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def wait(self) -> bool:
+        """Block while paused; return False if the run was cancelled and should stop"""
+        self._running.wait()
+        return not self._cancelled.is_set()
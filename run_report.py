@@ -0,0 +1,160 @@
+import os
+import json
+import math
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Union
+from build_manifest import state_path
+
+
+class FileReport:
+    """Time spent per stage and counters of one processed file.
+
+    Stages are named by the tool that records them, e.g. read, scan, reshape,
+    bidi and write. Counters hold sizes and tool statistics such as bytes_in,
+    bytes_out, arabic_runs and cache_hits. Reports cross process boundaries as
+    the plain dicts returned by to_dict().
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lines = 0
+        self.elapsed = 0.0
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self._start = time.perf_counter()
+
+    def add_time(self, stage: str, seconds: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        """Add the time spent in the with block to stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self, input_path: str, output_path: str, lines: int):
+        """Record the line count, file sizes and time since the report was created"""
+        self.elapsed = time.perf_counter() - self._start
+        self.lines = lines
+        self.counters["bytes_in"] = os.path.getsize(input_path)
+        self.counters["bytes_out"] = os.path.getsize(output_path)
+
+    def to_dict(self) -> Dict:
+        return {
+            "path": self.path,
+            "lines": self.lines,
+            "elapsed": self.elapsed,
+            "timings": dict(self.timings),
+            "counters": dict(self.counters),
+        }
+
+
+def timer(report: Optional[FileReport], stage: str):
+    """report.timed(stage), or a context that does nothing when there is no report"""
+    return report.timed(stage) if report is not None else nullcontext()
+
+
+def report_job(job, input_path: str, output_path: str, *args, **kwargs):
+    """Run job(input_path, output_path, ..., report=report) and return its result and the report as a dict.
+
+    Meant to be wrapped around a pool job with functools.partial, so the report
+    of a file processed in a worker process reaches the parent.
+    """
+    report = FileReport(input_path)
+    result = job(input_path, output_path, *args, report=report, **kwargs)
+    return result, report.to_dict()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class RunReport:
+    """File reports of one run of a tool, with totals, latency percentiles and the slowest files.
+
+    write() stores the run as JSON, or as JSON Lines with one line per file
+    followed by a summary line when the path ends in .jsonl. The Tk
+    applications write it next to their outputs as .<tool>.report.json.
+    """
+    def __init__(self, tool: str, settings: Optional[Dict] = None):
+        self.tool = tool
+        self.settings = settings or {}
+        self.files: List[Dict] = []
+        self.errors: List[Dict] = []
+        self.started = time.time()
+
+    def add(self, report: Union[FileReport, Dict], path: Optional[str] = None):
+        """Add the report of a processed file, optionally under a different (e.g. relative) path"""
+        entry = report.to_dict() if isinstance(report, FileReport) else dict(report)
+        if path is not None:
+            entry["path"] = path
+        self.files.append(entry)
+
+    def add_error(self, path: str, error: Exception):
+        self.errors.append({"path": path, "error": str(error)})
+
+    def summary(self, slowest: int = 10) -> Dict:
+        timings: Dict[str, float] = {}
+        counters: Dict[str, int] = {}
+        for entry in self.files:
+            for stage, seconds in entry["timings"].items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+            for name, value in entry["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+
+        latencies = sorted(entry["elapsed"] for entry in self.files)
+        slowest_files = sorted(self.files, key=lambda entry: entry["elapsed"], reverse=True)[:slowest]
+        return {
+            "tool": self.tool,
+            "settings": self.settings,
+            "started": self.started,
+            "wall_time": time.time() - self.started,
+            "files": len(self.files),
+            "errors": len(self.errors),
+            "lines": sum(entry["lines"] for entry in self.files),
+            "timings": timings,
+            "counters": counters,
+            "latency": {
+                "p50": percentile(latencies, 0.50),
+                "p90": percentile(latencies, 0.90),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": latencies[-1] if latencies else 0.0,
+            },
+            "slowest": [
+                {"path": entry["path"], "elapsed": entry["elapsed"], "lines": entry["lines"]}
+                for entry in slowest_files
+            ],
+            "failed": self.errors,
+        }
+
+    def write(self, path: str, slowest: int = 10):
+        """Write the report to path, replacing any earlier report"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                for entry in self.files:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.write(json.dumps({"summary": self.summary(slowest)}, ensure_ascii=False) + "\n")
+            else:
+                json.dump({"summary": self.summary(slowest), "files": self.files}, f, ensure_ascii=False, indent=1)
+                f.write("\n")
+        os.replace(temp_path, path)
+
+
+def default_report_path(output_dir: str, tool: str) -> str:
+    """Where the Tk applications keep the report of their last run into output_dir"""
+    return state_path(output_dir, f"{tool}.report.json")
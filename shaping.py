@@ -0,0 +1,205 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, Optional, Tuple
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+from arabic_reshaper.arabic_reshaper import HARAKAT_RE
+from arabic_reshaper.letters import LETTERS_ARABIC, ISOLATED, INITIAL, MEDIAL, FINAL, ZWJ
+from arabic_reshaper.ligatures import LIGATURES
+
+# Per code point flags
+_HARAKA = 1
+_LETTER = 2
+_JOINS_BEFORE = 4
+_JOINS_AFTER = 8
+_JOINS_BOTH = 16
+
+_UNSUPPORTED = -1
+
+_flags: Optional[bytearray] = None
+_forms: Dict[str, Tuple[str, str, str, str]] = {}
+_ligatures_re: Optional[re.Pattern] = None
+_ligature_forms = []
+_fast_path_available: Optional[bool] = None
+# Tables may be built by a warm-up thread while the first file is already being processed
+_tables_lock = threading.Lock()
+
+# Blocks the arabic_pattern of the reshapers matches
+_ARABIC_BLOCKS = ((0x0600, 0x06FF), (0x0750, 0x077F), (0x08A0, 0x08FF), (0xFB50, 0xFDFF), (0xFE70, 0xFEFF))
+
+_rtl_run_re: Optional[re.Pattern] = None
+
+# How many runs display() reordered directly and how many went through get_display
+display_stats = {"fast": 0, "slow": 0}
+
+
+def _supports_configuration(configuration) -> bool:
+    """Return True if the table engine reproduces the library for this configuration"""
+    return (
+        configuration.get('language') == 'Arabic'
+        and configuration.getboolean('delete_harakat')
+        and not configuration.getboolean('delete_tatweel')
+        and not configuration.getboolean('use_unshaped_instead_of_isolated')
+    )
+
+
+def _build_tables():
+    """Build the joining and presentation form tables from the library's letter data"""
+    with _tables_lock:
+        if _flags is None:
+            _build_tables_locked()
+
+
+def _build_tables_locked():
+    global _flags, _ligatures_re, _fast_path_available
+    configuration = arabic_reshaper.default_reshaper.configuration
+    _fast_path_available = _supports_configuration(configuration)
+
+    flags = bytearray(0x110000)
+    for match in HARAKAT_RE.finditer(''.join(map(chr, range(0x10000)))):
+        flags[match.start()] |= _HARAKA
+    for letter, forms in LETTERS_ARABIC.items():
+        code = ord(letter)
+        flags[code] |= _LETTER
+        if forms[FINAL] or forms[MEDIAL]:
+            flags[code] |= _JOINS_BEFORE
+        if forms[INITIAL] or forms[MEDIAL]:
+            flags[code] |= _JOINS_AFTER
+        if forms[MEDIAL]:
+            flags[code] |= _JOINS_BOTH
+        _forms[letter] = forms
+
+    patterns = []
+    if configuration.getboolean('support_ligatures'):
+        for ligature, (pattern, forms) in LIGATURES:
+            if configuration.getboolean(ligature):
+                patterns.append(f'({pattern})')
+                _ligature_forms.append(forms)
+    _ligatures_re = re.compile('|'.join(patterns)) if patterns else None
+    _flags = flags
+
+
+def fast_path_available() -> bool:
+    """Return True if reshape() uses the table engine for the active configuration"""
+    if _flags is None:
+        _build_tables()
+    return _fast_path_available
+
+
+def reshape(text: str) -> str:
+    """Drop-in replacement for arabic_reshaper.reshape backed by precomputed tables.
+
+    Produces the same output as the library's default reshaper. Text containing
+    ZWJ, and configurations the tables don't cover, go to the library instead.
+    """
+    if _flags is None:
+        _build_tables()
+    if not _fast_path_available or ZWJ in text:
+        return arabic_reshaper.reshape(text)
+    if not text:
+        return ''
+
+    flags = _flags
+    letters = []
+    shapes = []
+    for letter in text:
+        letter_flags = flags[ord(letter)]
+        if letter_flags & _HARAKA:
+            continue
+        if not letter_flags & _LETTER:
+            letters.append(letter)
+            shapes.append(_UNSUPPORTED)
+        elif not shapes:
+            letters.append(letter)
+            shapes.append(ISOLATED)
+        else:
+            previous_form = shapes[-1]
+            previous_flags = flags[ord(letters[-1])]
+            letters.append(letter)
+            if (previous_form == _UNSUPPORTED
+                    or not letter_flags & _JOINS_BEFORE
+                    or not previous_flags & _JOINS_AFTER
+                    or (previous_form == FINAL and not previous_flags & _JOINS_BOTH)):
+                shapes.append(ISOLATED)
+            elif previous_form == ISOLATED:
+                shapes[-1] = INITIAL
+                shapes.append(FINAL)
+            else:
+                shapes[-1] = MEDIAL
+                shapes.append(FINAL)
+
+    # Harakat are already gone, so indices into the joined letters match the shapes
+    if _ligatures_re is not None:
+        for match in _ligatures_re.finditer(''.join(letters)):
+            forms = _ligature_forms[next(i for i, group in enumerate(match.groups()) if group)]
+            a, b = match.span()
+            a_form = shapes[a]
+            b_form = shapes[b - 1]
+            if a_form in (ISOLATED, INITIAL):
+                ligature_form = ISOLATED if b_form in (ISOLATED, FINAL) else INITIAL
+            else:
+                ligature_form = FINAL if b_form in (ISOLATED, FINAL) else MEDIAL
+            if not forms[ligature_form]:
+                continue
+            letters[a] = forms[ligature_form]
+            shapes[a] = _UNSUPPORTED
+            for i in range(a + 1, b):
+                letters[i] = ''
+                shapes[i] = _UNSUPPORTED
+
+    forms = _forms
+    return ''.join([
+        letter if shape == _UNSUPPORTED else forms[letter][shape]
+        for letter, shape in zip(letters, shapes)
+    ])
+
+
+def _build_rtl_run_re():
+    """Compile a pattern matching runs made only of strong right-to-left characters"""
+    global _rtl_run_re
+    if _rtl_run_re is not None:
+        return
+    ranges = []
+    for start, end in _ARABIC_BLOCKS:
+        run_start = None
+        for code in range(start, end + 2):
+            strong = code <= end and unicodedata.bidirectional(chr(code)) in ('R', 'AL')
+            if strong and run_start is None:
+                run_start = code
+            elif not strong and run_start is not None:
+                ranges.append(f'\\u{run_start:04X}-\\u{code - 1:04X}')
+                run_start = None
+    _rtl_run_re = re.compile('[' + ''.join(ranges) + ']+')
+
+
+def display(text: str) -> str:
+    """Visual order of a reshaped run, like bidi.algorithm.get_display.
+
+    A run made only of strong right-to-left letters forms a single RTL level,
+    and none of those letters are mirrored, so its display order is the run
+    reversed. Anything else, such as digits, punctuation or Latin text, goes
+    through the full bidirectional algorithm.
+    """
+    if _rtl_run_re is None:
+        _build_rtl_run_re()
+    if _rtl_run_re.fullmatch(text):
+        display_stats["fast"] += 1
+        return text[::-1]
+    display_stats["slow"] += 1
+    return get_display(text)
+
+
+def warm_up():
+    """Do the one-off work of the first reshape ahead of time.
+
+    Builds the shaping tables and the right-to-left run pattern, and lets the
+    library compile its own patterns for the text the tables hand over to it.
+    Safe to call from a background thread.
+    """
+    if _flags is None:
+        _build_tables()
+    if _rtl_run_re is None:
+        _build_rtl_run_re()
+    arabic_reshaper.reshape('\u0644\u0627')
@@ -0,0 +1,61 @@
+import os
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List
+from run_report import timer
+
+# Lines handed to a processing function at a time when streaming a file
+DEFAULT_CHUNK_LINES = 10000
+
+
+def read_chunks(lines: Iterable[str], chunk_lines: int = DEFAULT_CHUNK_LINES, report=None) -> Iterator[List[str]]:
+    """Group an iterable of lines into lists of at most chunk_lines lines.
+    
+    With a FileReport the time spent pulling lines from the iterable is added
+    to its read stage.
+    """
+    iterator = iter(lines)
+    while True:
+        with timer(report, "read"):
+            chunk = list(islice(iterator, chunk_lines))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_lines(infile, outfile, process_chunk: Callable[[List[str]], Iterable[str]],
+                 chunk_lines: int = DEFAULT_CHUNK_LINES, report=None) -> int:
+    """Copy infile to outfile through process_chunk a chunk at a time and return the line count.
+
+    Only one chunk of input and its processed output are held in memory, and
+    each processed chunk is written before the next one is read. With a
+    FileReport, reading and writing are timed as its read and write stages.
+    """
+    line_count = 0
+    for chunk in read_chunks(infile, chunk_lines, report):
+        line_count += len(chunk)
+        processed = process_chunk(chunk)
+        with timer(report, "write"):
+            outfile.writelines(processed)
+    if not line_count:
+        # Writers that put a header such as a BOM before the first write still emit it
+        outfile.writelines([])
+    return line_count
+
+
+@contextmanager
+def replace_on_success(output_path: str) -> Iterator[str]:
+    """Yield a temporary path to write instead of output_path and move it into place on success.
+
+    Streaming writes output while the input is still being read, so writing
+    straight to output_path would destroy the input when both are the same
+    file, and would leave a truncated file behind if processing fails.
+    """
+    temp_path = output_path + ".part"
+    try:
+        yield temp_path
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
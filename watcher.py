@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    # Native change notifications: inotify on Linux, ReadDirectoryChangesW on Windows
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+def snapshot(folder: str, accept: Callable[[str, str], bool]) -> Dict[str, Tuple[int, int]]:
+    """Map every accepted file below folder to its (mtime in ns, size)"""
+    files = {}
+    for root, dirs, names in os.walk(folder):
+        for name in names:
+            if accept(root, name):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Forwards created, modified and moved-in files to a FolderWatcher"""
+    def __init__(self, watcher: "FolderWatcher"):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        # Editors often save to a temporary file and rename it over the original
+        if not event.is_directory:
+            self.watcher.notify(event.dest_path)
+
+
+class FolderWatcher:
+    """Watch a folder for new and modified files and report them in debounced batches.
+
+    Change notifications come from watchdog when it is installed and from
+    polling the folder every poll_interval seconds otherwise. Once a change
+    arrives, further changes are collected until none came in for debounce
+    seconds, so a burst of saves becomes one call of on_change with the
+    sorted paths. on_change runs on the watcher's own thread, one batch at a
+    time, and has to handle its own errors; changes made while it runs are
+    reported in the next batch.
+    """
+    def __init__(self, folder: str, on_change: Callable[[List[str]], None],
+                 accept: Optional[Callable[[str, str], bool]] = None, debounce: float = 0.25,
+                 poll_interval: float = 0.5, polling: bool = False):
+        self.folder = os.path.abspath(folder)
+        self.on_change = on_change
+        self.accept = accept or (lambda root, name: True)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = "polling" if polling or Observer is None else "watchdog"
+        self._pending: Dict[str, float] = {}
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._observer = None
+        self._known: Dict[str, Tuple[int, int]] = {}
+
+    def notify(self, path: str):
+        """Queue a changed file, ignoring files the watcher does not accept"""
+        path = os.path.abspath(path)
+        if not self.accept(os.path.dirname(path), os.path.basename(path)):
+            return
+        with self._condition:
+            self._pending[path] = time.monotonic()
+            self._condition.notify()
+
+    def start(self):
+        if self.backend == "watchdog":
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.folder, recursive=True)
+            self._observer.start()
+        else:
+            # Changes are measured against the folder as it is when watching starts
+            self._known = snapshot(self.folder, self.accept)
+            self._threads.append(threading.Thread(target=self._poll, daemon=True))
+        self._threads.append(threading.Thread(target=self._dispatch, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, wait: bool = True):
+        """Stop watching, after the batch being processed if there is one.
+
+        With wait=False the call returns without waiting for that batch, e.g.
+        on a GUI thread that the batch itself may be waiting for.
+        """
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if wait:
+            current = threading.current_thread()
+            for thread in self._threads:
+                if thread is not current:
+                    thread.join()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads) and not self._stopped.is_set()
+
+    def _poll(self):
+        while not self._stopped.wait(self.poll_interval):
+            current = snapshot(self.folder, self.accept)
+            for path, state in current.items():
+                if self._known.get(path) != state:
+                    self.notify(path)
+            self._known = current
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                # Wait for a change, then until the folder has been quiet for the debounce time
+                while not self._stopped.is_set():
+                    if self._pending:
+                        quiet = time.monotonic() - max(self._pending.values())
+                        if quiet >= self.debounce:
+                            break
+                        self._condition.wait(self.debounce - quiet)
+                    else:
+                        self._condition.wait()
+                if self._stopped.is_set():
+                    return
+                paths = sorted(self._pending)
+                self._pending.clear()
+            self.on_change(paths)